@@ -0,0 +1,89 @@
+"""
+Autocomplete benchmark: trigram index lookups against a LIKE '%x%' scan.
+
+Fills a scratch database with synthetic notes, then times title lookups for
+substrings sampled from existing titles plus a share of queries that match
+nothing (the worst case for a table scan).
+
+Usage::
+
+    python benchmarks/autocomplete.py                  # 1,000,000 notes
+    python benchmarks/autocomplete.py --notes 100000 --queries 500
+"""
+
+import argparse
+import random
+
+from common import percentiles, scratch_database, timed, words
+
+
+def populate(count, seed):
+    from notes.models import Note
+
+    rng = random.Random(seed)
+    vocabulary = words(5000, seed)
+    batch = []
+    titles = []
+    for _ in range(count):
+        title = " ".join(rng.choice(vocabulary)
+                         for _ in range(rng.randint(2, 5)))[:100]
+        batch.append(Note(title=title, content=""))
+        if len(titles) < 10000:
+            titles.append(title)
+        if len(batch) == 10000:
+            Note.objects.bulk_create(batch)
+            batch = []
+    Note.objects.bulk_create(batch)
+    return titles
+
+
+def sample_queries(titles, count, seed):
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.1:
+            queries.append("qqx" + str(rng.randint(0, 999)))
+            continue
+        title = rng.choice(titles)
+        length = rng.randint(3, min(8, len(title)))
+        start = rng.randint(0, len(title) - length)
+        queries.append(title[start:start + length])
+    return queries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--notes", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scan-queries", type=int, default=20,
+                        help="Queries to run through the LIKE baseline.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with scratch_database():
+        from notes import search
+        from notes.models import Note
+
+        print(f"Populating {args.notes:,} notes...")
+        titles, elapsed = timed(populate, args.notes, args.seed)
+        print(f"  done in {elapsed:.1f}s")
+        queries = sample_queries(titles, args.queries, args.seed)
+
+        for query in queries[:10]:
+            search.autocomplete(query)
+
+        samples = [timed(search.autocomplete, query)[1] for query in queries]
+        print(f"trigram index  ({len(samples)} queries): {percentiles(samples)}")
+
+        def scan(query):
+            return list(Note.objects.filter(title__icontains=query)
+                        .values_list("pk", "title")[:10])
+
+        samples = [timed(scan, query)[1]
+                   for query in queries[:args.scan_queries]]
+        print(f"LIKE '%x%' scan ({len(samples)} queries): "
+              f"{percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    main()
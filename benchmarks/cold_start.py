@@ -0,0 +1,158 @@
+"""
+Cold-start benchmark: time from process spawn to the first served request.
+
+Each run starts a fresh interpreter, imports the WSGI or ASGI application and
+pushes one request through it in-process, so the numbers cover interpreter
+start-up, Django setup and the first request, without any network server.
+
+Notes need a signed-in user, so by default the public login page is
+requested. Pass ``--user`` to sign that user in first, in this process, and
+request the note list, or ``--path`` for another page.
+
+Usage::
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --user alice
+    python benchmarks/cold_start.py --runs 20 --user alice --path /index/
+    python benchmarks/cold_start.py --settings sticky_notes.settings_serving
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+WSGI_CHILD = """
+import io, json, sys, time
+started = time.perf_counter()
+from sticky_notes.wsgi import application
+imported = time.perf_counter()
+environ = {
+    "REQUEST_METHOD": "GET", "PATH_INFO": sys.argv[1], "QUERY_STRING": "",
+    "HTTP_COOKIE": sys.argv[2],
+    "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+    "SERVER_PROTOCOL": "HTTP/1.1", "wsgi.url_scheme": "http",
+    "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr,
+}
+statuses = []
+b"".join(application(environ, lambda status, headers, *a: statuses.append(status)))
+served = time.perf_counter()
+print(json.dumps({"status": int(statuses[0].split()[0]),
+                  "import": imported - started, "request": served - imported}))
+"""
+
+ASGI_CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from sticky_notes.asgi import application
+imported = time.perf_counter()
+scope = {
+    "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+    "method": "GET", "scheme": "http", "path": sys.argv[1], "query_string": b"",
+    "headers": [(b"host", b"localhost"), (b"cookie", sys.argv[2].encode())],
+    "server": ("localhost", 80),
+}
+statuses = []
+messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+async def receive():
+    if messages:
+        return messages.pop()
+    # Nothing more to send; Django cancels this once the response is done.
+    await asyncio.Event().wait()
+
+async def send(message):
+    if message["type"] == "http.response.start":
+        statuses.append(message["status"])
+
+asyncio.run(application(scope, receive, send))
+served = time.perf_counter()
+print(json.dumps({"status": statuses[0],
+                  "import": imported - started, "request": served - imported}))
+"""
+
+
+def session_cookie(username, settings):
+    """
+    Signs a user in and returns the Cookie header that carries the session.
+    :param username: The user to sign in.
+    :param settings: DJANGO_SETTINGS_MODULE, or None for the default.
+    """
+    os.environ["DJANGO_SETTINGS_MODULE"] = settings or os.environ.get(
+        "DJANGO_SETTINGS_MODULE", "sticky_notes.settings")
+    sys.path.insert(0, str(BASE_DIR))
+    import django
+    django.setup()
+
+    from django.conf import settings as django_settings
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+
+    client = Client()
+    client.force_login(get_user_model().objects.get_by_natural_key(username))
+    name = django_settings.SESSION_COOKIE_NAME
+    return f"{name}={client.cookies[name].value}"
+
+
+def run_once(child, path, settings, cookie=""):
+    """
+    Spawns one interpreter and waits for it to serve a request.
+    :param cookie: Cookie header sent with the request.
+    :return: Dictionary with the wall-clock total and the child's own timings.
+    """
+    env = dict(os.environ)
+    if settings:
+        env["DJANGO_SETTINGS_MODULE"] = settings
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", child, path, cookie],
+                               cwd=BASE_DIR, env=env, capture_output=True,
+                               text=True, check=True)
+    total = time.perf_counter() - started
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["total"] = total
+    return result
+
+
+def summarise(name, results):
+    def ms(key):
+        values = [result[key] * 1000 for result in results]
+        return (f"{min(values):7.1f} {statistics.median(values):7.1f} "
+                f"{max(values):7.1f}")
+
+    statuses = sorted({result["status"] for result in results})
+    print(f"{name} (status {', '.join(map(str, statuses))})")
+    print(f"  {'':18} {'min':>7} {'median':>7} {'max':>7}  (ms)")
+    print(f"  {'spawn to response':18} {ms('total')}")
+    print(f"  {'app import':18} {ms('import')}")
+    print(f"  {'first request':18} {ms('request')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--path", default=None,
+                        help="Page to request; defaults to the note list with "
+                             "--user and to the login page without.")
+    parser.add_argument("--user", default=None,
+                        help="Username to sign in before the runs.")
+    parser.add_argument("--settings", default=None,
+                        help="DJANGO_SETTINGS_MODULE for the child processes.")
+    args = parser.parse_args(argv)
+
+    cookie = session_cookie(args.user, args.settings) if args.user else ""
+    path = args.path or ("/" if args.user else "/accounts/login/")
+    for name, child in (("sticky_notes.wsgi", WSGI_CHILD),
+                        ("sticky_notes.asgi", ASGI_CHILD)):
+        results = [run_once(child, path, args.settings, cookie)
+                   for _ in range(args.runs)]
+        summarise(name, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Importing this module puts the project on ``sys.path`` and sets Django up, so
+each benchmark can be run directly with ``python benchmarks/<name>.py``.
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sticky_notes.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+
+@contextmanager
+def scratch_database():
+    """
+    Runs the benchmark against a throwaway, fully migrated test database.
+
+    Uses the same machinery as the test runner, so db.sqlite3 is never
+    touched.
+    """
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def words(count, seed=0):
+    """
+    Generates a vocabulary of pronounceable pseudo-words.
+    """
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bcdfghklmnprstvwz" for v in "aeiou"]
+    vocabulary = set()
+    while len(vocabulary) < count:
+        vocabulary.add("".join(rng.choice(syllables)
+                               for _ in range(rng.randint(2, 4))))
+    return sorted(vocabulary)
+
+
+def timed(func, *args, **kwargs):
+    """
+    Calls ``func`` and returns its result with the elapsed time in seconds.
+    """
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def percentiles(samples):
+    """
+    Formats p50/p95/p99/max of a list of durations in seconds as milliseconds.
+    """
+    ordered = sorted(samples)
+    cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+    return (f"p50 {cuts[49] * 1000:7.3f} ms  p95 {cuts[94] * 1000:7.3f} ms  "
+            f"p99 {cuts[98] * 1000:7.3f} ms  max {ordered[-1] * 1000:7.3f} ms")
@@ -0,0 +1,91 @@
+"""
+Time to first byte and peak memory of the buffered and streamed note lists.
+
+Renders every note of one user as one page, first with render() as the note
+list does, then with streaming.stream_list() as ``/all/`` does, and reports
+for each how long the first byte took, how long the whole page took and how
+much memory Python allocated at peak. Streaming should keep the first byte
+and the peak flat as the number of notes grows.
+
+Usage::
+
+    python benchmarks/streaming.py
+    python benchmarks/streaming.py --notes 1000 10000 100000 --chunk-size 500
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from common import scratch_database, words
+
+
+def measure(make_chunks):
+    """
+    Consumes a response body, returning the time to its first chunk, the
+    total time and the peak traced memory in bytes.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    for _ in make_chunks():
+        if first is None:
+            first = time.perf_counter() - started
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--notes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with scratch_database():
+        from django.contrib.auth.models import User
+        from django.shortcuts import render
+        from django.test import RequestFactory
+        from notes import streaming
+        from notes.models import Note
+
+        rng = random.Random(args.seed)
+        vocabulary = words(2000, args.seed)
+        user = User.objects.create_user("bench")
+        request = RequestFactory().get("/all/")
+        request.user = user
+        count = 0
+        for target in args.notes:
+            Note.objects.bulk_create(
+                (Note(user=user, title=" ".join(rng.choice(vocabulary) for _ in range(3)),
+                      content=" ".join(rng.choice(vocabulary) for _ in range(60)))
+                 for _ in range(target - count)),
+                batch_size=1000,
+            )
+            count = target
+            notes = (Note.objects.for_user(user).with_labels()
+                     .defer("content_html").order_by("-created_at"))
+            context = {"page_title": "All Notes"}
+
+            def buffered():
+                page = {**context, "notes": notes.all()}
+                yield render(request, "notes/note_list.html", page).content
+
+            def streamed():
+                response = streaming.stream_list(
+                    request, "notes/note_list.html", context, notes.all(),
+                    "notes/_note_item.html", args.chunk_size)
+                return response.streaming_content
+
+            print(f"{count:,} notes")
+            for name, make_chunks in (("buffered", buffered), ("streamed", streamed)):
+                first, total, peak = measure(make_chunks)
+                print(f"  {name:9} first byte {first * 1000:9.2f} ms  "
+                      f"total {total * 1000:9.2f} ms  peak {peak / 2 ** 20:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
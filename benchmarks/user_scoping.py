@@ -0,0 +1,111 @@
+"""
+Per-user query latency as the number of users grows.
+
+Adds users in tiers, each with the same number of notes, and after every
+tier times the queries the views run for a random user: the note list, a note
+detail lookup and title autocomplete. With queries scoped to the owner and
+the (user, created_at) index, the numbers should stay flat while the table
+grows.
+
+Then adds one heavy user with thousands of notes, none of them matching a
+word that other users' titles are full of, and times that user's
+autocomplete of the word: it should cost no more than for anyone else.
+
+Usage::
+
+    python benchmarks/user_scoping.py
+    python benchmarks/user_scoping.py --tiers 100 1000 10000 --notes-per-user 20
+    python benchmarks/user_scoping.py --heavy-notes 6000 --heavy-matches 100000
+"""
+
+import argparse
+import random
+
+from common import percentiles, scratch_database, timed, words
+
+
+def add_users(start, stop, notes_per_user, vocabulary, rng):
+    from django.contrib.auth.models import User
+    from notes.models import Note
+
+    users = User.objects.bulk_create(
+        User(username=f"user{i}") for i in range(start, stop)
+    )
+    notes = []
+    for user in users:
+        for _ in range(notes_per_user):
+            title = " ".join(rng.choice(vocabulary) for _ in range(3))
+            notes.append(Note(user=user, title=title, content=title))
+        if len(notes) >= 10000:
+            Note.objects.bulk_create(notes)
+            notes = []
+    Note.objects.bulk_create(notes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--tiers", type=int, nargs="+",
+                        default=[100, 1000, 10000, 50000])
+    parser.add_argument("--notes-per-user", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--heavy-notes", type=int, default=6000,
+                        help="Notes of the heavy user.")
+    parser.add_argument("--heavy-matches", type=int, default=100000,
+                        help="Other users' notes matching the heavy user's query.")
+    args = parser.parse_args(argv)
+
+    with scratch_database() as connection:
+        from django.contrib.auth.models import User
+        from notes import search
+        from notes.models import Note
+
+        rng = random.Random(args.seed)
+        vocabulary = words(2000, args.seed)
+        users = 0
+        for tier in args.tiers:
+            add_users(users, tier, args.notes_per_user, vocabulary, rng)
+            users = tier
+            user_ids = list(User.objects.values_list("pk", flat=True))
+            print(f"{users:,} users, {Note.objects.count():,} notes")
+
+            lists, details, completions = [], [], []
+            for _ in range(args.samples):
+                user = User(pk=rng.choice(user_ids))
+                notes = Note.objects.for_user(user)
+                page, elapsed = timed(
+                    lambda: list(notes.order_by("-created_at")[:50]))
+                lists.append(elapsed)
+                details.append(timed(notes.get, pk=page[0].pk)[1])
+                query = rng.choice(vocabulary)[:4]
+                completions.append(
+                    timed(search.autocomplete, query, user=user)[1])
+            print(f"  note list     {percentiles(lists)}")
+            print(f"  note detail   {percentiles(details)}")
+            print(f"  autocomplete  {percentiles(completions)}")
+
+        heavy = User.objects.create(username="heavy")
+        Note.objects.bulk_create(
+            Note(user=heavy, title=" ".join(rng.choice(vocabulary) for _ in range(3)), content="")
+            for _ in range(args.heavy_notes))
+        Note.objects.bulk_create(
+            Note(user=User(pk=rng.choice(user_ids)), title=f"shopping {rng.choice(vocabulary)}", content="")
+            for _ in range(args.heavy_matches))
+        print(f"Heavy user: {args.heavy_notes:,} notes; "
+              f"{args.heavy_matches:,} other notes titled 'shopping ...'")
+        heavy_completions = [
+            timed(search.autocomplete, "shopping", user=heavy)[1]
+            for _ in range(args.samples)
+        ]
+        print(f"  autocomplete  {percentiles(heavy_completions)}")
+
+        sql, params = (Note.objects.for_user(User(pk=1))
+                       .order_by("-created_at")[:50].query.sql_with_params())
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " / ".join(row[-1] for row in cursor.fetchall())
+        print(f"Note list plan: {plan}")
+
+
+if __name__ == "__main__":
+    main()
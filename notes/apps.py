@@ -1,6 +1,85 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate
+
+
+def ensure_triggers(sender, using, **kwargs):
+    """
+    Reinstalls the trigram index and tag counter triggers after migrations.
+
+    :param sender: The app config that was migrated.
+    :param using: Alias of the database that was migrated.
+    """
+    from .counters import install_tag_counters
+    from .search import install_trigram_index
+
+    install_trigram_index(connections[using])
+    install_tag_counters(connections[using])
+
+
+def delete_sharded_notes(sender, instance, using, **kwargs):
+    """
+    Deletes a deleted user's notes from every shard.
+
+    Notes on shards are out of reach of the cascade Django runs in the
+    default database, so they are deleted here instead.
+
+    :param sender: The user model.
+    :param instance: The deleted user.
+    :param using: Alias of the database the user was deleted from.
+    """
+    from .models import Note
+    from .sharding import shards_for_user
+
+    for alias in shards_for_user(instance):
+        Note.objects.using(alias).filter(user_id=instance.pk).delete()
+
+
+def delete_archived_notes(sender, instance, using, **kwargs):
+    """
+    Deletes a deleted user's archived notes.
+
+    :param sender: The user model.
+    :param instance: The deleted user.
+    :param using: Alias of the database the user was deleted from.
+    """
+    from .models import ArchivedNote
+
+    ArchivedNote.objects.filter(user_id=instance.pk).delete()
 
 
 class NotesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "notes"
+
+    def ready(self):
+        """
+        Connects the notes signal handlers and optionally warms caches.
+
+        Deleting a user also deletes their archived notes and, with sharding
+        on, their notes on the shards. Every database connection gets its
+        queries timed for the metrics.
+
+        Cache warming is enabled with NOTES_WARM_ON_STARTUP; the warm-up runs
+        on a background thread so worker boot is not delayed by it.
+        """
+        post_migrate.connect(ensure_triggers, sender=self)
+
+        from .metrics import instrument_connection
+
+        connection_created.connect(instrument_connection)
+        post_delete.connect(delete_archived_notes,
+                            sender=settings.AUTH_USER_MODEL)
+
+        from .sharding import enabled
+
+        if enabled():
+            post_delete.connect(delete_sharded_notes,
+                                sender=settings.AUTH_USER_MODEL)
+
+        if getattr(settings, "NOTES_WARM_ON_STARTUP", False):
+            from .warmup import warm_in_background
+
+            warm_in_background()
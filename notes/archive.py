@@ -0,0 +1,158 @@
+"""
+Hot/cold archival of notes.
+
+Notes that have not been modified for a while are moved by
+``manage.py archive_notes`` from the notes table into ArchivedNote, a
+narrow table with no trigram index, similarity buckets or tag rows. The
+notes table and its indexes then only hold the working set, which keeps them
+small enough to stay in SQLite's page cache.
+
+Archived notes stay in the default database unless NOTES_ARCHIVE_FILE is
+set, in which case ArchiveRouter keeps them in that SQLite file instead.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+
+from . import minhash, sync
+from .models import ArchivedNote, Category, MinHashBucket, Note, NoteTag, Tag
+
+ARCHIVE_ALIAS = "notes_archive"
+
+
+def archive_db():
+    """
+    Returns the alias of the database holding archived notes.
+    """
+    return ARCHIVE_ALIAS if ARCHIVE_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def stale_batches(source, cutoff, batch_size):
+    """
+    Yields the notes on ``source`` last modified before ``cutoff``, in
+    batches.
+
+    The table is walked once by keyset pagination on the primary key, so
+    archived batches can be deleted while the walk goes on.
+    """
+    last = None
+    while True:
+        notes = Note.objects.using(source).order_by("pk")
+        if last is not None:
+            notes = notes.filter(pk__gt=last)
+        batch = list(notes[:batch_size].values_list("pk", "modified_at"))
+        if not batch:
+            return
+        last = batch[-1][0]
+        stale = [pk for pk, modified_at in batch if modified_at < cutoff]
+        if stale:
+            yield list(Note.objects.using(source).filter(pk__in=stale))
+
+
+def archive(notes, source, cutoff):
+    """
+    Moves a batch of notes from ``source`` into the archive.
+
+    The archive copy is committed before the notes are deleted. Notes that
+    were modified after they were read are left in place and their archive
+    copies dropped again, so a note being edited is never archived. Notes
+    with attachments are left in place too, as the archive has no room for
+    them. Archived notes get tombstones, so offline clients drop them.
+    :param notes: Notes loaded from ``source``.
+    :param source: Alias of the database the notes are on.
+    :param cutoff: Only notes last modified before this are moved.
+    :return: Number of notes archived.
+    """
+    target = archive_db()
+    pks = [note.pk for note in notes]
+    tag_names = defaultdict(list)
+    for note_id, name in (NoteTag.objects.using(source)
+                          .filter(note_id__in=pks)
+                          .values_list("note_id", "tag__name")):
+        tag_names[note_id].append(name)
+
+    # The target transaction is entered last so it commits first.
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        archived = ArchivedNote.objects.using(target)
+        archived.filter(pk__in=pks).delete()
+        archived.bulk_create(
+            ArchivedNote(
+                id=note.pk, user_id=note.user_id, title=note.title,
+                content=note.content, category_id=note.category_id,
+                tag_names=", ".join(sorted(tag_names[note.pk])),
+                minhash=note.minhash, created_at=note.created_at,
+                modified_at=note.modified_at,
+            )
+            for note in notes
+        )
+        hot = Note.objects.using(source)
+        hot.filter(pk__in=pks, modified_at__lt=cutoff,
+                   attachments__isnull=True).delete()
+        kept = list(hot.filter(pk__in=pks).values_list("pk", flat=True))
+        archived.filter(pk__in=kept).delete()
+    sync.forget((note.pk, note.user_id) for note in notes if note.pk not in kept)
+    return len(pks) - len(kept)
+
+
+def restore(archived):
+    """
+    Moves an archived note back into the notes table.
+
+    The note keeps its id and timestamps; its tags and similarity buckets are
+    rebuilt from the archived copy.
+    :param archived: The archived note.
+    :return: The restored note.
+    """
+    category_id = archived.category_id
+    if category_id is not None and not Category.objects.filter(pk=category_id).exists():
+        category_id = None
+    note = Note(
+        pk=archived.pk, user_id=archived.user_id, title=archived.title,
+        content=archived.content, category_id=category_id,
+        minhash=archived.minhash,
+    )
+    db = router.db_for_write(Note, instance=note)
+    with transaction.atomic(using=db):
+        Note.objects.using(db).bulk_create([note])
+        Note.objects.using(db).filter(pk=note.pk).update(
+            created_at=archived.created_at, modified_at=archived.modified_at)
+        note.created_at = archived.created_at
+        note.modified_at = archived.modified_at
+        note._loaded_content = note.content
+        MinHashBucket.replace_for(note, minhash.from_bytes(note.minhash))
+        note.tags.set(Tag.for_names(archived.tag_list(), using=db))
+    archived.delete()
+    return note
+
+
+class ArchiveRouter:
+    """
+    Database router keeping archived notes in the archive database.
+
+    Only installed when NOTES_ARCHIVE_FILE is set; it must come before
+    ShardRouter in DATABASE_ROUTERS.
+    """
+
+    def _is_archive(self, model):
+        opts = model._meta
+        return opts.app_label == "notes" and opts.model_name == "archivednote"
+
+    def db_for_read(self, model, **hints):
+        return ARCHIVE_ALIAS if self._is_archive(model) else None
+
+    def db_for_write(self, model, **hints):
+        return ARCHIVE_ALIAS if self._is_archive(model) else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_archive(obj1) or self._is_archive(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == ARCHIVE_ALIAS:
+            return app_label == "notes" and model_name == "archivednote"
+        if app_label == "notes" and model_name == "archivednote":
+            return False
+        return None
@@ -0,0 +1,242 @@
+"""
+Content-addressed storage of note attachments.
+
+Each distinct file is stored once under NOTES_ATTACHMENT_ROOT, named by the
+hex SHA-256 of its content and fanned out over two levels of directories
+(``ab/cd/abcd...``). Attachment rows only record the digest, so uploading a
+file that is already stored costs no disk space, and files never change once
+written, which makes the digest a strong ETag for downloads.
+
+Uploads go through HashingUploadHandler, which streams the request body to a
+temporary file in chunks while hashing it, so no upload is ever held in
+memory. store() then moves the temporary file into place.
+
+Downloads are served by serve(), with FileResponse so servers that support
+``wsgi.file_wrapper`` can send the file without copying it through Python,
+and with single-range ``Range`` requests and conditional headers.
+
+This module does not touch the database; ``manage.py prune_attachments``
+removes stored files that no attachment refers to any more.
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+
+# Bytes read per chunk when streaming a file through Python.
+BLOCK_SIZE = 64 * 1024
+
+# Types shown in the browser; everything else is downloaded, so an uploaded
+# HTML or SVG file can never run in the site's origin.
+INLINE_CONTENT_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp",
+                        "text/plain", "application/pdf"}
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def root():
+    """
+    Returns the directory attachments are stored in.
+    """
+    return Path(getattr(settings, "NOTES_ATTACHMENT_ROOT",
+                        Path(settings.MEDIA_ROOT) / "attachments"))
+
+
+def max_size():
+    return getattr(settings, "NOTES_ATTACHMENT_MAX_SIZE", DEFAULT_MAX_SIZE)
+
+
+def blob_path(sha256):
+    """
+    Returns the path a file with the given digest is stored at.
+    :param sha256: Hex SHA-256 digest of the content.
+    :return: pathlib.Path.
+    """
+    return root() / sha256[:2] / sha256[2:4] / sha256
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler writing files to disk in chunks while hashing them.
+
+    The uploaded file gets a ``sha256`` attribute with the hex digest of its
+    content. Files larger than NOTES_ATTACHMENT_MAX_SIZE are dropped, which
+    is recorded in ``too_large``.
+
+    Upload handlers must be installed before the request body is read, which
+    CSRF checking does, so views using it are csrf_exempt and check the token
+    themselves once the handler is in place.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > max_size():
+            self.too_large = True
+            raise SkipFile()
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        return file
+
+
+def store(uploaded):
+    """
+    Moves an uploaded file into the store, unless its content is already
+    there.
+
+    The file is first moved next to its final path under a unique name and
+    then renamed over it, so readers never see a partly written file.
+
+    Content already stored has its modification time refreshed instead, so
+    ``prune_attachments``, which leaves recently modified files alone, does
+    not delete it before the new attachment row is committed.
+    :param uploaded: File received through HashingUploadHandler.
+    :return: True if the file was stored, False if the content already was.
+    """
+    target = blob_path(uploaded.sha256)
+    try:
+        os.utime(target)
+    except FileNotFoundError:
+        pass
+    else:
+        uploaded.close()
+        return False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+    file_move_safe(uploaded.temporary_file_path(), staging)
+    uploaded.close()
+    os.replace(staging, target)
+    return True
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range ``Range`` header.
+    :param header: Value of the header.
+    :param size: Size of the file.
+    :return: (first, last) byte positions, inclusive; None if the header is
+        not a single byte range, which means the whole file is sent.
+    :raises ValueError: If the range lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range: the last ``last`` bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range.")
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last or first >= size:
+        raise ValueError("Range not satisfiable.")
+    return first, last
+
+
+class FileRange:
+    """
+    File-like view of a byte range of an open file.
+
+    It has no fileno(), so servers fall back to reading it rather than
+    sending the whole file with sendfile().
+    """
+
+    def __init__(self, file, first, last):
+        self.file = file
+        self.file.seek(first)
+        self.remaining = last - first + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def serve(request, attachment):
+    """
+    Returns the response downloading an attachment.
+
+    Handles ``If-None-Match``/``If-Modified-Since`` (304), ``If-Match``/
+    ``If-Unmodified-Since`` (412) and single byte ``Range`` requests (206,
+    or 416 outside the file), honouring ``If-Range``. The file is streamed
+    from disk, never read into memory.
+    :param request: HTTP request object.
+    :param attachment: The Attachment to send.
+    :return: HTTP response.
+    """
+    etag = quote_etag(attachment.sha256)
+    last_modified = int(attachment.created_at.timestamp())
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, attachment, etag)
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    response.headers["Accept-Ranges"] = "bytes"
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _file_response(request, attachment, etag):
+    size = attachment.size
+    byte_range = None
+    header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if header and request.method == "GET" and if_range in (None, etag):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+
+    try:
+        file = open(attachment.path(), "rb")
+    except FileNotFoundError:
+        raise Http404("The attached file is missing.")
+    inline = attachment.content_type in INLINE_CONTENT_TYPES
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=not inline,
+                                filename=attachment.name,
+                                content_type=attachment.content_type)
+    else:
+        first, last = byte_range
+        response = FileResponse(FileRange(file, first, last),
+                                as_attachment=not inline,
+                                filename=attachment.name,
+                                content_type=attachment.content_type,
+                                status=206)
+        response.headers["Content-Length"] = last - first + 1
+        response.headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    response.block_size = BLOCK_SIZE
+    return response
@@ -0,0 +1,245 @@
+"""
+Write-coalescing autosave of notes being edited.
+
+An open editor posts its title and content every few seconds. Writing each
+of those to the notes table would make every editor a steady stream of
+SQLite write transactions, so autosaves are only buffered: the latest draft
+of each note is kept in memory, replacing any earlier draft not yet written,
+and a background thread writes all pending drafts every
+NOTES_AUTOSAVE_INTERVAL seconds, one transaction per database. However
+often an editor saves, each note is written at most once per interval.
+
+Drafts are also copied to the cache, so the edit page can offer one back if
+it has not been written yet - because the flush is still to come, failed,
+or the process holding it died.
+
+This module keeps counters of drafts received and rows written, so the
+writes saved by coalescing can be watched; see DraftBuffer.stats().
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import metrics, minhash, rendering
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_DRAFT_TTL = 24 * 60 * 60
+
+CACHE_PREFIX = "notes:draft:"
+
+Draft = namedtuple("Draft", "pk user_id db title content saved_at")
+
+
+def interval():
+    return getattr(settings, "NOTES_AUTOSAVE_INTERVAL", DEFAULT_INTERVAL)
+
+
+def cache_key(pk):
+    return f"{CACHE_PREFIX}{pk}"
+
+
+def write(drafts, using):
+    """
+    Writes drafts to their notes in one transaction.
+
+    Signatures, similarity buckets and rendered HTML are refreshed for the
+    notes whose content changed, and modified_at is set to the time of the
+    draft. Drafts of notes deleted since, or saved through the edit form
+    after the draft was taken, are dropped.
+    :param drafts: Drafts of notes on the ``using`` database.
+    :param using: Database alias.
+    :return: Number of notes written.
+    """
+    from .models import MinHashBucket, Note
+
+    with transaction.atomic(using=using):
+        notes = Note.objects.using(using).in_bulk([draft.pk for draft in drafts])
+        changed, signatures = [], {}
+        for draft in drafts:
+            note = notes.get(draft.pk)
+            if note is None or note.modified_at > draft.saved_at:
+                continue
+            note.title = draft.title
+            if note.content != draft.content:
+                note.content = draft.content
+                signature = minhash.signature(note.content)
+                signatures[note.pk] = signature
+                note.minhash = minhash.to_bytes(signature)
+                note.content_html = rendering.render(note.content)
+                note.content_html_hash = rendering.content_hash(note.content)
+            note.modified_at = draft.saved_at
+            changed.append(note)
+        Note.objects.using(using).bulk_update(changed, [
+            "title", "content", "minhash", "content_html", "content_html_hash",
+            "modified_at",
+        ])
+        buckets = MinHashBucket.objects.using(using)
+        buckets.filter(note_id__in=signatures).delete()
+        buckets.bulk_create(
+            MinHashBucket(note_id=pk, band=band, bucket=bucket)
+            for pk, signature in signatures.items()
+            for band, bucket in minhash.bands(signature)
+        )
+    return len(changed)
+
+
+class DraftBuffer:
+    """
+    Buffer of the latest unsaved draft of each note, flushed in batches.
+
+    The buffer is per process; drafts are flushed by a daemon thread
+    started with the first draft, and once more when the process exits.
+    With NOTES_AUTOSAVE_INTERVAL set to 0 no thread is started and flush()
+    has to be called directly.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.counters = dict.fromkeys(
+            ["received", "coalesced", "written", "dropped", "flushes",
+             "failures"], 0)
+        self.flush_seconds = 0.0
+
+    def save(self, note, title, content):
+        """
+        Buffers a draft of a note, replacing any draft not yet written.
+        :param note: The note, loaded from its database.
+        :param title: The title being edited.
+        :param content: The content being edited.
+        :return: The buffered draft.
+        """
+        draft = Draft(note.pk, note.user_id, note._state.db, title, content,
+                      timezone.now())
+        with self.lock:
+            self.counters["received"] += 1
+            coalesced = note.pk in self.pending
+            if coalesced:
+                self.counters["coalesced"] += 1
+            self.pending[note.pk] = draft
+        metrics.autosave_drafts.inc(outcome="received")
+        if coalesced:
+            metrics.autosave_drafts.inc(outcome="coalesced")
+        cache.set(cache_key(note.pk), draft,
+                  getattr(settings, "NOTES_AUTOSAVE_DRAFT_TTL", DEFAULT_DRAFT_TTL))
+        self.start()
+        return draft
+
+    def discard(self, pk):
+        """
+        Drops the draft of a note, once the note is saved through the form or
+        deleted.
+        """
+        with self.lock:
+            self.pending.pop(pk, None)
+        cache.delete(cache_key(pk))
+
+    def recover(self, note):
+        """
+        Returns the draft of a note that is newer than the note as stored.
+        :param note: The note being edited.
+        :return: The Draft, or None.
+        """
+        with self.lock:
+            draft = self.pending.get(note.pk)
+        if draft is None:
+            draft = cache.get(cache_key(note.pk))
+            metrics.cache_requests.inc(cache="drafts",
+                                       result="miss" if draft is None else "hit")
+        if draft is None or draft.user_id != note.user_id:
+            return None
+        if draft.saved_at <= note.modified_at:
+            return None
+        return draft
+
+    def flush(self):
+        """
+        Writes every pending draft, one transaction per database.
+
+        Drafts are taken out of the buffer first, so editors never wait for
+        a flush. If writing fails the drafts go back into the buffer, unless
+        a newer one arrived meanwhile, and are retried by the next flush.
+        :return: Number of notes written.
+        """
+        with self.lock:
+            drafts, self.pending = self.pending, {}
+        if not drafts:
+            return 0
+        started = time.perf_counter()
+        by_db = defaultdict(list)
+        for draft in drafts.values():
+            by_db[draft.db].append(draft)
+        written = 0
+        for using, batch in by_db.items():
+            try:
+                written += write(batch, using)
+            except DatabaseError:
+                logger.exception("Writing %d drafts to %s failed", len(batch), using)
+                with self.lock:
+                    self.counters["failures"] += 1
+                    for draft in batch:
+                        self.pending.setdefault(draft.pk, draft)
+                        del drafts[draft.pk]
+        # Drop the cached copies that were just written, leaving newer ones.
+        cached = cache.get_many([cache_key(pk) for pk in drafts])
+        cache.delete_many([key for key, draft in cached.items()
+                           if draft == drafts[draft.pk]])
+        with self.lock:
+            self.counters["written"] += written
+            self.counters["dropped"] += len(drafts) - written
+            self.counters["flushes"] += 1
+            self.flush_seconds += time.perf_counter() - started
+        metrics.autosave_drafts.inc(written, outcome="written")
+        metrics.autosave_drafts.inc(len(drafts) - written, outcome="dropped")
+        return written
+
+    def start(self):
+        """
+        Starts the flushing thread, unless it runs already or flushing is
+        left to the caller.
+        """
+        if self.thread is not None or not interval():
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, daemon=True,
+                                           name="notes-autosave")
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(interval() or DEFAULT_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Autosave flush failed")
+
+    def stats(self):
+        """
+        Returns the counters of this process.
+
+        ``writes_avoided`` is the number of drafts that never reached the
+        database because a newer draft of the same note replaced them.
+        :return: Dictionary of counters.
+        """
+        with self.lock:
+            stats = dict(self.counters, pending=len(self.pending),
+                         flush_seconds=round(self.flush_seconds, 6))
+        stats["writes_avoided"] = stats["coalesced"]
+        return stats
+
+
+drafts = DraftBuffer()
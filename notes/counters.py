@@ -0,0 +1,153 @@
+from django.db import connection
+
+JOIN_TABLE = "notes_notetag"
+
+# Tag.note_count is kept in step with notes_notetag by triggers, so every way
+# of changing tag assignments - tags.add()/remove()/set(), deleting a note or
+# a tag through the ORM, bulk queryset deletes, cascades from deleting a user
+# - adjusts the counter in the same statement and therefore the same
+# transaction. Each trigger touches a single tag row by primary key.
+_TRIGGERS = {
+    f"{JOIN_TABLE}_count_ai": (
+        f"AFTER INSERT ON {JOIN_TABLE} BEGIN "
+        f"UPDATE notes_tag SET note_count = note_count + 1 "
+        f"WHERE id = new.tag_id; END"
+    ),
+    f"{JOIN_TABLE}_count_ad": (
+        f"AFTER DELETE ON {JOIN_TABLE} BEGIN "
+        f"UPDATE notes_tag SET note_count = note_count - 1 "
+        f"WHERE id = old.tag_id; END"
+    ),
+    f"{JOIN_TABLE}_count_au": (
+        f"AFTER UPDATE OF tag_id ON {JOIN_TABLE} BEGIN "
+        f"UPDATE notes_tag SET note_count = note_count - 1 "
+        f"WHERE id = old.tag_id; "
+        f"UPDATE notes_tag SET note_count = note_count + 1 "
+        f"WHERE id = new.tag_id; END"
+    ),
+}
+
+# UserTagCount rows count the tags of each owner's notes the same way. The
+# owner is read from the note, which Django deletes after its tag rows; a
+# note changing owners moves its tags from one count to the other.
+USER_TABLE = "notes_usertagcount"
+
+_ADD_USER_COUNT = (
+    f"INSERT INTO {USER_TABLE} (user_id, tag_id, note_count) "
+    f"SELECT user_id, {{tag}}, 1 FROM notes_note "
+    f"WHERE id = {{note}} AND user_id IS NOT NULL "
+    f"ON CONFLICT (user_id, tag_id) DO UPDATE SET note_count = note_count + 1;"
+)
+_REMOVE_USER_COUNT = (
+    f"UPDATE {USER_TABLE} SET note_count = note_count - 1 "
+    f"WHERE tag_id = {{tag}} AND user_id = "
+    f"(SELECT user_id FROM notes_note WHERE id = {{note}});"
+)
+
+_USER_TRIGGERS = {
+    f"{JOIN_TABLE}_user_count_ai": (
+        f"AFTER INSERT ON {JOIN_TABLE} BEGIN "
+        f"{_ADD_USER_COUNT.format(tag='new.tag_id', note='new.note_id')} END"
+    ),
+    f"{JOIN_TABLE}_user_count_ad": (
+        f"AFTER DELETE ON {JOIN_TABLE} BEGIN "
+        f"{_REMOVE_USER_COUNT.format(tag='old.tag_id', note='old.note_id')} END"
+    ),
+    f"{JOIN_TABLE}_user_count_au": (
+        f"AFTER UPDATE OF tag_id, note_id ON {JOIN_TABLE} BEGIN "
+        f"{_REMOVE_USER_COUNT.format(tag='old.tag_id', note='old.note_id')} "
+        f"{_ADD_USER_COUNT.format(tag='new.tag_id', note='new.note_id')} END"
+    ),
+    "notes_note_user_count_au": (
+        f"AFTER UPDATE OF user_id ON notes_note "
+        f"WHEN old.user_id IS NOT new.user_id BEGIN "
+        f"UPDATE {USER_TABLE} SET note_count = note_count - 1 "
+        f"WHERE user_id = old.user_id AND tag_id IN "
+        f"(SELECT tag_id FROM {JOIN_TABLE} WHERE note_id = old.id); "
+        f"INSERT INTO {USER_TABLE} (user_id, tag_id, note_count) "
+        f"SELECT new.user_id, tag_id, 1 FROM {JOIN_TABLE} "
+        f"WHERE note_id = new.id AND new.user_id IS NOT NULL "
+        f"ON CONFLICT (user_id, tag_id) DO UPDATE SET note_count = note_count + 1; "
+        f"END"
+    ),
+}
+
+_RECOUNT_SQL = (
+    f"UPDATE notes_tag SET note_count = "
+    f"(SELECT COUNT(*) FROM {JOIN_TABLE} WHERE tag_id = notes_tag.id)"
+)
+_RECOUNT_USERS_SQL = [
+    f"DELETE FROM {USER_TABLE}",
+    f"INSERT INTO {USER_TABLE} (user_id, tag_id, note_count) "
+    f"SELECT notes_note.user_id, {JOIN_TABLE}.tag_id, COUNT(*) "
+    f"FROM {JOIN_TABLE} JOIN notes_note ON notes_note.id = {JOIN_TABLE}.note_id "
+    f"WHERE notes_note.user_id IS NOT NULL "
+    f"GROUP BY notes_note.user_id, {JOIN_TABLE}.tag_id",
+]
+
+
+def recount_tags(using=None):
+    """
+    Recomputes every tag's note count, overall and per user, from the join
+    table.
+
+    Safe to run at any time; the triggers only ever apply deltas, so this is
+    how counts are brought back in line after the triggers were missing.
+    :param using: Database connection; defaults to the default connection.
+    """
+    conn = using or connection
+    with conn.cursor() as cursor:
+        cursor.execute(_RECOUNT_SQL)
+        if USER_TABLE in conn.introspection.table_names(cursor):
+            for sql in _RECOUNT_USERS_SQL:
+                cursor.execute(sql)
+
+
+def install_tag_counters(using=None):
+    """
+    Creates the tag counter triggers if they are missing.
+
+    Like the trigram index triggers, these are dropped whenever a SQLite
+    migration rebuilds the join table, so this runs after every migrate.
+    When a trigger had to be recreated every count is recomputed.
+    :param using: Database connection; defaults to the default connection.
+    :return: True if the triggers were (re)installed, False otherwise.
+    """
+    conn = using or connection
+    if conn.vendor != "sqlite":
+        return False
+    tables = conn.introspection.table_names()
+    if JOIN_TABLE not in tables:
+        return False
+    # Migrations older than the per-user counts install the others alone.
+    triggers = dict(_TRIGGERS)
+    if USER_TABLE in tables:
+        triggers.update(_USER_TRIGGERS)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name IN (%s, %s)", [JOIN_TABLE, "notes_note"]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in triggers if name not in existing]
+        if not missing:
+            return False
+        for name in missing:
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {name} {triggers[name]}"
+            )
+    recount_tags(conn)
+    return True
+
+
+def uninstall_tag_counters(using=None):
+    """
+    Drops the tag counter triggers.
+    :param using: Database connection; defaults to the default connection.
+    """
+    conn = using or connection
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for name in {**_TRIGGERS, **_USER_TRIGGERS}:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Note
+from .models import Note, Tag
 
 
 class NoteForm(forms.ModelForm):
@@ -9,6 +9,8 @@ class NoteForm(forms.ModelForm):
     Fields:
     - title: CharField for the note title
     - content: Textfield for the note content
+    - category: Optional choice of category
+    - tags: Comma-separated tag names; tags that do not exist yet are created
 
     Meta class:
     - Defines the model to use (Note) and the fields to include in the form.
@@ -16,6 +18,48 @@ class NoteForm(forms.ModelForm):
     :param forms.ModelForm: Django's ModelForm class
     """
 
+    tags = forms.CharField(required=False, help_text="Separate tags with commas.")
+
+    class Meta:
+        model = Note
+        fields = ["title", "content", "category"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and not self.is_bound and "tags" not in self.initial:
+            self.initial["tags"] = ", ".join(
+                sorted(tag.name for tag in self.instance.tags.all())
+            )
+
+    def clean_tags(self):
+        """
+        Splits the tags field into a list of names.
+        :return: List of tag names, without blanks.
+        """
+        names = self.cleaned_data["tags"].split(",")
+        return [name.strip() for name in names if name.strip()]
+
+    def _save_m2m(self):
+        """
+        Saves the note's tags along with the other many-to-many data.
+
+        With ``commit=False`` this runs when the view calls ``save_m2m()``
+        after saving the note.
+        """
+        super()._save_m2m()
+        tags = Tag.for_names(self.cleaned_data["tags"],
+                             using=self.instance._state.db)
+        self.instance.tags.set(tags)
+
+
+class DraftForm(forms.ModelForm):
+    """
+    Form validating the title and content posted by the editor's autosave.
+
+    Meta class:
+    - Defines the model to use (Note) and the fields that are autosaved.
+    """
+
     class Meta:
         model = Note
         fields = ["title", "content"]
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from notes import archive, sharding
+
+
+class Command(BaseCommand):
+    """
+    Management command that moves notes not modified for a number of days
+    into the archive.
+
+    Usage:
+        python manage.py archive_notes
+        python manage.py archive_notes --days 180 --batch-size 500 --vacuum
+    """
+    help = "Move notes that have not been modified recently into the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int,
+                            default=getattr(settings, "NOTES_ARCHIVE_AFTER_DAYS", 365),
+                            help="Archive notes not modified for this many days.")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Notes moved per transaction.")
+        parser.add_argument("--vacuum", action="store_true",
+                            help="Rebuild the notes databases afterwards to "
+                                 "return the freed pages.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        total = 0
+        for source in [DEFAULT_DB_ALIAS, *sharding.shard_aliases()]:
+            moved = 0
+            for notes in archive.stale_batches(source, cutoff,
+                                               options["batch_size"]):
+                moved += archive.archive(notes, source, cutoff)
+            self.stdout.write(f"{source}: archived {moved} notes")
+            total += moved
+            if options["vacuum"] and moved:
+                with connections[source].cursor() as cursor:
+                    cursor.execute("VACUUM")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total} notes not modified since {cutoff:%Y-%m-%d}"
+        ))
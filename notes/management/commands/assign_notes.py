@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from notes import archive, sharding
+from notes.models import ArchivedNote, Note
+
+
+class Command(BaseCommand):
+    """
+    Management command that gives the notes without an owner to a user.
+
+    Notes written before notes belonged to users have no owner after
+    migrating, and no one but the admin can see them. Run this once after
+    ``migrate`` to hand them, archived ones included, to an account. With
+    sharding by user, run ``rebalance_shards`` afterwards to move them to
+    the owner's shard.
+
+    Usage:
+        python manage.py assign_notes alice
+        python manage.py assign_notes alice --dry-run
+    """
+    help = "Give the notes that have no owner to a user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User who gets the notes.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report how many notes would be assigned.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get_by_natural_key(options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+
+        querysets = [Note.objects.using(alias).filter(user__isnull=True)
+                     for alias in [DEFAULT_DB_ALIAS, *sharding.shard_aliases()]]
+        querysets.append(ArchivedNote.objects.using(archive.archive_db())
+                         .filter(user__isnull=True))
+        if options["dry_run"]:
+            total = sum(queryset.count() for queryset in querysets)
+        else:
+            # update() leaves modified_at alone, so archival still goes by
+            # the last real edit.
+            total = sum(queryset.update(user=user) for queryset in querysets)
+
+        verb = "Would assign" if options["dry_run"] else "Assigned"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} notes to {user.get_username()}"))
@@ -0,0 +1,153 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from notes import minhash, sharding
+from notes.models import MinHashBucket, Note
+
+
+def chunks(chunk_size, using=DEFAULT_DB_ALIAS):
+    """
+    Yields the notes table of one database as lists of (pk, content) pairs,
+    in pk order.
+    """
+    rows = Note.objects.using(using).order_by("pk").values_list("pk", "content")
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def compute_signatures(chunk_size, workers, using=DEFAULT_DB_ALIAS):
+    """
+    Computes the signature of every note in a database, spreading chunks
+    over processes.
+
+    Only a bounded number of chunks is in flight at a time, so the pool never
+    holds more than a few chunks of note content. The signatures are all
+    kept, though, one per note, as grouping compares them: memory still
+    grows with the table, by a signature per note.
+    :return: Dictionary mapping note pk to signature.
+    """
+    signatures = {}
+    if workers <= 1:
+        for chunk in chunks(chunk_size, using):
+            signatures.update(minhash.signatures_for(chunk))
+        return signatures
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for chunk in chunks(chunk_size, using):
+            pending.append(pool.submit(minhash.signatures_for, chunk))
+            if len(pending) >= workers * 2:
+                signatures.update(pending.pop(0).result())
+        for future in pending:
+            signatures.update(future.result())
+    return signatures
+
+
+def duplicate_groups(signatures, threshold):
+    """
+    Groups notes whose estimated similarity reaches ``threshold``.
+
+    Within an LSH bucket, each note is compared with one representative of
+    every group met so far in the bucket, and joins the first that is
+    similar enough; notes already in one of those groups are skipped. A
+    bucket of near-duplicates, however large, then costs one comparison per
+    note, and the union-find joins groups that overlap across buckets.
+    :return: List of groups (sorted lists of pks), largest first.
+    """
+    buckets = defaultdict(list)
+    for pk, signature in signatures.items():
+        for key in minhash.bands(signature):
+            buckets[key].append(pk)
+
+    parent = {}
+
+    def find(pk):
+        parent.setdefault(pk, pk)
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    for members in buckets.values():
+        representatives = []
+        for pk in members:
+            root = find(pk)
+            if any(find(other) == root for other in representatives):
+                continue
+            for other in representatives:
+                if minhash.similarity(signatures[pk],
+                                      signatures[other]) >= threshold:
+                    parent[root] = find(other)
+                    break
+            else:
+                representatives.append(pk)
+
+    groups = defaultdict(list)
+    for pk in parent:
+        groups[find(pk)].append(pk)
+    found = [sorted(group) for group in groups.values() if len(group) > 1]
+    return sorted(found, key=lambda group: (-len(group), group[0]))
+
+
+class Command(BaseCommand):
+    """
+    Management command that finds near-duplicate notes across the whole table.
+
+    With sharding on, every shard is read, plus any notes still waiting in the
+    default database for ``rebalance_shards``; duplicates are found across
+    shards.
+
+    Usage:
+        python manage.py find_duplicates --threshold 0.8 --workers 4
+        python manage.py find_duplicates --update
+    """
+    help = ("Compute MinHash signatures for all notes in parallel and report "
+            "groups of near-duplicates.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=float, default=0.8,
+                            help="Minimum estimated similarity (0-1).")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Number of worker processes.")
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                            help="Notes per work unit.")
+        parser.add_argument("--update", action="store_true",
+                            help="Store the recomputed signatures and "
+                                 "buckets.")
+
+    def handle(self, *args, **options):
+        aliases = [DEFAULT_DB_ALIAS, *sharding.shard_aliases()]
+        signatures = {}
+        for using in aliases:
+            found = compute_signatures(options["chunk_size"],
+                                       options["workers"], using)
+            if options["update"]:
+                MinHashBucket.store(found, options["chunk_size"], using=using)
+            signatures.update(found)
+        self.stdout.write(f"Computed {len(signatures)} signatures")
+        if options["update"]:
+            self.stdout.write("Stored signatures and LSH buckets")
+
+        groups = duplicate_groups(signatures, options["threshold"])
+        grouped = [pk for group in groups for pk in group]
+        titles = {}
+        for using in aliases:
+            titles.update(Note.objects.using(using).filter(
+                pk__in=grouped).values_list("pk", "title"))
+        for group in groups:
+            self.stdout.write(f"{len(group)} near-duplicates:")
+            for pk in group:
+                self.stdout.write(f"  #{pk} {titles.get(pk, '')}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {len(groups)} groups of near-duplicate notes"
+        ))
@@ -0,0 +1,93 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from notes import attachments, sharding
+from notes.models import Attachment
+
+
+def stored_files(cutoff):
+    """
+    Yields the stored attachment files, and leftover partial files, last
+    modified before ``cutoff``, a timestamp.
+
+    Recent files are skipped: their attachment rows may not be committed yet.
+    Uploads of content already stored refresh the file's modification time
+    for the same reason.
+    """
+    root = attachments.root()
+    if not root.is_dir():
+        return
+    for path in root.glob("??/??/*"):
+        if path.is_file() and path.stat().st_mtime < cutoff:
+            yield path
+
+
+def referenced(digests, aliases):
+    """
+    Returns the digests among ``digests`` that some attachment refers to.
+    """
+    found = set()
+    for alias in aliases:
+        found.update(Attachment.objects.using(alias)
+                     .filter(sha256__in=digests - found)
+                     .values_list("sha256", flat=True))
+    return found
+
+
+class Command(BaseCommand):
+    """
+    Management command that deletes stored attachment files no attachment
+    refers to any more.
+
+    Files are shared between attachments with the same content, so they are
+    not deleted with the attachments but collected here, in batches, after
+    checking every database that may hold attachment rows.
+
+    Usage:
+        python manage.py prune_attachments
+        python manage.py prune_attachments --grace 600 --dry-run
+    """
+    help = "Delete stored attachment files that no attachment refers to."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace", type=int, default=3600,
+                            help="Leave files younger than this many seconds.")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Files checked per query.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        aliases = [DEFAULT_DB_ALIAS, *sharding.shard_aliases()]
+        deleted = freed = 0
+        cutoff = time.time() - options["grace"]
+        paths = stored_files(cutoff)
+        while batch := {path.name: path
+                        for path in islice(paths, options["batch_size"])}:
+            # Partial files from interrupted uploads start with a dot and are
+            # never referenced.
+            used = referenced({name for name in batch if not name.startswith(".")},
+                              aliases)
+            for name, path in batch.items():
+                if name in used:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                # Uploaded again while the batch was checked: the new
+                # attachment row may not be visible yet.
+                if stat.st_mtime >= cutoff:
+                    continue
+                freed += stat.st_size
+                deleted += 1
+                if not options["dry_run"]:
+                    path.unlink(missing_ok=True)
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {deleted} files, {freed} bytes"
+        ))
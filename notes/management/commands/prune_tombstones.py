@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from notes import sync
+
+
+class Command(BaseCommand):
+    """
+    Management command that deletes the tombstones of notes deleted or
+    archived more than NOTES_SYNC_RETENTION seconds ago.
+
+    Offline clients that have not synced for that long download all their
+    notes again instead of applying deletions.
+
+    Usage:
+        python manage.py prune_tombstones
+    """
+    help = "Delete tombstones of notes that no offline client still needs."
+
+    def handle(self, *args, **options):
+        deleted = sync.prune()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstones"))
@@ -0,0 +1,139 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.text import slugify
+
+from notes import minhash, sharding
+from notes.models import Attachment, MinHashBucket, Note, NoteTag, Tag
+
+
+def misplaced(alias, aliases, batch_size):
+    """
+    Yields the notes stored on ``alias`` that belong on another shard, in
+    batches.
+
+    The table is walked by keyset pagination on the primary key, so batches
+    can be moved away while the walk goes on.
+    """
+    last = None
+    while True:
+        notes = Note.objects.using(alias).order_by("pk")
+        if last is not None:
+            notes = notes.filter(pk__gt=last)
+        batch = list(notes[:batch_size])
+        if not batch:
+            return
+        last = batch[-1].pk
+        moving = [note for note in batch
+                  if sharding.shard_for_note(note, aliases) != alias]
+        if moving:
+            yield moving
+
+
+def move(notes, source, target):
+    """
+    Moves notes, with their tags, similarity buckets and attachments, between
+    databases. Attached files are shared by all databases, so only their rows
+    are copied.
+
+    The copy is committed on the target before the notes are deleted from
+    the source, and notes already on the target are not copied again, so an
+    interrupted run can simply be repeated.
+    :param notes: Notes loaded from ``source``.
+    :param source: Alias of the database the notes are on.
+    :param target: Alias of the database they belong on.
+    """
+    pks = [note.pk for note in notes]
+    tag_names = defaultdict(list)
+    for note_id, name in (NoteTag.objects.using(source)
+                          .filter(note_id__in=pks)
+                          .values_list("note_id", "tag__name")):
+        tag_names[note_id].append(name)
+
+    with transaction.atomic(using=target):
+        present = set(Note.objects.using(target).filter(pk__in=pks)
+                      .values_list("pk", flat=True))
+        copies = [note for note in notes if note.pk not in present]
+        # bulk_create() stamps auto_now fields, so the original timestamps
+        # are put back afterwards.
+        stamps = {note.pk: (note.created_at, note.modified_at)
+                  for note in copies}
+        Note.objects.using(target).bulk_create(copies)
+        for note in copies:
+            note.created_at, note.modified_at = stamps[note.pk]
+        Note.objects.using(target).bulk_update(
+            copies, ["created_at", "modified_at"])
+
+        tags = {tag.slug: tag for tag in Tag.for_names(
+            [name for note in copies for name in tag_names[note.pk]],
+            using=target,
+        )}
+        NoteTag.objects.using(target).bulk_create(
+            NoteTag(note_id=note.pk, tag=tags[slugify(name)])
+            for note in copies
+            for name in tag_names[note.pk]
+            if slugify(name) in tags
+        )
+        MinHashBucket.objects.using(target).bulk_create(
+            MinHashBucket(note_id=note.pk, band=band, bucket=bucket)
+            for note in copies
+            for band, bucket in minhash.bands(minhash.from_bytes(note.minhash))
+        )
+        copied = {note.pk for note in copies}
+        files = list(Attachment.objects.using(source)
+                     .filter(note_id__in=copied).order_by("pk"))
+        created = [attachment.created_at for attachment in files]
+        for attachment in files:
+            attachment.pk = None
+        Attachment.objects.using(target).bulk_create(files)
+        for attachment, created_at in zip(files, created):
+            attachment.created_at = created_at
+        Attachment.objects.using(target).bulk_update(files, ["created_at"])
+
+    with transaction.atomic(using=source):
+        Note.objects.using(source).filter(pk__in=pks).delete()
+
+
+class Command(BaseCommand):
+    """
+    Management command that moves notes to the shard they belong on.
+
+    Run it after adding shards, or after turning sharding on for a database
+    that already holds notes: those are moved out of the default database.
+    Only notes whose shard changed are copied.
+
+    Usage:
+        python manage.py rebalance_shards
+        python manage.py rebalance_shards --dry-run --batch-size 500
+    """
+    help = "Move notes, their tags, similarity buckets and attachments to their shard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Notes read and moved per transaction.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report how many notes would move.")
+
+    def handle(self, *args, **options):
+        aliases = sharding.shard_aliases()
+        if not aliases:
+            raise CommandError("Sharding is off; set NOTES_SHARD_COUNT.")
+
+        total = 0
+        for source in [DEFAULT_DB_ALIAS, *aliases]:
+            moved = defaultdict(int)
+            for batch in misplaced(source, aliases, options["batch_size"]):
+                by_target = defaultdict(list)
+                for note in batch:
+                    by_target[sharding.shard_for_note(note, aliases)].append(note)
+                for target, notes in by_target.items():
+                    if not options["dry_run"]:
+                        move(notes, source, target)
+                    moved[target] += len(notes)
+            for target, count in sorted(moved.items()):
+                self.stdout.write(f"{source} -> {target}: {count} notes")
+            total += sum(moved.values())
+
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} notes"))
@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from notes import rendering, sharding
+from notes.models import Note
+
+
+def stale_chunks(using, chunk_size, renderer, everything):
+    """
+    Yields lists of (pk, content) pairs of notes whose cached HTML is stale.
+
+    The table is walked by keyset pagination on the primary key; only the
+    hash column is read for notes that turn out to be up to date.
+    """
+    last = None
+    while True:
+        notes = Note.objects.using(using).order_by("pk")
+        if last is not None:
+            notes = notes.filter(pk__gt=last)
+        rows = list(notes.values_list("pk", "content",
+                                      "content_html_hash")[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        stale = [(pk, content) for pk, content, digest in rows
+                 if everything or digest != rendering.content_hash(content, renderer)]
+        if stale:
+            yield stale
+
+
+def store(using, rendered):
+    """
+    Writes rendered HTML back in one bulk update, leaving modified_at alone.
+    """
+    notes = [Note(pk=pk, content_html=html, content_html_hash=digest)
+             for pk, html, digest in rendered]
+    with transaction.atomic(using=using):
+        Note.objects.using(using).bulk_update(
+            notes, ["content_html", "content_html_hash"])
+
+
+class Command(BaseCommand):
+    """
+    Management command that refreshes the cached HTML of notes.
+
+    Run it after changing the renderer (RENDERER_VERSION, installing or
+    removing Markdown support, or toggling NOTES_MARKDOWN) so that views do
+    not have to render stale notes one by one.
+
+    Usage:
+        python manage.py rerender_notes
+        python manage.py rerender_notes --all --workers 4
+    """
+    help = "Re-render the cached HTML of notes rendered by an older renderer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Re-render every note, not only stale ones.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Number of worker processes.")
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Notes per work unit and per update.")
+
+    def handle(self, *args, **options):
+        renderer = rendering.backend()
+        total = 0
+        for using in [DEFAULT_DB_ALIAS, *sharding.shard_aliases()]:
+            chunks = stale_chunks(using, options["chunk_size"], renderer,
+                                  options["all"])
+            if options["workers"] <= 1:
+                for chunk in chunks:
+                    store(using, rendering.render_rows(chunk, renderer))
+                    total += len(chunk)
+                continue
+            with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+                pending = []
+                for chunk in chunks:
+                    pending.append(pool.submit(rendering.render_rows, chunk,
+                                               renderer))
+                    if len(pending) >= options["workers"] * 2:
+                        rendered = pending.pop(0).result()
+                        store(using, rendered)
+                        total += len(rendered)
+                for future in pending:
+                    rendered = future.result()
+                    store(using, rendered)
+                    total += len(rendered)
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-rendered {total} notes with the {renderer} renderer"
+        ))
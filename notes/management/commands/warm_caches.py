@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+
+from notes import warmup
+
+
+class Command(BaseCommand):
+    """
+    Management command that warms caches after a deploy.
+
+    Run on its own, it fills the HTML cached on the hottest notes and the
+    operating system's page cache, which every worker shares; connections and
+    compiled templates only last as long as the command. With ``--url`` the
+    pages are requested from the running servers instead, so the workers
+    that answer warm themselves.
+
+    Usage:
+        python manage.py warm_caches --top 50 --workers 8 --budget 15
+        python manage.py warm_caches --url http://127.0.0.1:8000
+    """
+    help = ("Pre-open database connections, precompile templates and "
+            "pre-render the most recently modified notes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=warmup.DEFAULT_TOP_N,
+                            help="Number of note detail pages to pre-render.")
+        parser.add_argument("--workers", type=int,
+                            default=warmup.DEFAULT_WORKERS,
+                            help="Number of rendering threads.")
+        parser.add_argument("--budget", type=float,
+                            default=warmup.DEFAULT_BUDGET,
+                            help="Time budget in seconds.")
+        parser.add_argument("--url", action="append", default=[],
+                            dest="urls",
+                            help="Base URL of a running server to request "
+                                 "the pages from; may be repeated.")
+
+    def handle(self, *args, **options):
+        report = warmup.warm_caches(top_n=options["top"],
+                                    workers=options["workers"],
+                                    budget=options["budget"],
+                                    urls=options["urls"])
+        if not options["urls"]:
+            self.stdout.write(
+                f"Opened connections: {', '.join(report['connections'])}"
+            )
+            self.stdout.write(f"Compiled {len(report['templates'])} templates")
+        for (path, user_id), status in sorted(report["rendered"].items()):
+            self.stdout.write(f"  {status} {path} (user {user_id})")
+        if report["unfinished"]:
+            self.stdout.write(self.style.WARNING(
+                f"Left {len(report['unfinished'])} pages rendering "
+                f"when the budget of {options['budget']}s ran out"
+            ))
+        if report["skipped"]:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {len(report['skipped'])} pages "
+                f"(budget {options['budget']}s exhausted or render failed)"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(report['rendered'])} pages "
+            f"in {report['elapsed']:.2f}s"
+        ))
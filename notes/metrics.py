@@ -0,0 +1,434 @@
+"""
+Operational metrics in the Prometheus text format.
+
+Counters and histograms are recorded as the app runs: requests per view,
+their latency, database query latency, cache hits and misses, autosave and
+throttling outcomes. Gauges - table sizes, database and WAL file sizes - are
+read when /metrics is scraped; table sizes take a COUNT over a whole table
+when notes are sharded, so they are kept in the cache for
+NOTES_METRICS_ROWS_TTL seconds between scrapes.
+
+Every worker process records into a store of its own, so recording never
+waits on another process:
+
+- With NOTES_METRICS_DIR set, the store is a memory-mapped file in that
+  directory, named after the process id. /metrics reads the files of every
+  process and adds them up, so any worker can answer a scrape with the
+  totals. Empty the directory when the server is restarted.
+- Without it, values are kept in memory and each process reports its own.
+
+Within a process, recording takes a short lock around a few in-place
+updates of the store.
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+# Layout of a store file: a 4-byte count of the bytes in use, then entries
+# of a 4-byte key length, the UTF-8 key padded to 8 bytes, and an 8-byte
+# float value.
+HEADER = struct.Struct("i")
+KEY_LENGTH = struct.Struct("i")
+VALUE = struct.Struct("d")
+INITIAL_FILE_SIZE = 1 << 16
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+ROWS_CACHE_KEY = "notes:metrics:rows"
+DEFAULT_ROWS_TTL = 60
+
+
+class MemoryStore:
+    """
+    Metric values of this process, kept in a dictionary.
+    """
+
+    def __init__(self):
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def add(self, increments):
+        """
+        Adds to values.
+        :param increments: Iterable of (key, amount) pairs.
+        """
+        with self.lock:
+            for key, amount in increments:
+                self.values[key] += amount
+
+    def items(self):
+        with self.lock:
+            return list(self.values.items())
+
+
+class MmapStore:
+    """
+    Metric values of this process, kept in a memory-mapped file.
+
+    Only the owning process writes the file; entries are appended and the
+    header updated afterwards, so readers in other processes only ever see
+    complete entries.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.file = open(self.path, "a+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < INITIAL_FILE_SIZE:
+            self.file.truncate(INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+        self.positions = {key: position for key, _, position in
+                          read_entries(self.map, self.used)}
+
+    def _allocate(self, key):
+        encoded = key.encode()
+        padded = encoded + b" " * (-(KEY_LENGTH.size + len(encoded)) % 8)
+        entry = KEY_LENGTH.pack(len(padded)) + padded + VALUE.pack(0.0)
+        while self.used + len(entry) > len(self.map):
+            self._grow()
+        self.map[self.used:self.used + len(entry)] = entry
+        position = self.used + len(entry) - VALUE.size
+        self.used += len(entry)
+        HEADER.pack_into(self.map, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def _grow(self):
+        size = len(self.map) * 2
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def add(self, increments):
+        with self.lock:
+            for key, amount in increments:
+                position = self.positions.get(key)
+                if position is None:
+                    position = self._allocate(key)
+                value = VALUE.unpack_from(self.map, position)[0]
+                VALUE.pack_into(self.map, position, value + amount)
+
+    def items(self):
+        with self.lock:
+            return [(key, VALUE.unpack_from(self.map, position)[0])
+                    for key, position in self.positions.items()]
+
+
+def read_entries(data, used=None):
+    """
+    Yields the (key, value, position of value) entries of a store file.
+    :param data: The file's bytes, or its memory map.
+    :param used: Bytes in use; read from the header if not given.
+    """
+    if used is None:
+        used = HEADER.unpack_from(data, 0)[0]
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        position += KEY_LENGTH.size
+        key = bytes(data[position:position + length]).decode().rstrip(" ")
+        position += length
+        yield key, VALUE.unpack_from(data, position)[0], position
+        position += VALUE.size
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def metrics_dir():
+    return getattr(settings, "NOTES_METRICS_DIR", None)
+
+
+def store():
+    """
+    Returns the store of the current process, creating it on first use and
+    again in a process forked from one that had one.
+    """
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        with _store_lock:
+            if _store_pid != pid:
+                directory = metrics_dir()
+                if directory:
+                    Path(directory).mkdir(parents=True, exist_ok=True)
+                    _store = MmapStore(Path(directory) / f"metrics-{pid}.db")
+                else:
+                    _store = MemoryStore()
+                _store_pid = pid
+    return _store
+
+
+def collect():
+    """
+    Returns the values of every process, added up.
+    :return: Dictionary mapping keys to values.
+    """
+    directory = metrics_dir()
+    if not directory:
+        return dict(store().items())
+    totals = defaultdict(float)
+    for path in sorted(Path(directory).glob("metrics-*.db")):
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            continue
+        for key, value, _ in read_entries(data):
+            totals[key] += value
+    return totals
+
+
+def sample_key(name, labels):
+    return json.dumps([name, sorted(labels.items())], separators=(",", ":"))
+
+
+REGISTRY = {}
+
+
+class Counter:
+    """
+    A value that only goes up, per combination of label values.
+    """
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        REGISTRY[name] = self
+
+    def inc(self, amount=1, **labels):
+        store().add([(sample_key(self.name, labels), amount)])
+
+
+class Histogram:
+    """
+    Counts of observations falling into buckets, with their sum, per
+    combination of label values.
+
+    Each observation is added to the one bucket it falls in; buckets are made
+    cumulative when exported.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (math.inf,)
+        REGISTRY[name] = self
+
+    def observe(self, value, **labels):
+        bound = next(bound for bound in self.buckets if value <= bound)
+        store().add([
+            (sample_key(f"{self.name}_bucket", {**labels, "le": bound}), 1),
+            (sample_key(f"{self.name}_sum", labels), value),
+            (sample_key(f"{self.name}_count", labels), 1),
+        ])
+
+
+requests = Counter("notes_http_requests_total",
+                   "HTTP requests by view, method and status.")
+request_duration = Histogram("notes_http_request_duration_seconds",
+                             "Time to produce a response, by view.",
+                             LATENCY_BUCKETS)
+query_duration = Histogram("notes_db_query_duration_seconds",
+                           "Database query time, by database.",
+                           QUERY_BUCKETS)
+cache_requests = Counter("notes_cache_requests_total",
+                         "Cache lookups by cache and result (hit or miss).")
+autosave_drafts = Counter("notes_autosave_drafts_total",
+                          "Autosaved drafts by outcome: received, coalesced "
+                          "(a write avoided), written or dropped.")
+throttled = Counter("notes_throttled_requests_total",
+                    "Write requests refused, by status: 429 when rate "
+                    "limited, 503 when shedding load.")
+
+
+def value(name, **labels):
+    """
+    Returns the current total of one sample, across processes.
+    """
+    return collect().get(sample_key(name, labels), 0.0)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing every query.
+    """
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        query_duration.observe(time.perf_counter() - started,
+                               alias=context["connection"].alias)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Handler of connection_created installing record_query() on a connection.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """
+    Middleware counting requests and timing them, by view name.
+
+    Requests that do not resolve to a view are counted under
+    ``<unresolved>``. Streaming responses are timed up to the point their
+    first chunk is ready to be sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match is not None else "<unresolved>"
+        request_duration.observe(time.perf_counter() - started, view=view)
+        requests.inc(view=view, method=request.method,
+                     status=str(response.status_code))
+        return response
+
+
+def table_rows():
+    """
+    Counts the rows of the notes tables, or returns the counts from the
+    cache if they were taken less than NOTES_METRICS_ROWS_TTL seconds ago.
+    :return: List of (labels, value) pairs.
+    """
+    from django.core.cache import cache
+    from django.db import connections
+
+    from . import archive, sharding
+    from .models import ArchivedNote, Note
+
+    rows = cache.get(ROWS_CACHE_KEY)
+    if rows is not None:
+        return rows
+    rows = []
+    for alias in connections:
+        if connections[alias].vendor != "sqlite":
+            continue
+        labels = {"alias": alias}
+        if alias == "default" or alias.startswith(sharding.SHARD_ALIAS_PREFIX):
+            notes = Note.objects.using(alias)
+            # Sharded ids are not dense, so their span says nothing.
+            count = notes.count() if sharding.enabled() else notes.approximate_count()
+            rows.append(({**labels, "table": "note"}, count))
+        if alias == archive.archive_db():
+            rows.append(({**labels, "table": "archivednote"},
+                         ArchivedNote.objects.using(alias).count()))
+    cache.set(ROWS_CACHE_KEY, rows,
+              getattr(settings, "NOTES_METRICS_ROWS_TTL", DEFAULT_ROWS_TTL))
+    return rows
+
+
+def gauges():
+    """
+    Reads the gauges: note table sizes, and database and WAL file sizes.
+    :return: List of (name, help, [(labels, value)]) tuples.
+    """
+    from django.db import connections
+
+    rows, database_bytes, wal_bytes = table_rows(), [], []
+    for alias in connections:
+        connection = connections[alias]
+        if connection.vendor != "sqlite":
+            continue
+        labels = {"alias": alias}
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA page_count")
+            pages = cursor.fetchone()[0]
+            cursor.execute("PRAGMA page_size")
+            database_bytes.append((labels, pages * cursor.fetchone()[0]))
+        name = str(connection.settings_dict["NAME"])
+        wal = Path(f"{name}-wal")
+        wal_bytes.append((labels, wal.stat().st_size if wal.exists() else 0))
+    return [
+        ("notes_table_rows", "Rows in the notes tables, recounted every "
+         "NOTES_METRICS_ROWS_TTL seconds; estimated for unsharded notes.", rows),
+        ("notes_database_size_bytes", "Size of each SQLite database.", database_bytes),
+        ("notes_sqlite_wal_size_bytes", "Size of each SQLite write-ahead log; 0 without one.", wal_bytes),
+    ]
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def format_labels(labels):
+    """
+    Formats label pairs as ``{name="value",...}``, escaping the values.
+    """
+    if not labels:
+        return ""
+    pairs = []
+    for name, label in labels:
+        label = str(label).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{label}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def export():
+    """
+    Renders every metric, added up across processes, in the Prometheus text
+    exposition format.
+    :return: The text of the /metrics response.
+    """
+    samples = defaultdict(list)
+    for key, amount in collect().items():
+        name, labels = json.loads(key)
+        samples[name].append(([tuple(pair) for pair in labels], amount))
+
+    lines = []
+    for metric in REGISTRY.values():
+        name = metric.name
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        if metric.kind == "counter":
+            for labels, amount in sorted(samples[name]):
+                lines.append(f"{name}{format_labels(labels)} {format_value(amount)}")
+            continue
+        series = defaultdict(dict)
+        for labels, amount in samples[f"{name}_bucket"]:
+            rest = tuple(pair for pair in labels if pair[0] != "le")
+            series[rest][dict(labels)["le"]] = amount
+        sums = {tuple(labels): amount for labels, amount in samples[f"{name}_sum"]}
+        counts = {tuple(labels): amount for labels, amount in samples[f"{name}_count"]}
+        for labels in sorted(series):
+            total = 0.0
+            for bound in metric.buckets:
+                total += series[labels].get(bound, 0.0)
+                bucket_labels = [*labels, ("le", format_value(bound))]
+                lines.append(f"{name}_bucket{format_labels(bucket_labels)} {format_value(total)}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_value(sums.get(labels, 0.0))}")
+            lines.append(f"{name}_count{format_labels(labels)} {format_value(counts.get(labels, 0.0))}")
+
+    for name, documentation, values in gauges():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, amount in values:
+            lines.append(f"{name}{format_labels(sorted(labels.items()))} {format_value(amount)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0003_remove_note_user"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="note",
+            name="title",
+            field=models.CharField(max_length=100),
+        ),
+    ]
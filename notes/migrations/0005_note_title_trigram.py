@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from notes.search import install_trigram_index
+
+    install_trigram_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from notes.search import uninstall_trigram_index
+
+    uninstall_trigram_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0004_alter_note_title"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from notes import minhash
+
+
+def backfill_signatures(apps, schema_editor):
+    Note = apps.get_model("notes", "Note")
+    MinHashBucket = apps.get_model("notes", "MinHashBucket")
+    db = schema_editor.connection.alias
+    notes, buckets = [], []
+    for note in Note.objects.using(db).only("content").iterator(chunk_size=1000):
+        signature = minhash.signature(note.content)
+        note.minhash = minhash.to_bytes(signature)
+        notes.append(note)
+        buckets.extend(
+            MinHashBucket(note=note, band=band, bucket=bucket)
+            for band, bucket in minhash.bands(signature)
+        )
+        if len(notes) == 1000:
+            Note.objects.using(db).bulk_update(notes, ["minhash"])
+            MinHashBucket.objects.using(db).bulk_create(buckets)
+            notes, buckets = [], []
+    Note.objects.using(db).bulk_update(notes, ["minhash"])
+    MinHashBucket.objects.using(db).bulk_create(buckets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0005_note_title_trigram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="minhash",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.CreateModel(
+            name="MinHashBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("band", models.PositiveSmallIntegerField()),
+                ("bucket", models.BigIntegerField()),
+                (
+                    "note",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="minhash_buckets",
+                        to="notes.note",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["band", "bucket"], name="notes_minha_band_9d3e58_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_signatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0006_note_minhash"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                fields=["created_at"], name="notes_note_created_067654_idx"
+            ),
+        ),
+    ]
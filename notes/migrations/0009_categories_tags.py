@@ -0,0 +1,128 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def install(apps, schema_editor):
+    from notes.counters import install_tag_counters
+
+    install_tag_counters(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from notes.counters import uninstall_tag_counters
+
+    uninstall_tag_counters(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0008_note_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Category",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("title", models.CharField(max_length=200)),
+                ("slug", models.SlugField(unique=True)),
+            ],
+            options={
+                "verbose_name_plural": "categories",
+            },
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="category",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="notes",
+                to="notes.category",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Tag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50)),
+                ("slug", models.SlugField(unique=True)),
+                ("note_count", models.PositiveIntegerField(default=0, editable=False)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-note_count"], name="notes_tag_note_co_71464f_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="NoteTag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "note",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="note_tags",
+                        to="notes.note",
+                    ),
+                ),
+                (
+                    "tag",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="note_tags",
+                        to="notes.tag",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="tags",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="notes",
+                through="notes.NoteTag",
+                to="notes.tag",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="notetag",
+            constraint=models.UniqueConstraint(
+                fields=("tag", "note"), name="notes_notetag_tag_note_uniq"
+            ),
+        ),
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0011_archivednote"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="content_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="content_html_hash",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+    ]
@@ -0,0 +1,121 @@
+"""
+MinHash signatures and LSH banding for near-duplicate note detection.
+
+Everything in here is plain Python with no Django imports, so it can run in
+worker processes without setting Django up.
+
+A note's content is broken into overlapping character shingles, and each of
+NUM_PERM hash functions keeps the smallest hash it sees. The fraction of
+positions where two signatures agree estimates the Jaccard similarity of the
+two shingle sets. For lookups the signature is cut into BANDS bands of ROWS
+values; notes that share any band bucket become candidates. With 16 bands of
+4 rows, pairs above roughly 50% similarity are very likely to share a bucket.
+"""
+
+import hashlib
+import random
+import re
+import struct
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_SIGNATURE_FORMAT = f"<{NUM_PERM}I"
+
+# Fixed seed: signatures are stored, so the hash functions must never change.
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Splits normalised text into overlapping character shingles.
+    :param text: Note content.
+    :param size: Shingle length in characters.
+    :return: Set of shingles; empty for blank text.
+    """
+    text = _WHITESPACE.sub(" ", text.lower()).strip()
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _hash(shingle):
+    digest = hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def signature(text):
+    """
+    Computes the MinHash signature of a text.
+    :param text: Note content.
+    :return: Tuple of NUM_PERM 32-bit integers, or None for blank text.
+    """
+    hashes = [_hash(shingle) for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return tuple(
+        min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    )
+
+
+def to_bytes(sig):
+    """
+    Packs a signature for storage; None packs to empty bytes.
+    """
+    return struct.pack(_SIGNATURE_FORMAT, *sig) if sig else b""
+
+
+def from_bytes(data):
+    """
+    Unpacks a stored signature; empty data unpacks to None.
+    """
+    return struct.unpack(_SIGNATURE_FORMAT, bytes(data)) if data else None
+
+
+def similarity(sig_a, sig_b):
+    """
+    Estimates the Jaccard similarity of two signatures.
+    :return: A float between 0 and 1; 0 when either signature is missing.
+    """
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / NUM_PERM
+
+
+def bands(sig):
+    """
+    Cuts a signature into LSH band buckets.
+    :param sig: A signature, or None.
+    :return: List of (band, bucket) pairs, where bucket is a signed 64-bit
+        integer suitable for a BigIntegerField.
+    """
+    if not sig:
+        return []
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<{ROWS}I", *sig[band * ROWS:(band + 1) * ROWS])
+        digest = hashlib.blake2b(chunk, digest_size=8).digest()
+        keys.append((band, int.from_bytes(digest, "little", signed=True)))
+    return keys
+
+
+def signatures_for(rows):
+    """
+    Computes signatures for a batch of notes.
+
+    Module-level so it can be sent to a process pool.
+    :param rows: Iterable of (pk, content) pairs.
+    :return: List of (pk, signature) pairs.
+    """
+    return [(pk, signature(content)) for pk, content in rows]
@@ -1,5 +1,165 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, router, transaction
 from django.urls import reverse
+from django.utils.safestring import mark_safe
+from django.utils.text import slugify
+
+from . import attachments, metrics, minhash, rendering, sharding
+
+
+class NoteQuerySet(models.QuerySet):
+    """
+    QuerySet for notes.
+
+    Methods:
+        for_user(): Restricts the notes to those owned by a user.
+        with_labels(): Loads the categories and tags of the notes up front.
+        approximate_count(): Estimates the table size without a COUNT(*).
+    """
+
+    def for_user(self, user):
+        """
+        Restricts the queryset to notes owned by ``user``.
+
+        Every view goes through this, so a request only ever touches the
+        caller's rows and, through the (user, created_at) index, only reads
+        that user's slice of the table. Anonymous users own no notes.
+
+        :param user: The user making the request.
+        :returns: The scoped queryset.
+        :rtype: NoteQuerySet
+        """
+        if not user.is_authenticated:
+            return self.none()
+        return sharding.route(self.filter(user=user), user=user)
+
+    def with_labels(self):
+        """
+        Loads the category and tags of the notes up front.
+
+        The category comes in through a join and all tags through one extra
+        query, so rendering them costs the same however many notes are
+        listed. Sharded notes cannot join to the categories in the default
+        database, so there the categories are prefetched as well.
+
+        :returns: The queryset, with categories and tags preloaded.
+        :rtype: NoteQuerySet
+        """
+        if sharding.enabled():
+            return self.prefetch_related("category", "tags")
+        return self.select_related("category").prefetch_related("tags")
+
+    def create(self, **kwargs):
+        """
+        Creates a note, on its shard when notes are sharded.
+        """
+        if not sharding.enabled() or self._db is not None:
+            return super().create(**kwargs)
+        note = self.model(**kwargs)
+        note.save(force_insert=True)
+        return note
+
+    def approximate_count(self):
+        """
+        Estimates how many notes the table holds, ignoring any filters.
+
+        The estimate is the span of primary keys, which both ends of the
+        primary key index answer directly. Deleted rows make it an
+        overestimate, which is fine for pagination of large tables.
+
+        :returns: Estimated number of rows.
+        :rtype: int
+        """
+        bounds = self.model._default_manager.using(self.db).aggregate(
+            low=models.Min("pk"), high=models.Max("pk"))
+        if bounds["high"] is None:
+            return 0
+        return bounds["high"] - bounds["low"] + 1
+
+
+class Category(models.Model):
+    """
+    Model representing a category notes can be filed under.
+
+    Fields:
+    - title: CharField for the category name.
+    - slug: SlugField used in URLs, unique across categories.
+    """
+    title = models.CharField(max_length=200)
+    slug = models.SlugField(unique=True)
+
+    class Meta:
+        verbose_name_plural = "categories"
+
+    def __str__(self):
+        return self.title
+
+
+class Tag(models.Model):
+    """
+    Model representing a tag that can be attached to any number of notes.
+
+    Fields:
+    - name: CharField for the tag as the user typed it.
+    - slug: SlugField used in URLs, unique across tags.
+    - note_count: Number of notes carrying the tag, whoever owns them; each
+    user's own count is kept in UserTagCount. It is maintained by database
+    triggers on the notes_notetag table (see notes.counters), so it changes
+    in the same transaction as the tag assignments themselves.
+
+    Methods:
+        for_names(): Returns the tags for a list of names, creating any
+        that do not exist yet.
+    """
+    name = models.CharField(max_length=50)
+    slug = models.SlugField(unique=True)
+    note_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["-note_count"])]
+
+    @classmethod
+    def for_names(cls, names, using=None):
+        """
+        Returns the tags for ``names``, creating any that are missing.
+
+        Names are matched on their slug, so "To do" and "to-do" are the same
+        tag. Missing tags are created with a single bulk insert.
+
+        :param names: Iterable of tag names.
+        :param using: Database to look in; tags are stored alongside the
+                      notes they are attached to, which matters once notes
+                      are sharded.
+        :returns: List of tags, in the order the names were given.
+        :rtype: list
+        """
+        wanted = {}
+        for name in names:
+            name = name.strip()[:50]
+            slug = slugify(name)
+            if slug and slug not in wanted:
+                wanted[slug] = name
+        if not wanted:
+            return []
+        tags = cls.objects.using(using or router.db_for_write(cls))
+        existing = set(tags.filter(slug__in=wanted)
+                       .values_list("slug", flat=True))
+        tags.bulk_create(
+            [cls(name=name, slug=slug) for slug, name in wanted.items()
+             if slug not in existing],
+            ignore_conflicts=True,
+        )
+        found = tags.in_bulk(list(wanted), field_name="slug")
+        return [found[slug] for slug in wanted]
+
+    def get_absolute_url(self):
+        """
+        Returns the URL of the list of notes carrying this tag.
+        """
+        return reverse("note_list_by_tag", args=[self.slug])
+
+    def __str__(self):
+        return self.name
 
 
 class Note(models.Model):
@@ -7,20 +167,160 @@ class Note(models.Model):
     Model representing sticky notes
 
     Fields:
+    - user: ForeignKey to the user who owns the note.
     - title: CharField for the note title with a maximum length
     of 200 characters.
     - content: TextField for the note content
     - created_at: DateTimeField set to the current date and time
     when the note is created.
+    - minhash: BinaryField holding the MinHash signature of the content,
+    computed on save and used to find near-duplicate notes.
+    - category: Optional ForeignKey to the note's category.
+    - tags: ManyToManyField to the note's tags, through NoteTag.
+    - content_html: TextField caching the content rendered to sanitized HTML.
+    - content_html_hash: CharField holding the rendering.content_hash() the
+    cached HTML was rendered for.
 
     Methods:
         __str__(): Returns the string representation of the note,
         which is the note's title.
+        similar_notes(): Returns notes whose content is nearly the same.
+        rendered_content(): Returns the content as HTML, from the cache.
     """
+    # The (user, created_at) index below also serves lookups by user alone,
+    # so the foreign key does not get an index of its own. Users and
+    # categories stay in the default database when notes are sharded, so
+    # neither key is enforced by a database constraint.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, null=True, blank=True,
+                             db_index=False, db_constraint=False,
+                             related_name="notes")
     title = models.CharField(max_length=100)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
+    minhash = models.BinaryField(default=b"", editable=False)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL,
+                                 null=True, blank=True, db_constraint=False,
+                                 related_name="notes")
+    tags = models.ManyToManyField(Tag, through="NoteTag", blank=True,
+                                  related_name="notes")
+    content_html = models.TextField(blank=True, default="", editable=False)
+    content_html_hash = models.CharField(max_length=64, blank=True, default="",
+                                         editable=False)
+
+    objects = NoteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["user", "created_at"]),
+            # Serves the delta queries of notes.sync.
+            models.Index(fields=["user", "modified_at"]),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the content as loaded, so save() can tell if it changed.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_content = instance.__dict__.get("content")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the note, refreshing its MinHash signature, LSH buckets and
+        rendered HTML whenever the content has changed.
+
+        When notes are sharded, new notes get a globally unique id up front,
+        since the id may decide which shard they go to.
+        """
+        if self.pk is None and sharding.enabled():
+            self.pk = sharding.next_id()
+        update_fields = kwargs.get("update_fields")
+        saves_content = update_fields is None or "content" in update_fields
+        content_changed = getattr(self, "_loaded_content", None) != self.content
+        if not (saves_content and content_changed):
+            return super().save(*args, **kwargs)
+
+        signature = minhash.signature(self.content)
+        self.minhash = minhash.to_bytes(signature)
+        self.content_html = rendering.render(self.content)
+        self.content_html_hash = rendering.content_hash(self.content)
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "minhash", "content_html",
+                                       "content_html_hash"}
+        using = kwargs.get("using") or router.db_for_write(Note, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            MinHashBucket.replace_for(self, signature)
+        self._loaded_content = self.content
+
+    def similar_notes(self, limit=5, threshold=0.5):
+        """
+        Returns notes whose content is nearly the same as this note's.
+
+        Candidates come from the LSH buckets this note falls into, so the cost
+        depends on how many near-duplicates exist, not on the table size.
+        Only notes with the same owner, and on the same shard when notes are
+        sharded, are considered. Each candidate is then scored against this
+        note's signature.
+
+        :param limit: Maximum number of notes to return.
+        :param threshold: Minimum estimated similarity, between 0 and 1.
+        :returns: List of notes, most similar first, each with a
+                  ``similarity`` attribute.
+        :rtype: list
+        """
+        signature = minhash.from_bytes(self.minhash)
+        keys = minhash.bands(signature)
+        if not keys:
+            return []
+        match = models.Q()
+        for band, bucket in keys:
+            match |= models.Q(band=band, bucket=bucket)
+        db = self._state.db
+        candidate_ids = (
+            MinHashBucket.objects.using(db).filter(match, note__user_id=self.user_id)
+            .exclude(note_id=self.pk)
+            .values_list("note_id", flat=True)
+            .distinct()[:MinHashBucket.MAX_CANDIDATES]
+        )
+        similar = []
+        for note in Note.objects.using(db).filter(pk__in=list(candidate_ids)).only(
+                "title", "minhash"):
+            note.similarity = minhash.similarity(
+                signature, minhash.from_bytes(note.minhash))
+            if note.similarity >= threshold:
+                similar.append(note)
+        similar.sort(key=lambda note: note.similarity, reverse=True)
+        return similar[:limit]
+
+    def rendered_content(self):
+        """
+        Returns the content rendered to sanitized HTML.
+
+        The HTML cached on the note is used as long as it was rendered from
+        the current content by the current renderer. Otherwise the content is
+        rendered now and the cache column filled in, without touching
+        modified_at; notes saved since they were loaded are left alone.
+
+        :returns: The HTML, marked safe for templates.
+        :rtype: str
+        """
+        digest = rendering.content_hash(self.content)
+        hit = self.content_html_hash == digest
+        metrics.cache_requests.inc(cache="html", result="hit" if hit else "miss")
+        if not hit:
+            self.content_html = rendering.render(self.content)
+            self.content_html_hash = digest
+            if self.pk is not None:
+                Note.objects.using(self._state.db).filter(
+                    pk=self.pk, modified_at=self.modified_at
+                ).update(content_html=self.content_html,
+                         content_html_hash=digest)
+        return mark_safe(self.content_html)
 
     def get_absolute_url(self):
         """
@@ -47,3 +347,270 @@ class Note(models.Model):
         :return: The note's title.
         """
         return self.title
+
+
+class NoteTag(models.Model):
+    """
+    Model representing the assignment of a tag to a note.
+
+    Fields:
+    - note: ForeignKey to the tagged note.
+    - tag: ForeignKey to the tag.
+    """
+    note = models.ForeignKey(Note, on_delete=models.CASCADE,
+                             related_name="note_tags")
+    # The unique (tag, note) index below serves lookups by tag, including the
+    # filter-by-tag list, so the tag column needs no index of its own.
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False,
+                            related_name="note_tags")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tag", "note"],
+                                    name="notes_notetag_tag_note_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.note_id}: {self.tag_id}"
+
+
+class UserTagCount(models.Model):
+    """
+    Model counting the notes of one user that carry a tag.
+
+    Tags are shared by everyone who types the same name, so Tag.note_count
+    covers every user's notes; these rows count each user's own, for the
+    pages that user sees. Like Tag.note_count they are maintained by database
+    triggers (see notes.counters), on the tag assignments and on the owner of
+    a note.
+
+    Fields:
+    - user: ForeignKey to the user whose notes are counted.
+    - tag: ForeignKey to the tag.
+    - note_count: Number of the user's notes carrying the tag.
+    """
+    # The unique (user, tag) index below serves lookups by user, and the
+    # counters' upserts; users stay in the default database when notes are
+    # sharded, so the key is not enforced by a database constraint.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, db_index=False,
+                             db_constraint=False, related_name="+")
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE,
+                            related_name="user_counts")
+    note_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "tag"],
+                                    name="notes_usertagcount_user_tag_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.tag_id} ({self.note_count})"
+
+
+class MinHashBucket(models.Model):
+    """
+    Model representing one LSH band bucket of a note's MinHash signature.
+
+    Every note with content has one row per band. Notes sharing a
+    (band, bucket) pair are candidates for being near-duplicates.
+
+    Fields:
+    - note: ForeignKey to the note the bucket belongs to.
+    - band: Index of the band within the signature.
+    - bucket: Hash of the signature values in that band.
+    """
+    # Upper bound on candidates fetched per lookup, so a template copied
+    # thousands of times cannot turn one lookup into a table scan.
+    MAX_CANDIDATES = 200
+
+    note = models.ForeignKey(Note, on_delete=models.CASCADE,
+                             related_name="minhash_buckets")
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["band", "bucket"])]
+
+    @classmethod
+    def store(cls, signatures, batch_size=1000, using=None):
+        """
+        Writes precomputed signatures and their buckets in batches.
+
+        Each batch is one bulk update of the notes plus one delete and one
+        bulk insert of buckets, inside a single transaction.
+
+        :param signatures: Dictionary mapping note pk to signature.
+        :param batch_size: Number of notes per transaction.
+        :param using: Database holding the notes, such as their shard.
+        """
+        pks = sorted(signatures)
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            notes = [Note(pk=pk, minhash=minhash.to_bytes(signatures[pk]))
+                     for pk in batch]
+            with transaction.atomic(using=using):
+                Note.objects.using(using).bulk_update(notes, ["minhash"])
+                cls.objects.using(using).filter(note_id__in=batch).delete()
+                cls.objects.using(using).bulk_create(
+                    cls(note_id=pk, band=band, bucket=bucket)
+                    for pk in batch
+                    for band, bucket in minhash.bands(signatures[pk])
+                )
+
+    @classmethod
+    def replace_for(cls, note, signature):
+        """
+        Replaces a note's buckets with those of a new signature.
+
+        :param note: The saved note.
+        :param signature: The note's MinHash signature, or None.
+        """
+        db = note._state.db
+        cls.objects.using(db).filter(note=note).delete()
+        cls.objects.using(db).bulk_create(
+            cls(note=note, band=band, bucket=bucket)
+            for band, bucket in minhash.bands(signature)
+        )
+
+    def __str__(self):
+        return f"{self.note_id}: band {self.band}"
+
+
+class Attachment(models.Model):
+    """
+    Model representing a file attached to a note.
+
+    The file itself is stored once per distinct content, named by its
+    SHA-256 digest (see notes.attachments), so attaching the same screenshot
+    to many notes takes the space of one copy. Rows only point at the file;
+    files no row refers to any more are removed by prune_attachments.
+
+    Fields:
+    - note: ForeignKey to the note the file is attached to.
+    - name: The file name as uploaded.
+    - content_type: The MIME type guessed from the name.
+    - size: Size of the file in bytes.
+    - sha256: Hex SHA-256 digest of the content, which names the stored file.
+    - created_at: DateTimeField set when the file was attached.
+
+    Methods:
+        path(): Returns the path of the stored file.
+        get_absolute_url(): Returns the download URL.
+    """
+    note = models.ForeignKey(Note, on_delete=models.CASCADE,
+                             related_name="attachments")
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def path(self):
+        """
+        Returns the path of the stored file.
+
+        :return: pathlib.Path of the content-addressed file.
+        """
+        return attachments.blob_path(self.sha256)
+
+    def get_absolute_url(self):
+        return reverse("attachment_download", args=[self.note_id, self.pk, self.name])
+
+    def __str__(self):
+        return self.name
+
+
+class ArchivedNote(models.Model):
+    """
+    Model representing a note moved out of the notes table by archive_notes.
+
+    Archived notes keep their id, so links to them keep working: the detail
+    view falls back to this table, and editing an archived note moves it back
+    into the notes table. The table is in the default database unless a
+    separate archive database is configured (see notes.archive).
+
+    Fields:
+    - id: The id the note had in the notes table.
+    - user, title, content, category, created_at, modified_at, minhash: As on
+    Note, copied unchanged.
+    - tag_names: The names of the note's tags, separated by commas.
+    - archived_at: DateTimeField set when the note was archived.
+
+    Methods:
+        tag_list(): Returns the names of the note's tags.
+        rendered_content(): Returns the content as HTML.
+    """
+    # Users and categories may be in another database, and deleting them must
+    # not reach into the archive, so neither key is enforced or cascaded here;
+    # the archive is cleaned up by a post_delete handler instead.
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.DO_NOTHING, null=True,
+                             blank=True, db_index=False, db_constraint=False,
+                             related_name="+")
+    title = models.CharField(max_length=100)
+    content = models.TextField()
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING,
+                                 null=True, blank=True, db_constraint=False,
+                                 related_name="+")
+    tag_names = models.TextField(blank=True, default="")
+    minhash = models.BinaryField(default=b"", editable=False)
+    created_at = models.DateTimeField()
+    modified_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "created_at"])]
+
+    def tag_list(self):
+        """
+        Returns the names of the note's tags.
+
+        :return: List of tag names.
+        """
+        return [name for name in self.tag_names.split(", ") if name]
+
+    def rendered_content(self):
+        """
+        Returns the content rendered to sanitized HTML.
+
+        Archived notes are rarely viewed, so their HTML is not cached.
+
+        :return: The HTML, marked safe for templates.
+        """
+        return mark_safe(rendering.render(self.content))
+
+    def get_absolute_url(self):
+        return reverse("note_detail", args=[str(self.id)])
+
+    def __str__(self):
+        return self.title
+
+
+class NoteTombstone(models.Model):
+    """
+    Model recording a note that left the notes table, deleted or archived,
+    so offline clients drop their copy of it (see notes.sync).
+
+    Tombstones stay in the default database with the users, whether notes
+    are sharded or not, and are removed by prune_tombstones once no client
+    can still need them.
+
+    Fields:
+    - note_id: The id the note had.
+    - user: ForeignKey to the user who owned the note.
+    - deleted_at: DateTimeField set when the note left the table.
+    """
+    note_id = models.BigIntegerField()
+    # The (user, deleted_at) index below also serves lookups by user alone.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             db_index=False, related_name="+")
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "deleted_at"])]
+
+    def __str__(self):
+        return f"{self.note_id}: deleted {self.deleted_at}"
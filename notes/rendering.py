@@ -0,0 +1,95 @@
+"""
+Rendering of note content to HTML.
+
+Content is rendered as Markdown when the optional ``markdown`` and ``nh3``
+packages are installed and NOTES_MARKDOWN is on; the HTML is then sanitized
+by nh3 so notes cannot inject scripts or markup into the page. Otherwise the
+content is escaped and split into paragraphs, as plain text.
+
+Rendering is not free for long notes, so the result is cached on the note
+together with content_hash(), a hash of the content and of the renderer that
+produced it. Bumping RENDERER_VERSION, or installing or removing Markdown
+support, changes every hash; ``manage.py rerender_notes`` then refreshes the
+cached HTML in bulk.
+
+The Markdown packages are imported on first use, not when the app loads, so
+worker processes that only serve cached HTML never pay for importing them.
+
+This module does not touch the database, so it can run in worker processes.
+"""
+
+import functools
+import hashlib
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.utils.html import linebreaks
+
+# Bump when the rendering rules change, to invalidate all cached HTML.
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists", "nl2br"]
+
+
+@functools.lru_cache(maxsize=None)
+def markdown_available():
+    """
+    Returns True if the markdown and nh3 packages are installed, without
+    importing them.
+    """
+    return find_spec("markdown") is not None and find_spec("nh3") is not None
+
+
+@functools.lru_cache(maxsize=None)
+def _markdown():
+    import markdown
+    import nh3
+
+    return markdown, nh3
+
+
+def backend():
+    """
+    Returns the name of the renderer in use: "markdown" or "text".
+    """
+    if markdown_available() and getattr(settings, "NOTES_MARKDOWN", True):
+        return "markdown"
+    return "text"
+
+
+def content_hash(content, renderer=None):
+    """
+    Returns the cache key of the HTML for ``content``.
+    :param content: Note content.
+    :param renderer: Renderer name; defaults to backend().
+    :return: Hex digest covering the content and the renderer version.
+    """
+    renderer = renderer or backend()
+    digest = hashlib.sha256(f"{renderer}:{RENDERER_VERSION}\n".encode())
+    digest.update(content.encode())
+    return digest.hexdigest()
+
+
+def render(content, renderer=None):
+    """
+    Renders note content to sanitized HTML.
+    :param content: Note content.
+    :param renderer: Renderer name; defaults to backend().
+    :return: HTML string, safe to output unescaped.
+    """
+    if (renderer or backend()) == "markdown":
+        markdown, nh3 = _markdown()
+        html = markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS)
+        return nh3.clean(html)
+    return linebreaks(content, autoescape=True)
+
+
+def render_rows(rows, renderer):
+    """
+    Renders a chunk of notes.
+    :param rows: List of (pk, content) pairs.
+    :param renderer: Renderer name.
+    :return: List of (pk, html, hash) tuples.
+    """
+    return [(pk, render(content, renderer), content_hash(content, renderer))
+            for pk, content in rows]
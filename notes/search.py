@@ -0,0 +1,327 @@
+import heapq
+import itertools
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models.expressions import RawSQL
+
+from . import sharding
+from .models import ArchivedNote, Note
+
+TRIGRAM_TABLE = "notes_note_title_trigram"
+
+# The index is an external-content FTS5 table: it stores only the trigram
+# postings and reads titles back from notes_note. The triggers keep it in step
+# with every insert, update and delete, including bulk queryset operations.
+_TRIGRAM_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TRIGRAM_TABLE} USING fts5("
+    f"title, content='notes_note', content_rowid='id', tokenize='trigram')"
+)
+_TRIGGERS = {
+    f"{TRIGRAM_TABLE}_ai": (
+        f"AFTER INSERT ON notes_note BEGIN "
+        f"INSERT INTO {TRIGRAM_TABLE}(rowid, title) "
+        f"VALUES (new.id, new.title); END"
+    ),
+    f"{TRIGRAM_TABLE}_ad": (
+        f"AFTER DELETE ON notes_note BEGIN "
+        f"INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}, rowid, title) "
+        f"VALUES ('delete', old.id, old.title); END"
+    ),
+    f"{TRIGRAM_TABLE}_au": (
+        f"AFTER UPDATE OF title ON notes_note BEGIN "
+        f"INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}, rowid, title) "
+        f"VALUES ('delete', old.id, old.title); "
+        f"INSERT INTO {TRIGRAM_TABLE}(rowid, title) "
+        f"VALUES (new.id, new.title); END"
+    ),
+}
+
+# A user's autocomplete goes through a second index scoped by owner: a plain
+# table of (user_id, trigram, note_id) rows, so a query reads only the
+# postings of that user's notes however many other users' titles match.
+# Triggers cannot use WITH clauses, so they cut titles into trigrams by
+# joining a table of character offsets; titles beyond MAX_TITLE_OFFSET
+# characters (far past Note.title's 100) are only indexed up to there.
+USER_TRIGRAM_TABLE = "notes_note_user_trigram"
+OFFSET_TABLE = "notes_trigram_offset"
+MAX_TITLE_OFFSET = 1000
+
+_USER_TRIGRAM_TABLES_SQL = [
+    f"CREATE TABLE IF NOT EXISTS {OFFSET_TABLE} (i INTEGER PRIMARY KEY)",
+    f"INSERT OR IGNORE INTO {OFFSET_TABLE}(i) "
+    f"WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n "
+    f"WHERE i < {MAX_TITLE_OFFSET}) SELECT i FROM n",
+    f"CREATE TABLE IF NOT EXISTS {USER_TRIGRAM_TABLE} ("
+    f"user_id INTEGER NOT NULL, trigram TEXT NOT NULL, note_id INTEGER NOT NULL, "
+    f"PRIMARY KEY (user_id, trigram, note_id)) WITHOUT ROWID",
+]
+
+
+def _add_user_trigrams(row, source=OFFSET_TABLE):
+    """
+    Returns the SQL inserting the user trigram rows of notes.
+    :param row: ``new`` in a trigger, or ``notes_note`` when rebuilding.
+    :param source: Tables the rows are read from.
+    """
+    return (f"INSERT OR IGNORE INTO {USER_TRIGRAM_TABLE}(user_id, trigram, note_id) "
+            f"SELECT {row}.user_id, lower(substr({row}.title, i, 3)), {row}.id "
+            f"FROM {source} WHERE i <= length({row}.title) - 2 "
+            f"AND {row}.user_id IS NOT NULL")
+
+
+# Rows are deleted by their whole key, so the cost does not grow with the
+# number of notes the owner has.
+_REMOVE_USER_TRIGRAMS = (
+    f"DELETE FROM {USER_TRIGRAM_TABLE} WHERE user_id = old.user_id "
+    f"AND note_id = old.id AND trigram IN ("
+    f"SELECT lower(substr(old.title, i, 3)) FROM {OFFSET_TABLE} "
+    f"WHERE i <= length(old.title) - 2)"
+)
+
+_USER_TRIGGERS = {
+    f"{USER_TRIGRAM_TABLE}_ai": (
+        f"AFTER INSERT ON notes_note BEGIN {_add_user_trigrams('new')}; END"
+    ),
+    f"{USER_TRIGRAM_TABLE}_ad": (
+        f"AFTER DELETE ON notes_note BEGIN {_REMOVE_USER_TRIGRAMS}; END"
+    ),
+    f"{USER_TRIGRAM_TABLE}_au": (
+        f"AFTER UPDATE OF title, user_id ON notes_note BEGIN "
+        f"{_REMOVE_USER_TRIGRAMS}; {_add_user_trigrams('new')}; END"
+    ),
+}
+
+_USER_TRIGRAM_REBUILD_SQL = [
+    f"DELETE FROM {USER_TRIGRAM_TABLE}",
+    _add_user_trigrams("notes_note", f"notes_note JOIN {OFFSET_TABLE}"),
+]
+
+# Trigram queries need at least three characters to hit the index.
+MIN_TRIGRAM_LENGTH = 3
+
+# How many index hits to look at per requested result. Ranking only looks at
+# this window, which keeps the cost of a query independent of table size.
+CANDIDATES_PER_RESULT = 5
+
+# Most archived matches of a user looked at; the archive has no index.
+USER_SCAN_LIMIT = 5000
+
+
+def install_trigram_index(using=None):
+    """
+    Creates the trigram indexes and their triggers if they are missing.
+
+    SQLite migrations that rebuild notes_note drop the triggers along with the
+    old table, so this runs after every migrate as well as from the migration
+    that introduced the index. When a trigger had to be recreated the index is
+    rebuilt from notes_note, since writes may have been missed in between.
+    The per-user index needs the notes' owner, so it is left out while
+    migrating through the versions of notes_note that had none.
+    :param using: Database connection; defaults to the default connection.
+    :return: True if an index was (re)built, False otherwise.
+    """
+    conn = using or connection
+    if conn.vendor != "sqlite":
+        return False
+    if "notes_note" not in conn.introspection.table_names():
+        return False
+    with conn.cursor() as cursor:
+        columns = {column.name for column in
+                   conn.introspection.get_table_description(cursor, "notes_note")}
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = 'notes_note'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        rebuilt = False
+        missing = [name for name in _TRIGGERS if name not in existing]
+        if missing:
+            cursor.execute(_TRIGRAM_TABLE_SQL)
+            for name in missing:
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {name} {_TRIGGERS[name]}"
+                )
+            cursor.execute(
+                f"INSERT INTO {TRIGRAM_TABLE}({TRIGRAM_TABLE}) VALUES ('rebuild')"
+            )
+            rebuilt = True
+        missing = [name for name in _USER_TRIGGERS if name not in existing]
+        if missing and "user_id" in columns:
+            for sql in _USER_TRIGRAM_TABLES_SQL:
+                cursor.execute(sql)
+            for name in missing:
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {name} {_USER_TRIGGERS[name]}"
+                )
+            for sql in _USER_TRIGRAM_REBUILD_SQL:
+                cursor.execute(sql)
+            rebuilt = True
+    return rebuilt
+
+
+def uninstall_trigram_index(using=None):
+    """
+    Drops the trigram indexes and their triggers.
+    :param using: Database connection; defaults to the default connection.
+    """
+    conn = using or connection
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for name in [*_TRIGGERS, *_USER_TRIGGERS]:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for table in [TRIGRAM_TABLE, USER_TRIGRAM_TABLE, OFFSET_TABLE]:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def trigram_match(query):
+    """
+    Builds an FTS5 phrase query that matches ``query`` anywhere in a title.
+    :param query: Text typed by the user.
+    :return: The MATCH expression.
+    """
+    return '"' + query.replace('"', '""') + '"'
+
+
+def user_trigram_match(query, user_id):
+    """
+    Builds a subquery of the ids of a user's notes whose titles hold every
+    trigram of ``query``, read from the per-user trigram index.
+
+    The trigrams may be spread over the title, so callers still check that
+    the title contains the query. Case is folded the way SQLite's lower()
+    and LIKE fold it: ASCII letters only.
+    :param query: Text of at least MIN_TRIGRAM_LENGTH characters.
+    :param user_id: Primary key of the owner.
+    :return: RawSQL usable with ``pk__in``.
+    """
+    folded = "".join(char.lower() if char.isascii() else char for char in query)
+    trigrams = dict.fromkeys(folded[i:i + 3] for i in range(len(folded) - 2))
+    select = f"SELECT note_id FROM {USER_TRIGRAM_TABLE} WHERE user_id = %s AND trigram = %s"
+    params = [value for trigram in trigrams for value in (user_id, trigram)]
+    return RawSQL(" INTERSECT ".join([select] * len(trigrams)), params)
+
+
+def filter_titles(queryset, query):
+    """
+    Narrows a note queryset to titles containing ``query``.
+
+    Unlike ``title__icontains`` this goes through the trigram index, so the
+    database never scans the whole table. Queries shorter than a trigram are
+    matched as a prefix instead.
+    :param queryset: Queryset of notes.
+    :param query: Text to look for.
+    :return: The filtered queryset.
+    """
+    query = query.strip()
+    if len(query) < MIN_TRIGRAM_LENGTH or connection.vendor != "sqlite":
+        return queryset.filter(title__istartswith=query)
+    matching = RawSQL(
+        f"SELECT rowid FROM {TRIGRAM_TABLE} WHERE {TRIGRAM_TABLE} MATCH %s",
+        [trigram_match(query)],
+    )
+    return queryset.filter(pk__in=matching)
+
+
+def _rank(query, title):
+    lowered = title.lower()
+    position = lowered.find(query.lower())
+    return (position != 0, position, len(title), lowered)
+
+
+def autocomplete(query, limit=10, user=None, include_archived=False):
+    """
+    Returns notes whose titles contain ``query``, prefix matches first.
+
+    Queries of three characters or more go through the trigram index and only
+    look at a bounded window of index hits. Shorter queries fall back to a
+    prefix match, which stops scanning as soon as enough rows are found.
+
+    When ``user`` is given only their notes are searched, through the
+    per-user trigram index, so the cost follows the size of their own
+    notes whatever the rest of the table holds.
+
+    When notes are sharded the search runs on every shard that may hold
+    matches, in parallel, and the ranked results are merged. Archived notes
+    are only searched on request, by scanning the owner's archived rows.
+    :param query: Text typed by the user.
+    :param limit: Maximum number of results.
+    :param user: Optional owner to restrict the search to.
+    :param include_archived: Whether to search archived notes too.
+    :return: List of (pk, title) tuples.
+    """
+    query = query.strip()
+    if not query or limit <= 0:
+        return []
+    if user is not None and not user.is_authenticated:
+        return []
+    if not sharding.enabled():
+        results = [_autocomplete(query, limit, user, DEFAULT_DB_ALIAS)]
+    else:
+        results = sharding.map_shards(
+            lambda alias: _autocomplete(query, limit, user, alias),
+            sharding.shards_for_user(user),
+        )
+    if include_archived:
+        results.append(_autocomplete_archive(query, limit, user))
+    if len(results) == 1:
+        return results[0]
+    merged = heapq.merge(*results, key=lambda row: _rank(query, row[1]))
+    return list(itertools.islice(merged, limit))
+
+
+def _autocomplete(query, limit, user, using):
+    """
+    Runs autocomplete() on one database.
+    :return: List of (pk, title) tuples, best match first.
+    """
+    notes = Note.objects.using(using)
+    if user is not None:
+        notes = notes.filter(user=user)
+    conn = connections[using]
+    if len(query) < MIN_TRIGRAM_LENGTH or conn.vendor != "sqlite":
+        matches = list(
+            notes.filter(title__istartswith=query)
+            .values_list("pk", "title")[:limit]
+        )
+        matches.sort(key=lambda row: _rank(query, row[1]))
+        return matches
+
+    if user is not None:
+        candidates = list(
+            notes.filter(pk__in=user_trigram_match(query, user.pk),
+                         title__icontains=query)
+            .values_list("pk", "title")[:limit * CANDIDATES_PER_RESULT]
+        )
+        candidates.sort(key=lambda row: _rank(query, row[1]))
+        return candidates[:limit]
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, title FROM {TRIGRAM_TABLE} "
+            f"WHERE {TRIGRAM_TABLE} MATCH %s LIMIT %s",
+            [trigram_match(query), limit * CANDIDATES_PER_RESULT])
+        candidates = cursor.fetchall()
+    candidates.sort(key=lambda row: _rank(query, row[1]))
+    return [tuple(row) for row in candidates[:limit]]
+
+
+def _autocomplete_archive(query, limit, user):
+    """
+    Runs autocomplete() on archived notes.
+
+    The archive has no trigram index; the owner's archived rows are scanned
+    through the (user, created_at) index instead, up to USER_SCAN_LIMIT
+    matches.
+    :return: List of (pk, title) tuples, best match first.
+    """
+    archived = ArchivedNote.objects.all()
+    if user is not None:
+        archived = archived.filter(user=user)
+    lookup = "istartswith" if len(query) < MIN_TRIGRAM_LENGTH else "icontains"
+    matches = list(
+        archived.filter(**{f"title__{lookup}": query})
+        .values_list("pk", "title")[:USER_SCAN_LIMIT]
+    )
+    matches.sort(key=lambda row: _rank(query, row[1]))
+    return matches[:limit]
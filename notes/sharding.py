@@ -0,0 +1,339 @@
+"""
+Optional sharding of notes across several SQLite databases.
+
+Setting NOTES_SHARD_COUNT adds one database alias per shard
+(``notes_shard_0``, ``notes_shard_1``, ...) and installs ShardRouter. Notes
+and the rows that hang off them - tags, tag assignments and counts,
+similarity buckets and attachments - are stored on the shard picked by the
+shard key; users and categories stay in the default database and are
+referenced without foreign key constraints.
+
+NOTES_SHARD_KEY chooses the key:
+
+- ``"user"`` (the default) keeps each user's notes together, so every view
+  reads a single shard.
+- ``"id"`` spreads notes evenly by their id, so list and search queries run
+  on every shard in parallel and the sorted results are merged.
+
+Shards are picked with jump consistent hashing: going from N to N + 1 shards
+moves only about 1/(N + 1) of the notes, which ``manage.py rebalance_shards``
+copies across.
+"""
+
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+SHARD_ALIAS_PREFIX = "notes_shard_"
+
+# Models of the notes app that live on the shards with the notes.
+SHARDED_MODELS = {"note", "notetag", "tag", "usertagcount", "minhashbucket",
+                  "attachment"}
+
+# Layout of generated ids: milliseconds since ID_EPOCH_MS, then the node
+# number, then a per-millisecond sequence. 41 bits of milliseconds last until
+# 2093, and the ids stay positive 64-bit integers.
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+
+
+def shard_aliases():
+    """
+    Returns the database aliases of the configured shards, in shard order.
+    """
+    aliases = [alias for alias in settings.DATABASES
+               if alias.startswith(SHARD_ALIAS_PREFIX)]
+    return sorted(aliases, key=lambda alias: int(alias[len(SHARD_ALIAS_PREFIX):]))
+
+
+def enabled():
+    """
+    Returns True if notes are sharded.
+    """
+    return bool(shard_aliases())
+
+
+def shard_key():
+    return getattr(settings, "NOTES_SHARD_KEY", "user")
+
+
+def jump_hash(key, buckets):
+    """
+    Maps a 64-bit key to one of ``buckets`` buckets.
+
+    This is Lamping and Veach's jump consistent hash: when the number of
+    buckets grows by one, a key either stays where it was or moves to the new
+    bucket.
+    :param key: Non-negative integer below 2 ** 64.
+    :param buckets: Number of buckets.
+    :return: Bucket number, from 0 to buckets - 1.
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(key, aliases=None):
+    """
+    Returns the alias of the shard holding ``key``.
+    :param key: A user id or note id, depending on NOTES_SHARD_KEY.
+    :param aliases: Shard aliases; defaults to the configured shards.
+    :return: Database alias.
+    """
+    aliases = shard_aliases() if aliases is None else aliases
+    digest = hashlib.blake2b(str(key).encode(), digest_size=8).digest()
+    return aliases[jump_hash(int.from_bytes(digest, "little"), len(aliases))]
+
+
+def shard_for_note(note, aliases=None):
+    """
+    Returns the alias of the shard a note belongs on.
+    """
+    key = note.user_id if shard_key() == "user" else note.pk
+    return shard_for(key, aliases)
+
+
+def shards_for_user(user):
+    """
+    Returns the aliases of the shards that may hold notes of ``user``.
+    :param user: A user, or None for every shard.
+    """
+    if user is not None and shard_key() == "user":
+        return [shard_for(user.pk)]
+    return shard_aliases()
+
+
+def route(queryset, user=None, pk=None):
+    """
+    Pins a note queryset to the one shard it can match, where that is known.
+
+    The user decides the shard when notes are sharded by owner, and the
+    primary key when they are sharded by id. Querysets that cannot be pinned
+    are left alone and go through fetch() instead.
+    :param queryset: Queryset of a sharded model.
+    :param user: The owner the queryset is restricted to, if any.
+    :param pk: The note id the queryset is restricted to, if any.
+    :return: The queryset, possibly bound to a shard.
+    """
+    if not enabled() or queryset._db is not None:
+        return queryset
+    key = user.pk if shard_key() == "user" and user is not None else None
+    if shard_key() == "id" and pk is not None:
+        key = pk
+    if key is None:
+        return queryset
+    return queryset.using(shard_for(key))
+
+
+class IdGenerator:
+    """
+    Generates roughly time-ordered 64-bit ids that are unique across shards.
+
+    Ids are made of a millisecond timestamp, the node number and a sequence
+    number, so generators on different nodes never need to coordinate as
+    long as each has its own node number. Ids sort by creation time, which
+    keeps inserts at the end of each shard's primary key index.
+    """
+
+    def __init__(self, node):
+        if not 0 <= node < 1 << NODE_BITS:
+            raise ValueError(f"Node number must be below {1 << NODE_BITS}.")
+        self.node = node
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            now = int(time.time() * 1000) - ID_EPOCH_MS
+            # Never go backwards, even if the clock does.
+            now = max(now, self.last_ms)
+            if now == self.last_ms:
+                self.sequence = (self.sequence + 1) & ((1 << SEQUENCE_BITS) - 1)
+                if self.sequence == 0:
+                    # 4096 ids in one millisecond: borrow the next one.
+                    now += 1
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            timestamp = now << (NODE_BITS + SEQUENCE_BITS)
+            return timestamp | (self.node << SEQUENCE_BITS) | self.sequence
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def next_id():
+    """
+    Returns a new globally unique note id.
+
+    The node number comes from NOTES_NODE_ID, which every process that
+    creates notes needs its own value of: two processes sharing a node
+    number can hand out the same id in the same millisecond.
+    :raises ImproperlyConfigured: If NOTES_NODE_ID is not set.
+    """
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            node = getattr(settings, "NOTES_NODE_ID", None)
+            if node is None:
+                raise ImproperlyConfigured(
+                    f"Creating notes with sharding on needs NOTES_NODE_ID: a number below "
+                    f"{1 << NODE_BITS} that no other process creating notes uses."
+                )
+            _generator = IdGenerator(node)
+    return _generator()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def map_shards(function, aliases=None):
+    """
+    Calls ``function(alias)`` for every shard, in parallel.
+
+    The calls run on a long-lived thread pool, so each thread keeps its
+    connections to the shards open between requests.
+    :param function: Callable taking a database alias.
+    :param aliases: Shards to run on; defaults to every shard.
+    :return: List of results, in the order of ``aliases``.
+    """
+    global _executor
+    aliases = shard_aliases() if aliases is None else list(aliases)
+    if len(aliases) == 1:
+        return [function(aliases[0])]
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, "NOTES_SHARD_WORKERS", None)
+            _executor = ThreadPoolExecutor(
+                max_workers=workers or len(shard_aliases()),
+                thread_name_prefix="notes-shards",
+            )
+    return list(_executor.map(function, aliases))
+
+
+def imerge(results, ordering):
+    """
+    Lazily merges iterables that are each sorted by ``ordering``.
+    :param results: Iterable of sorted iterables of model instances.
+    :param ordering: Field names as given to order_by(), all in the same
+        direction.
+    :return: Iterator over the merged items.
+    """
+    if not ordering:
+        return itertools.chain(*results)
+    descending = {name.startswith("-") for name in ordering}
+    if len(descending) > 1:
+        raise ValueError("Merged orderings must all go the same direction.")
+    key = attrgetter(*(name.lstrip("-") for name in ordering))
+    return heapq.merge(*results, key=key, reverse=descending.pop())
+
+
+def merge_sorted(results, ordering, limit=None):
+    """
+    Merges per-shard result lists that are each sorted by ``ordering``.
+    :param results: Iterable of sorted lists of model instances.
+    :param ordering: Field names as given to order_by(), all in the same
+        direction.
+    :param limit: Maximum number of items to return.
+    :return: Merged list.
+    """
+    return list(itertools.islice(imerge(results, ordering), limit))
+
+
+def fetch(queryset):
+    """
+    Evaluates a note queryset on every shard and merges the results.
+
+    Querysets already pinned to a database, and all querysets when sharding
+    is off, are returned unchanged. Otherwise the query runs on each shard in
+    parallel and the sorted results are merged, keeping the queryset's
+    ordering and any ``[:n]`` limit.
+    :param queryset: Queryset of a sharded model.
+    :return: The queryset, or a list of instances.
+    """
+    if not enabled() or queryset._db is not None:
+        return queryset
+    query = queryset.query
+    if query.low_mark:
+        raise ValueError("Offsets are not supported across shards.")
+    limit = query.high_mark
+    results = map_shards(lambda alias: list(queryset.using(alias)))
+    return merge_sorted(results, query.order_by, limit)
+
+
+def iterate(queryset, chunk_size):
+    """
+    Streams a note queryset from every shard, merged, in bounded memory.
+
+    Like fetch(), but rows are read ``chunk_size`` at a time with
+    QuerySet.iterator() on each shard, and merged as they are consumed.
+    :param queryset: Queryset of a sharded model.
+    :param chunk_size: Rows fetched per database round trip.
+    :return: Iterator over the instances.
+    """
+    if not enabled() or queryset._db is not None:
+        return queryset.iterator(chunk_size=chunk_size)
+    return imerge(
+        [queryset.using(alias).iterator(chunk_size=chunk_size)
+         for alias in shard_aliases()],
+        queryset.query.order_by,
+    )
+
+
+class ShardRouter:
+    """
+    Database router sending notes and their dependent rows to their shard.
+
+    Reads and writes of a sharded model follow the instance they concern: a
+    new note goes to the shard of its key, and anything reached from a note
+    (its tags, buckets) comes from the note's shard. Querysets with no
+    instance to go by use the default database unless pinned with route() or
+    fanned out with fetch(). Every other model lives in the default database.
+    """
+
+    def _is_sharded(self, model):
+        opts = model._meta
+        return opts.app_label == "notes" and opts.model_name in SHARDED_MODELS
+
+    def _db_for(self, model, hints):
+        if not self._is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is None or not self._is_sharded(instance):
+            return None
+        if instance._meta.model_name == "note" and instance._state.adding:
+            return shard_for_note(instance)
+        return instance._state.db
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Notes point at users and categories in the default database.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not db.startswith(SHARD_ALIAS_PREFIX):
+            return None
+        if app_label != "notes":
+            return False
+        # Data migrations of the notes app check for their tables themselves.
+        return model_name is None or model_name in SHARDED_MODELS
@@ -0,0 +1,47 @@
+// Type-ahead for note titles on the note list page.
+(function () {
+    var input = document.getElementById("note-search");
+    if (!input) {
+        return;
+    }
+    var results = document.getElementById(input.getAttribute("list"));
+    var url = input.dataset.autocompleteUrl;
+    var extra = input.dataset.includeArchived ? "&archived=1" : "";
+    var urls = {};
+    var timer = null;
+    var pending = null;
+
+    function suggest() {
+        var query = input.value.trim();
+        if (!query) {
+            results.innerHTML = "";
+            return;
+        }
+        if (pending) {
+            pending.abort();
+        }
+        pending = new AbortController();
+        fetch(url + "?q=" + encodeURIComponent(query) + extra, {signal: pending.signal})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                results.innerHTML = "";
+                urls = {};
+                data.results.forEach(function (note) {
+                    var option = document.createElement("option");
+                    option.value = note.title;
+                    results.appendChild(option);
+                    urls[note.title] = note.url;
+                });
+            })
+            .catch(function () {});
+    }
+
+    input.addEventListener("input", function () {
+        if (urls[input.value]) {
+            window.location = urls[input.value];
+            return;
+        }
+        clearTimeout(timer);
+        timer = setTimeout(suggest, 150);
+    });
+})();
@@ -0,0 +1,52 @@
+// Autosave of the note being edited. Drafts are posted a moment after the
+// user stops typing, and at most every few seconds while they keep typing;
+// the server buffers them and writes them to the note in batches.
+(function () {
+    var form = document.getElementById("note-form");
+    if (!form) {
+        return;
+    }
+    var url = form.dataset.autosaveUrl;
+    var status = document.getElementById("autosave-status");
+    var idleDelay = 1000;
+    var maxDelay = 5000;
+    var timer = null;
+    var firstChange = null;
+    var saving = false;
+    var dirty = false;
+
+    function save() {
+        timer = null;
+        firstChange = null;
+        if (saving) {
+            dirty = true;
+            return;
+        }
+        saving = true;
+        dirty = false;
+        var data = new FormData(form);
+        fetch(url, {method: "POST", body: data, credentials: "same-origin", keepalive: true})
+            .then(function (response) {
+                status.textContent = response.ok ? "Draft saved" : "Draft not saved";
+            })
+            .catch(function () {
+                status.textContent = "Offline, draft not saved";
+            })
+            .then(function () {
+                saving = false;
+                if (dirty) {
+                    save();
+                }
+            });
+    }
+
+    form.addEventListener("input", function () {
+        var now = Date.now();
+        firstChange = firstChange || now;
+        clearTimeout(timer);
+        timer = setTimeout(save, Math.min(idleDelay, firstChange + maxDelay - now));
+    });
+    form.addEventListener("submit", function () {
+        clearTimeout(timer);
+    });
+})();
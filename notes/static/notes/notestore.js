@@ -0,0 +1,123 @@
+// The browser's copy of the signed-in user's notes, kept in IndexedDB. Used
+// by the pages (offline.js) and by the service worker (sw.js), which loads
+// it with importScripts().
+var NoteStore = (function () {
+    var NAME = "sticky-notes";
+    var VERSION = 1;
+    var opening = null;
+
+    function done(request) {
+        return new Promise(function (resolve, reject) {
+            request.onsuccess = function () {
+                resolve(request.result);
+            };
+            request.onerror = function () {
+                reject(request.error);
+            };
+        });
+    }
+
+    function open() {
+        if (!opening) {
+            var request = indexedDB.open(NAME, VERSION);
+            request.onupgradeneeded = function () {
+                request.result.createObjectStore("notes", {keyPath: "id"});
+                request.result.createObjectStore("meta");
+            };
+            opening = done(request);
+        }
+        return opening;
+    }
+
+    // Runs body(stores) in one transaction; resolves with its result once
+    // the transaction has committed.
+    function transaction(mode, body) {
+        return open().then(function (db) {
+            return new Promise(function (resolve, reject) {
+                var tx = db.transaction(["notes", "meta"], mode);
+                var result = body(tx.objectStore("notes"), tx.objectStore("meta"));
+                tx.oncomplete = function () {
+                    resolve(result);
+                };
+                tx.onerror = tx.onabort = function () {
+                    reject(tx.error);
+                };
+            });
+        });
+    }
+
+    function get(store, key) {
+        return transaction("readonly", function (notes, meta) {
+            return done((store === "notes" ? notes : meta).get(key));
+        });
+    }
+
+    return {
+        // Cache Storage holding the note list page and static files.
+        CACHE: "sticky-notes-pages",
+
+        // Cache key of the note list page of a user.
+        listKey: function (listUrl, user) {
+            return listUrl + "?user=" + encodeURIComponent(user);
+        },
+
+        // State of the last sync: {cursor, user}, or undefined.
+        state: function () {
+            return get("meta", "state");
+        },
+
+        note: function (id) {
+            return get("notes", id);
+        },
+
+        // All notes, newest first, like the note list.
+        notes: function () {
+            return transaction("readonly", function (notes) {
+                return done(notes.getAll());
+            }).then(function (all) {
+                return all.sort(function (a, b) {
+                    return a.created_at < b.created_at ? 1 : a.created_at > b.created_at ? -1 : b.id - a.id;
+                });
+            });
+        },
+
+        // Applies a response of /sync/ in one transaction. Resolves with
+        // false, having emptied the store, if the copy was another user's;
+        // the caller then has to sync again from scratch.
+        apply: function (changes) {
+            return transaction("readwrite", function (notes, meta) {
+                var outcome = {applied: true};
+                var request = meta.get("state");
+                request.onsuccess = function () {
+                    var state = request.result;
+                    if (state && state.user !== changes.user) {
+                        notes.clear();
+                        meta.clear();
+                        outcome.applied = false;
+                        return;
+                    }
+                    if (changes.reset) {
+                        notes.clear();
+                    }
+                    changes.deleted.forEach(function (id) {
+                        notes.delete(id);
+                    });
+                    changes.notes.forEach(function (note) {
+                        notes.put(note);
+                    });
+                    meta.put({cursor: changes.cursor, user: changes.user}, "state");
+                };
+                return outcome;
+            }).then(function (outcome) {
+                return outcome.applied;
+            });
+        },
+
+        clear: function () {
+            return transaction("readwrite", function (notes, meta) {
+                notes.clear();
+                meta.clear();
+            });
+        }
+    };
+})();
@@ -0,0 +1,142 @@
+// Offline client. Registers the service worker, keeps the browser's copy of
+// the user's notes up to date through /sync/, which only sends what changed
+// since the last visit, and redraws the note list from that copy, as the
+// service worker may have served the list page from its cache.
+(function () {
+    var script = document.getElementById("offline-client");
+    if (!script || !("indexedDB" in window)) {
+        return;
+    }
+    var syncUrl = script.dataset.syncUrl;
+    var user = Number(script.dataset.user);
+    var list = document.getElementById("note-list");
+
+    if ("serviceWorker" in navigator) {
+        navigator.serviceWorker.register(script.dataset.serviceWorkerUrl);
+    }
+
+    // Drops everything kept for the signed-in user.
+    function forget() {
+        var cleared = window.caches ? caches.delete(NoteStore.CACHE) : Promise.resolve();
+        return Promise.all([NoteStore.clear(), cleared]);
+    }
+
+    function element(tag, className, text) {
+        var node = document.createElement(tag);
+        if (className) {
+            node.className = className;
+        }
+        if (text) {
+            node.textContent = text;
+        }
+        return node;
+    }
+
+    // Mirrors notes/_note_item.html.
+    function item(note) {
+        var li = element("li");
+        var link = element("a", null, note.title);
+        link.href = note.url;
+        li.appendChild(link);
+        var content = note.content.length > 100 ? note.content.slice(0, 99) + "…" : note.content;
+        li.appendChild(element("p", null, content));
+        if (note.category || note.tags.length) {
+            var labels = element("p", "note-labels");
+            if (note.category) {
+                labels.appendChild(element("span", "note-category", note.category));
+            }
+            note.tags.forEach(function (tag) {
+                var tagLink = element("a", "note-tag", "#" + tag.name);
+                tagLink.href = tag.url;
+                labels.appendChild(tagLink);
+                labels.appendChild(document.createTextNode(" "));
+            });
+            li.appendChild(labels);
+        }
+        return li;
+    }
+
+    function render() {
+        if (!list) {
+            return Promise.resolve();
+        }
+        return NoteStore.notes().then(function (notes) {
+            var items = document.createDocumentFragment();
+            notes.forEach(function (note) {
+                items.appendChild(item(note));
+            });
+            list.replaceChildren(items);
+        });
+    }
+
+    function sync(state) {
+        var url = syncUrl + "?cursor=" + encodeURIComponent(state ? state.cursor : "");
+        return fetch(url, {credentials: "same-origin"}).then(function (response) {
+            if (response.status === 401) {
+                // Signed out, though the page may have come from the cache;
+                // load it again from the server, which asks to sign in.
+                return forget().then(function () {
+                    window.location.reload();
+                    return null;
+                });
+            }
+            if (!response.ok) {
+                throw new Error("Sync failed: " + response.status);
+            }
+            return response.json();
+        }).then(function (changes) {
+            if (!changes) {
+                return null;
+            }
+            return NoteStore.apply(changes).then(function (applied) {
+                if (changes.user !== user) {
+                    // The page came from the cache but another user is
+                    // signed in now; load it again from the server.
+                    return forget().then(function () {
+                        window.location.reload();
+                        return null;
+                    });
+                }
+                if (!applied) {
+                    // The stored copy was another user's and is gone.
+                    return forget().then(function () {
+                        return sync(null);
+                    });
+                }
+                return changes.more ? sync({cursor: changes.cursor, user: changes.user}) : changes;
+            });
+        });
+    }
+
+    var logout = document.querySelector("form.logout");
+    if (logout) {
+        logout.addEventListener("submit", function (event) {
+            event.preventDefault();
+            forget().catch(function () {}).then(function () {
+                logout.submit();
+            });
+        });
+    }
+
+    NoteStore.state()
+        .then(function (state) {
+            if (state && state.user !== user) {
+                // Another user signed in on this browser; start over.
+                return forget().then(function () {
+                    return sync(null);
+                });
+            }
+            // Show the stored notes right away, then whatever changed.
+            return (state ? render() : Promise.resolve()).then(function () {
+                return sync(state);
+            });
+        })
+        .then(function (changes) {
+            if (changes) {
+                return render();
+            }
+        })
+        .catch(function () {
+            // Offline or storage unavailable: the page stays as it is.
+        });
+})();
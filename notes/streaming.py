@@ -0,0 +1,95 @@
+"""
+Streaming rendering of long lists.
+
+render() builds the whole page in memory before the first byte is sent.
+stream_list() instead renders the page around the list once, with a marker
+where the list goes, and then renders the items a chunk at a time as the
+client reads the response. Rows come from the database through
+QuerySet.iterator(), so neither the queryset nor the HTML is ever held in
+memory in full.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template import Context
+from django.template.loader import get_template, render_to_string
+
+from . import sharding
+
+DEFAULT_CHUNK_SIZE = 200
+
+
+def split_page(template_name, context, request):
+    """
+    Renders a page with a marker where the streamed items go.
+
+    The template receives a unique ``stream_marker`` string and must output
+    it, unescaped, once, in place of its item loop.
+    :param template_name: The page template.
+    :param context: Context for the page, without the items.
+    :param request: HTTP request object.
+    :return: The (head, tail) halves of the page.
+    """
+    marker = f"<!--stream-{uuid.uuid4().hex}-->"
+    page = render_to_string(template_name, {**context, "stream_marker": marker},
+                            request)
+    head, found, tail = page.partition(marker)
+    if not found:
+        raise ValueError(f"{template_name} does not output stream_marker.")
+    return head, tail
+
+
+def render_items(items, template_name, chunk_size):
+    """
+    Renders items with a template, yielding the HTML a chunk at a time.
+
+    The item template is compiled once and rendered with a single context,
+    pushing each item onto it in turn.
+    :param items: Iterable of objects, each passed to the template as
+        ``note``.
+    :param template_name: Template rendering one item.
+    :param chunk_size: Number of items per yielded string.
+    :return: Iterator over HTML strings.
+    """
+    template = get_template(template_name).template
+    context = Context(autoescape=True)
+    chunk = []
+    for item in items:
+        with context.push(note=item):
+            chunk.append(template.render(context))
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def stream_list(request, template_name, context, queryset, item_template_name,
+                chunk_size=None):
+    """
+    Returns a streaming response rendering ``queryset`` inside a page.
+
+    The head of the page, up to the list, is the first chunk sent, so the
+    time to the first byte does not depend on the number of rows.
+    :param request: HTTP request object.
+    :param template_name: The page template; see split_page().
+    :param context: Context for the page.
+    :param queryset: Ordered queryset of the items.
+    :param item_template_name: Template rendering one item.
+    :param chunk_size: Items per database fetch and per chunk sent; defaults
+        to NOTES_STREAM_CHUNK_SIZE.
+    :return: StreamingHttpResponse.
+    """
+    chunk_size = chunk_size or getattr(settings, "NOTES_STREAM_CHUNK_SIZE",
+                                       DEFAULT_CHUNK_SIZE)
+    head, tail = split_page(template_name, context, request)
+
+    def content():
+        yield head
+        rows = sharding.iterate(queryset, chunk_size)
+        yield from render_items(rows, item_template_name, chunk_size)
+        yield tail
+
+    return StreamingHttpResponse(content(), content_type="text/html; charset=utf-8")
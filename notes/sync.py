@@ -0,0 +1,193 @@
+"""
+Delta sync of a user's notes for the offline client.
+
+The client keeps a copy of the user's notes in IndexedDB and asks /sync/ for
+what changed since its last visit, so the list and detail pages can be shown
+from the copy and a repeat visit costs one indexed range query instead of a
+full render.
+
+Changes are read by keyset pagination on (modified_at, id), through the
+(user, modified_at) index of the notes table. Notes that leave the table -
+deleted, or moved into the archive - are recorded as NoteTombstone rows,
+read the same way on (deleted_at, id). The cursor handed to the client holds
+both positions.
+
+Rows are stamped before their transaction commits, and autosaves are
+stamped with the time of the draft, up to NOTES_AUTOSAVE_INTERVAL earlier,
+so a row can become visible with a timestamp behind a cursor already handed
+out. Cursors are therefore never moved past NOTES_SYNC_SETTLE seconds ago:
+the most recent changes are sent again on the next sync, which the client
+applies idempotently.
+
+Tombstones older than NOTES_SYNC_RETENTION seconds are removed by
+``manage.py prune_tombstones``; a client whose cursor is older than that
+gets a full resync instead, flagged by ``reset``.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import sharding
+from .models import Note, NoteTombstone
+
+DEFAULT_PAGE_SIZE = 200
+DEFAULT_SETTLE = 30
+DEFAULT_RETENTION = 30 * 24 * 60 * 60
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+Cursor = namedtuple("Cursor", "modified_at note_id deleted_at tombstone_id")
+
+START = Cursor(EPOCH, 0, EPOCH, 0)
+
+
+def _micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def encode(cursor):
+    """
+    Returns the opaque string form of a cursor handed to clients.
+    """
+    return "{}.{}.{}.{}".format(_micros(cursor.modified_at), cursor.note_id,
+                                _micros(cursor.deleted_at), cursor.tombstone_id)
+
+
+def decode(token):
+    """
+    Parses a cursor string made by encode().
+    :param token: The string; empty for a first sync.
+    :return: The Cursor.
+    :raises ValueError: If the string is not a cursor.
+    """
+    if not token:
+        return START
+    parts = [int(part) for part in token.split(".")]
+    # Ids are SQLite integers; larger values fail when they are bound.
+    if not all(0 <= part < 1 << 63 for part in parts):
+        raise ValueError(f"Cursor out of range: {token!r}")
+    modified_at, note_id, deleted_at, tombstone_id = parts
+    try:
+        return Cursor(EPOCH + timedelta(microseconds=modified_at), note_id,
+                      EPOCH + timedelta(microseconds=deleted_at), tombstone_id)
+    except OverflowError as error:
+        raise ValueError(f"Cursor out of range: {token!r}") from error
+
+
+def forget(notes):
+    """
+    Records notes that left the notes table, so clients drop their copies.
+    :param notes: Iterable of (note id, user id) pairs.
+    """
+    NoteTombstone.objects.bulk_create(
+        NoteTombstone(note_id=pk, user_id=user_id) for pk, user_id in notes
+        if user_id is not None
+    )
+
+
+def serialize(note):
+    """
+    Returns the JSON form of a note sent to the client.
+    :param note: Note loaded with_labels().
+    """
+    return {
+        "id": note.pk,
+        "title": note.title,
+        "content": note.content,
+        "html": str(note.rendered_content()),
+        "category": str(note.category) if note.category else None,
+        "tags": [{"name": tag.name, "url": tag.get_absolute_url()}
+                 for tag in note.tags.all()],
+        "url": note.get_absolute_url(),
+        "created_at": note.created_at.isoformat(),
+        "modified_at": note.modified_at.isoformat(),
+    }
+
+
+def _after(queryset, field, position, limit):
+    """
+    Restricts a queryset to the rows after ``position`` in (field, id)
+    order, plus one to tell whether there are more.
+    """
+    moment, pk = position
+    after = Q(**{f"{field}__gt": moment}) | Q(**{field: moment, "pk__gt": pk})
+    queryset = queryset.filter(after)
+    return queryset.order_by(field, "pk")[:limit + 1]
+
+
+def changes(user, cursor=START, limit=None, now=None):
+    """
+    Returns the changes to a user's notes since a cursor.
+    :param user: The user whose notes are synced.
+    :param cursor: Where the last sync ended; START for everything.
+    :param limit: Maximum notes, and tombstones, per response; defaults to
+        NOTES_SYNC_PAGE_SIZE.
+    :param now: Current time, for tests.
+    :return: Dictionary with the changed ``notes``, the ids of ``deleted``
+        notes, the next ``cursor``, whether there are ``more`` changes to
+        fetch right away, and whether the client has to ``reset`` its copy
+        first.
+    """
+    limit = limit or getattr(settings, "NOTES_SYNC_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+    now = now or timezone.now()
+    retention = getattr(settings, "NOTES_SYNC_RETENTION", DEFAULT_RETENTION)
+    reset = cursor == START or cursor.deleted_at < now - timedelta(seconds=retention)
+    if reset:
+        cursor = START
+
+    notes = list(sharding.fetch(_after(Note.objects.for_user(user).with_labels(),
+                                       "modified_at", cursor[:2], limit)))
+    tombstones = []
+    if not reset:
+        tombstones = list(_after(NoteTombstone.objects.filter(user=user),
+                                 "deleted_at", cursor[2:], limit))
+    more = len(notes) > limit or len(tombstones) > limit
+    notes, tombstones = notes[:limit], tombstones[:limit]
+
+    # Ids of notes deleted and then restored from the archive, or reused,
+    # are sent as changes rather than deletions.
+    deleted = {tombstone.note_id for tombstone in tombstones}
+    if deleted:
+        deleted -= set(sharding.fetch(
+            Note.objects.for_user(user).filter(pk__in=deleted)
+            .values_list("pk", flat=True)))
+
+    settled = now - timedelta(seconds=getattr(settings, "NOTES_SYNC_SETTLE", DEFAULT_SETTLE))
+    note_position = cursor[:2]
+    if notes:
+        note_position = (notes[-1].modified_at, notes[-1].pk)
+    tombstone_position = cursor[2:]
+    if tombstones:
+        tombstone_position = (tombstones[-1].deleted_at, tombstones[-1].pk)
+    elif reset or not more:
+        # Tombstones from before a full resync are of no interest, and with
+        # none left to send the cursor moves up to the settled time, so
+        # clients that sync regularly never fall behind the retention.
+        tombstone_position = (settled, 0)
+    if not more:
+        note_position = min(note_position, (settled, 0))
+        tombstone_position = min(tombstone_position, (settled, 0))
+
+    return {
+        "notes": [serialize(note) for note in notes],
+        "deleted": sorted(deleted),
+        "cursor": encode(Cursor(*note_position, *tombstone_position)),
+        "more": more,
+        "reset": reset,
+    }
+
+
+def prune(now=None):
+    """
+    Deletes the tombstones older than NOTES_SYNC_RETENTION.
+    :return: Number of tombstones deleted.
+    """
+    now = now or timezone.now()
+    retention = getattr(settings, "NOTES_SYNC_RETENTION", DEFAULT_RETENTION)
+    deleted, _ = NoteTombstone.objects.filter(
+        deleted_at__lt=now - timedelta(seconds=retention)).delete()
+    return deleted
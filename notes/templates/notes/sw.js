@@ -0,0 +1,189 @@
+{% load static %}// Service worker of the offline client.
+//
+// - Static files are served from the cache and refreshed in the background.
+// - The note list page is served from the cache, refreshed from the server
+//   at most once a day: offline.js on the page brings its notes up to date
+//   from /sync/, which only sends what changed. The cached page is kept per
+//   user, and only served once /sync/ has confirmed who is signed in; a
+//   different user, or none, gets the page from the server and the
+//   previous user's copy is dropped.
+// - Other pages come from the server. When it cannot be reached, the note
+//   list and note pages are drawn from the notes kept in IndexedDB.
+importScripts("{% static 'notes/notestore.js' %}");
+
+var LIST_URL = "{% url 'note_list' %}";
+var SYNC_URL = "{% url 'note_sync' %}";
+var STATIC_URL = "{% get_static_prefix %}";
+var STYLES_URL = "{% static 'notes/styles.css' %}";
+var DETAIL_PATTERN = new RegExp("^" + "{% url 'note_detail' pk=0 %}".replace(/0\/$/, "") + "(\\d+)/$");
+var LIST_MAX_AGE = 24 * 60 * 60 * 1000;
+var PRECACHE = [
+    STYLES_URL,
+    "{% static 'notes/notestore.js' %}",
+    "{% static 'notes/offline.js' %}",
+    "{% static 'notes/autocomplete.js' %}"
+];
+
+self.addEventListener("install", function (event) {
+    event.waitUntil(caches.open(NoteStore.CACHE).then(function (cache) {
+        return cache.addAll(PRECACHE);
+    }).then(function () {
+        return self.skipWaiting();
+    }));
+});
+
+self.addEventListener("activate", function (event) {
+    // Pages cached by an older version of this worker may not match it.
+    event.waitUntil(caches.delete(NoteStore.CACHE).then(function () {
+        return caches.open(NoteStore.CACHE);
+    }).then(function (cache) {
+        return cache.addAll(PRECACHE);
+    }).then(function () {
+        return self.clients.claim();
+    }));
+});
+
+function escape(text) {
+    return String(text).replace(/[&<>"']/g, function (c) {
+        return "&#" + c.charCodeAt(0) + ";";
+    });
+}
+
+function page(title, body) {
+    var html = '<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8">' +
+        '<meta name="viewport" content="width=device-width, initial-scale=1.0">' +
+        "<title>" + escape(title) + '</title><link rel="stylesheet" href="' + STYLES_URL + '"></head>' +
+        '<body><header class="header"><h1> My Django App - Sticky Notes </h1></header>' +
+        '<div id="content"><p class="note-offline">You are offline; this is the copy saved in your browser.</p>' +
+        body + "</div></body></html>";
+    return new Response(html, {headers: {"Content-Type": "text/html; charset=utf-8"}});
+}
+
+function offlineList() {
+    return NoteStore.notes().then(function (notes) {
+        var items = notes.map(function (note) {
+            return '<li><a href="' + escape(note.url) + '">' + escape(note.title) + "</a></li>";
+        });
+        return page("Sticky Notes", "<h2>List of Notes</h2><ul>" + items.join("") + "</ul>");
+    });
+}
+
+function offlineNote(id) {
+    return NoteStore.note(id).then(function (note) {
+        if (!note) {
+            return page("Sticky Notes", '<p>This note is not saved in your browser.</p><a href="' +
+                LIST_URL + '">Back to Notes List</a>');
+        }
+        // The HTML was sanitized by the server when the note was rendered.
+        return page(note.title, "<h2>" + escape(note.title) + '</h2><div class="note-content">' +
+            note.html + "</div><p>Modified at: " + escape(note.modified_at) + '</p><a href="' +
+            LIST_URL + '">Back to Notes List</a>');
+    });
+}
+
+function fromCache(request) {
+    return caches.open(NoteStore.CACHE).then(function (cache) {
+        return cache.match(request);
+    });
+}
+
+function fetchAndCache(request) {
+    return fetch(request).then(function (response) {
+        // Redirects to the login page are not cached.
+        if (response.ok && !response.redirected) {
+            var copy = response.clone();
+            caches.open(NoteStore.CACHE).then(function (cache) {
+                cache.put(request, copy);
+            });
+        }
+        return response;
+    });
+}
+
+function forget() {
+    return Promise.all([NoteStore.clear(), caches.delete(NoteStore.CACHE)]);
+}
+
+// Checks who is signed in through /sync/, applying the changes it sends,
+// and answers with that user's cached list page if it is recent enough.
+function listPage(request) {
+    return NoteStore.state().then(function (state) {
+        if (!state) {
+            return fetch(request);
+        }
+        var url = SYNC_URL + "?cursor=" + encodeURIComponent(state.cursor);
+        return fetch(url, {credentials: "same-origin"}).then(function (response) {
+            if (response.status === 401) {
+                return forget().then(function () {
+                    return fetch(request);
+                });
+            }
+            if (!response.ok) {
+                return fetch(request);
+            }
+            return response.json().then(function (changes) {
+                return NoteStore.apply(changes).then(function (applied) {
+                    if (!applied) {
+                        return forget().then(function () {
+                            return fetch(request);
+                        });
+                    }
+                    var key = NoteStore.listKey(LIST_URL, changes.user);
+                    return fromCache(key).then(function (cached) {
+                        if (cached && isFresh(cached)) {
+                            return cached;
+                        }
+                        return fetch(request).then(function (page) {
+                            // Redirects to the login page are not cached.
+                            if (page.ok && !page.redirected) {
+                                var copy = page.clone();
+                                caches.open(NoteStore.CACHE).then(function (cache) {
+                                    cache.put(key, copy);
+                                });
+                            }
+                            return page;
+                        });
+                    });
+                });
+            });
+        }, function () {
+            // Offline, who is signed in cannot be checked; the copy of
+            // whoever last synced on this browser is shown.
+            return fromCache(NoteStore.listKey(LIST_URL, state.user)).then(function (cached) {
+                return cached || offlineList();
+            });
+        });
+    }).catch(function () {
+        return offlineList();
+    });
+}
+
+function isFresh(response) {
+    var date = Date.parse(response.headers.get("Date"));
+    return !isNaN(date) && Date.now() - date < LIST_MAX_AGE;
+}
+
+self.addEventListener("fetch", function (event) {
+    var request = event.request;
+    var url = new URL(request.url);
+    if (request.method !== "GET" || url.origin !== self.location.origin) {
+        return;
+    }
+    if (url.pathname.indexOf(STATIC_URL) === 0) {
+        event.respondWith(fromCache(request).then(function (cached) {
+            var fetched = fetchAndCache(request);
+            if (!cached) {
+                return fetched;
+            }
+            event.waitUntil(fetched.catch(function () {}));
+            return cached;
+        }));
+    } else if (request.mode === "navigate" && url.pathname === LIST_URL && !url.search) {
+        event.respondWith(listPage(request));
+    } else if (request.mode === "navigate" && DETAIL_PATTERN.test(url.pathname)) {
+        var id = Number(DETAIL_PATTERN.exec(url.pathname)[1]);
+        event.respondWith(fetch(request).catch(function () {
+            return offlineNote(id);
+        }));
+    }
+});
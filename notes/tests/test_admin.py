@@ -0,0 +1,84 @@
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from notes.models import MinHashBucket, Note
+
+
+class NoteAdminTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+        self.notes = [
+            Note.objects.create(title='Shopping list', content='Milk and eggs'),
+            Note.objects.create(title='Weekly shopping', content='Bread'),
+            Note.objects.create(title='Meeting notes', content='Agenda'),
+        ]
+        self.url = reverse('admin:notes_note_changelist')
+
+    def test_changelist_does_not_count_table(self):
+        """
+        Tests that the unfiltered changelist estimates its size instead of running COUNT(*).
+
+        Expected Outcome:
+            - The changelist renders all three notes.
+            - None of the queries it runs is a COUNT over the notes table.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Meeting notes')
+        self.assertEqual(response.context['cl'].result_count, 3)
+        counts = [q['sql'] for q in queries if 'COUNT(' in q['sql'] and 'notes_note' in q['sql']]
+        self.assertEqual(counts, [])
+
+    def test_search_uses_trigram_index(self):
+        """
+        Tests that changelist search matches any part of the title through the trigram index.
+
+        Expected Outcome:
+            - Both 'shopping' notes are listed and the meeting note is not.
+            - The search query reads from the trigram table rather than using LIKE on the title.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'q': 'shopping'})
+        self.assertEqual(set(response.context['cl'].result_list), set(self.notes[:2]))
+        self.assertTrue(any('notes_note_title_trigram' in q['sql'] for q in queries))
+
+    def test_delete_in_batches(self):
+        """
+        Tests the batched delete action, including its confirmation step.
+
+        Steps:
+            1. Posts the action for two notes and checks the confirmation page.
+            2. Confirms the action.
+
+        Expected Outcome:
+            - Nothing is deleted before confirmation.
+            - After confirmation the two notes and their similarity buckets are gone, and the third note remains.
+        """
+        data = {
+            'action': 'delete_in_batches',
+            ACTION_CHECKBOX_NAME: [self.notes[0].pk, self.notes[1].pk],
+            'index': 0,
+        }
+        response = self.client.post(self.url, data)
+        self.assertContains(response, 'Are you sure you want to delete 2 notes?')
+        self.assertEqual(Note.objects.count(), 3)
+
+        data.pop('index')
+        data['post'] = 'yes'
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Note.objects.all()), [self.notes[2]])
+        self.assertFalse(MinHashBucket.objects.exclude(note=self.notes[2]).exists())
+
+    def test_default_delete_action_removed(self):
+        """
+        Tests that the built-in per-object delete action is not offered.
+        """
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'value="delete_selected"')
+        self.assertContains(response, 'value="delete_in_batches"')
@@ -0,0 +1,146 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from notes import archive, search
+from notes.models import ArchivedNote, MinHashBucket, Note, Tag
+
+
+class ArchiveNotesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.old = Note.objects.create(title='Old shopping list', content='Milk and eggs', user=self.user)
+        self.old.tags.set(Tag.for_names(['errands', 'home']))
+        self.recent = Note.objects.create(title='Recent shopping list', content='Bread', user=self.user)
+        self.recent.tags.set(Tag.for_names(['errands']))
+        self.created_at = timezone.now() - timedelta(days=800)
+        Note.objects.filter(pk=self.old.pk).update(created_at=self.created_at, modified_at=self.created_at)
+
+    def archive_old_notes(self):
+        out = StringIO()
+        call_command('archive_notes', '--days', '365', '--batch-size', '1', stdout=out)
+        return out.getvalue()
+
+    def test_command_moves_stale_notes(self):
+        """
+        Tests that archive_notes moves notes not modified for the given number of days, and only those.
+
+        Expected Outcome:
+            - The old note is in the archive with its id, timestamps and tag names, and gone from the notes table.
+            - Its tag rows, similarity buckets and trigram entries are gone, and the tag counts dropped.
+            - The recent note is untouched.
+        """
+        self.assertIn('Archived 1 notes', self.archive_old_notes())
+
+        self.assertEqual(list(Note.objects.all()), [self.recent])
+        archived = ArchivedNote.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.created_at, self.created_at)
+        self.assertEqual(archived.tag_list(), ['errands', 'home'])
+        self.assertFalse(MinHashBucket.objects.filter(note_id=self.old.pk).exists())
+        self.assertEqual(Tag.objects.get(slug='errands').note_count, 1)
+        self.assertEqual(Tag.objects.get(slug='home').note_count, 0)
+        self.assertEqual(search.autocomplete('shopping'), [(self.recent.pk, 'Recent shopping list')])
+
+    def test_recently_modified_notes_are_kept(self):
+        """
+        Tests that a note modified after it was read for archiving stays in the notes table.
+
+        Steps:
+            1. Reads the old note as the command would.
+            2. Modifies it, then archives the batch that was read.
+
+        Expected Outcome:
+            - Nothing is archived and the note stays in the notes table.
+        """
+        cutoff = timezone.now() - timedelta(days=365)
+        batch = list(Note.objects.filter(pk=self.old.pk))
+        Note.objects.get(pk=self.old.pk).save()
+
+        self.assertEqual(archive.archive(batch, 'default', cutoff), 0)
+        self.assertTrue(Note.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(ArchivedNote.objects.exists())
+
+    def test_notes_with_attachments_are_kept(self):
+        """
+        Tests that notes with attachments stay in the notes table, as the archive cannot hold their files.
+        """
+        self.old.attachments.create(name='log.txt', content_type='text/plain', size=1, sha256='0' * 64)
+        self.assertIn('Archived 0 notes', self.archive_old_notes())
+        self.assertTrue(Note.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(ArchivedNote.objects.exists())
+
+    def test_detail_list_and_search_include_archive(self):
+        """
+        Tests how archived notes are shown by the detail, list and autocomplete views.
+
+        Expected Outcome:
+            - The detail page of an archived note still works and says that it is archived.
+            - The list and autocomplete only include the archived note when asked to with 'archived=1'.
+        """
+        self.archive_old_notes()
+
+        response = self.client.get(reverse('note_detail', args=[self.old.pk]))
+        self.assertContains(response, 'Milk and eggs')
+        self.assertContains(response, 'This note was archived')
+
+        response = self.client.get(reverse('note_list'))
+        self.assertEqual(list(response.context['notes']), [self.recent])
+        response = self.client.get(reverse('note_list'), {'archived': '1'})
+        self.assertEqual([note.pk for note in response.context['notes']], [self.recent.pk, self.old.pk])
+        self.assertContains(response, 'Archived')
+
+        url = reverse('note_autocomplete')
+        self.assertEqual(len(self.client.get(url, {'q': 'shopping'}).json()['results']), 1)
+        results = self.client.get(url, {'q': 'shopping', 'archived': '1'}).json()['results']
+        self.assertEqual([result['id'] for result in results], [self.old.pk, self.recent.pk])
+
+    def test_editing_restores_note(self):
+        """
+        Tests that saving an edit of an archived note moves it back into the notes table, and only that.
+
+        Steps:
+            1. Opens the archived note for editing.
+            2. Posts an invalid edit, then a valid one.
+
+        Expected Outcome:
+            - The form shows the archived note, which stays archived until the valid edit is posted.
+            - The note is then back with its id, creation date, tags, similarity buckets and the edit, and the
+            archive is empty.
+        """
+        self.archive_old_notes()
+
+        response = self.client.get(reverse('note_update', args=[self.old.pk]))
+        self.assertContains(response, 'Old shopping list')
+        self.assertContains(response, 'errands, home')
+        self.assertContains(response, f'action="{reverse("note_update", args=[self.old.pk])}"')
+        self.client.post(reverse('note_update', args=[self.old.pk]), {'title': '', 'content': 'Milk'})
+        self.assertFalse(Note.objects.filter(pk=self.old.pk).exists())
+        self.assertTrue(ArchivedNote.objects.filter(pk=self.old.pk).exists())
+
+        self.client.post(reverse('note_update', args=[self.old.pk]), {
+            'title': 'Old shopping list', 'content': 'Milk, eggs and bread', 'tags': 'errands, home',
+        })
+        note = Note.objects.get(pk=self.old.pk)
+        self.assertEqual(note.created_at, self.created_at)
+        self.assertEqual(note.content, 'Milk, eggs and bread')
+        self.assertEqual(sorted(tag.slug for tag in note.tags.all()), ['errands', 'home'])
+        self.assertTrue(MinHashBucket.objects.filter(note=note).exists())
+        self.assertFalse(ArchivedNote.objects.exists())
+
+    def test_delete_archived_note(self):
+        """
+        Tests that archived notes can be deleted, and only by their owner.
+        """
+        self.archive_old_notes()
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('note_delete', args=[self.old.pk])).status_code, 404)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('note_delete', args=[self.old.pk]))
+        self.assertFalse(ArchivedNote.objects.exists())
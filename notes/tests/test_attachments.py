@@ -0,0 +1,192 @@
+import hashlib
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from notes import attachments
+from notes.models import Attachment, Note
+
+CONTENT = b'0123456789' * 100
+
+
+class AttachmentTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(NOTES_ATTACHMENT_ROOT=directory.name, NOTES_ATTACHMENT_MAX_SIZE=4096)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(title='Crash report', content='See the log', user=self.user)
+
+    def upload(self, note, content=CONTENT, name='server.log', client=None):
+        return (client or self.client).post(reverse('attachment_upload', args=[note.pk]), {
+            'file': SimpleUploadedFile(name, content),
+        })
+
+    def download(self, attachment, **headers):
+        response = self.client.get(attachment.get_absolute_url(), headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_upload_stores_content_once(self):
+        """
+        Tests that uploads are stored by content, once per distinct content.
+
+        Steps:
+            1. Uploads the same file to two notes.
+
+        Expected Outcome:
+            - Both notes get an attachment with the file's name, size and SHA-256 digest.
+            - Only one file is stored, at the path named by the digest, with the uploaded content.
+        """
+        other = Note.objects.create(title='Second crash', content='Same log', user=self.user)
+        self.assertRedirects(self.upload(self.note), self.note.get_absolute_url())
+        self.upload(other, name='copy.log')
+
+        digest = hashlib.sha256(CONTENT).hexdigest()
+        first, second = Attachment.objects.order_by('pk')
+        self.assertEqual((first.note, first.name, first.size, first.sha256),
+                         (self.note, 'server.log', len(CONTENT), digest))
+        self.assertEqual((second.note, second.sha256), (other, digest))
+        self.assertEqual(first.path().read_bytes(), CONTENT)
+        self.assertEqual([path.name for path in attachments.root().glob('**/*') if path.is_file()], [digest])
+        self.assertContains(self.client.get(self.note.get_absolute_url()), 'server.log')
+
+    def test_download_ranges_and_conditional_requests(self):
+        """
+        Tests downloads in full, in part and conditionally.
+
+        Expected Outcome:
+            - A plain request gets the whole file with its digest as ETag.
+            - Byte ranges, including suffix ranges, get 206 with just those bytes; ranges outside the file get 416.
+            - A matching If-None-Match gets 304, and a stale If-Range gets the whole file.
+        """
+        self.upload(self.note)
+        attachment = Attachment.objects.get()
+        etag = f'"{attachment.sha256}"'
+
+        response, body = self.download(attachment)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, CONTENT)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment; filename="server.log"', response['Content-Disposition'])
+
+        response, body = self.download(attachment, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, CONTENT[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(CONTENT)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response, body = self.download(attachment, range='bytes=-5')
+        self.assertEqual((response.status_code, body), (206, CONTENT[-5:]))
+
+        response, _ = self.download(attachment, range=f'bytes={len(CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+
+        response, _ = self.download(attachment, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response, body = self.download(attachment, range='bytes=0-9', if_range='"stale"')
+        self.assertEqual((response.status_code, body), (200, CONTENT))
+
+    def test_attachments_are_private(self):
+        """
+        Tests that only the owner of a note can attach, download or remove its files.
+        """
+        self.upload(self.note)
+        attachment = Attachment.objects.get()
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+
+        self.assertEqual(self.download(attachment)[0].status_code, 404)
+        self.assertEqual(self.upload(self.note).status_code, 404)
+        url = reverse('attachment_delete', args=[self.note.pk, attachment.pk])
+        self.assertEqual(self.client.post(url).status_code, 404)
+
+        self.client.force_login(self.user)
+        self.client.post(url)
+        self.assertFalse(Attachment.objects.exists())
+
+    def test_upload_limits(self):
+        """
+        Tests that oversized uploads are refused and uploads still need a CSRF token.
+
+        Expected Outcome:
+            - A file over NOTES_ATTACHMENT_MAX_SIZE gets 413 and nothing is stored.
+            - An upload without a CSRF token gets 403.
+        """
+        self.assertEqual(self.upload(self.note, content=b'x' * 5000).status_code, 413)
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(any(attachments.root().iterdir()))
+
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(self.upload(self.note, client=client).status_code, 403)
+
+    def test_prune_deletes_unreferenced_files(self):
+        """
+        Tests that prune_attachments only deletes files no attachment refers to.
+
+        Steps:
+            1. Attaches the same file to two notes, and another file to one of them.
+            2. Deletes the second note, then prunes.
+            3. Removes the remaining copy of the shared file, then prunes again.
+
+        Expected Outcome:
+            - The shared file survives the first prune and is deleted by the second; the other file stays.
+        """
+        other = Note.objects.create(title='Second crash', content='Same log', user=self.user)
+        self.upload(self.note)
+        self.upload(other)
+        self.upload(self.note, content=b'screenshot', name='screen.png')
+        shared = Attachment.objects.filter(note=self.note).order_by('pk').first()
+
+        def prune():
+            out = StringIO()
+            call_command('prune_attachments', '--grace', '0', stdout=out)
+            return out.getvalue()
+
+        other.delete()
+        self.assertIn('Deleted 0 files', prune())
+        shared.delete()
+        self.assertIn(f'Deleted 1 files, {len(CONTENT)} bytes', prune())
+        self.assertFalse(shared.path().exists())
+        self.assertTrue(Attachment.objects.get().path().exists())
+
+    def test_reupload_keeps_file_from_prune(self):
+        """
+        Tests that uploading content already stored protects its file from prune_attachments' grace window.
+
+        Steps:
+            1. Uploads a file, deletes its attachment and backdates the file by two hours.
+            2. Uploads the same content again to another note, then prunes with a one-hour grace.
+
+        Expected Outcome:
+            - The second upload refreshes the file's modification time, so the prune keeps it.
+        """
+        self.upload(self.note)
+        attachment = Attachment.objects.get()
+        path = attachment.path()
+        attachment.delete()
+        hours_ago = time.time() - 2 * 60 * 60
+        os.utime(path, (hours_ago, hours_ago))
+
+        other = Note.objects.create(title='Second crash', content='Same log', user=self.user)
+        self.upload(other)
+        self.assertGreater(path.stat().st_mtime, hours_ago + 60 * 60)
+
+        out = StringIO()
+        call_command('prune_attachments', '--grace', '3600', stdout=out)
+        self.assertIn('Deleted 0 files', out.getvalue())
+        self.assertEqual(path.read_bytes(), CONTENT)
@@ -0,0 +1,129 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from notes import autosave
+from notes.models import MinHashBucket, Note
+
+
+@override_settings(NOTES_AUTOSAVE_INTERVAL=0, NOTES_WRITE_RATE=None)
+class AutosaveTest(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, autosave, 'drafts', autosave.drafts)
+        self.drafts = autosave.drafts = autosave.DraftBuffer()
+        cache.clear()
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(title='Groceries', content='Milk', user=self.user)
+
+    def autosave(self, title='Groceries', content='Milk', pk=None):
+        return self.client.post(reverse('note_autosave', args=[pk or self.note.pk]),
+                                {'title': title, 'content': content})
+
+    def test_rapid_edits_are_coalesced(self):
+        """
+        Tests that successive autosaves of a note are written once, with the latest draft.
+
+        Steps:
+            1. Autosaves the note five times, then flushes the buffer.
+
+        Expected Outcome:
+            - The note is untouched until the flush, then has the last draft's title and content, with its
+            similarity buckets and HTML refreshed.
+            - The counters show five drafts received, four writes avoided and one note written.
+        """
+        for i in range(5):
+            self.assertEqual(self.autosave(content=f'Milk and {i} eggs').status_code, 202)
+        self.assertEqual(Note.objects.get().content, 'Milk')
+
+        with self.assertNumQueries(6):
+            self.assertEqual(self.drafts.flush(), 1)
+        note = Note.objects.get()
+        self.assertEqual(note.content, 'Milk and 4 eggs')
+        self.assertIn('4 eggs', note.content_html)
+        self.assertTrue(MinHashBucket.objects.filter(note=note).exists())
+
+        stats = self.drafts.stats()
+        self.assertEqual((stats['received'], stats['writes_avoided'], stats['written'], stats['pending']),
+                         (5, 4, 1, 0))
+        self.assertEqual(self.drafts.flush(), 0)
+
+    def test_flush_batches_notes(self):
+        """
+        Tests that drafts of many notes are written in one transaction with a fixed number of queries.
+        """
+        notes = [Note.objects.create(title=f'Note {i}', content='', user=self.user) for i in range(20)]
+        for note in notes:
+            self.autosave(title=note.title, content='Updated', pk=note.pk)
+        with self.assertNumQueries(6):
+            self.assertEqual(self.drafts.flush(), 20)
+        self.assertEqual(Note.objects.filter(content='Updated').count(), 20)
+
+    def test_unflushed_draft_is_recovered(self):
+        """
+        Tests that the edit page offers a draft that has not been written yet, from this process or the cache.
+
+        Steps:
+            1. Autosaves a draft and opens the edit page.
+            2. Forgets the in-process buffer, as if the process died, and opens the edit page again.
+            3. Saves the form.
+
+        Expected Outcome:
+            - Both times the form holds the draft and says it was restored.
+            - Saving the form discards the draft, so it is neither flushed over the saved note nor offered again.
+        """
+        self.autosave(content='Milk and bread')
+        response = self.client.get(reverse('note_update', args=[self.note.pk]))
+        self.assertEqual(response.context['form'].initial['content'], 'Milk and bread')
+        self.assertContains(response, 'Restored unsaved changes')
+
+        autosave.drafts = autosave.DraftBuffer()
+        response = self.client.get(reverse('note_update', args=[self.note.pk]))
+        self.assertEqual(response.context['form'].initial['content'], 'Milk and bread')
+
+        self.autosave(content='Milk and butter')
+        self.client.post(reverse('note_update', args=[self.note.pk]), {'title': 'Groceries', 'content': 'Cheese'})
+        self.assertEqual(autosave.drafts.flush(), 0)
+        self.assertEqual(Note.objects.get().content, 'Cheese')
+        response = self.client.get(reverse('note_update', args=[self.note.pk]))
+        self.assertIsNone(response.context['draft'])
+
+    def test_stale_draft_is_dropped(self):
+        """
+        Tests that a draft older than the stored note is not written over it.
+        """
+        self.autosave(content='Old draft')
+        Note.objects.filter(pk=self.note.pk).update(modified_at=self.note.modified_at + timedelta(days=1))
+        self.assertEqual(self.drafts.flush(), 0)
+        self.assertEqual(Note.objects.get().content, 'Milk')
+        self.assertEqual(self.drafts.stats()['dropped'], 1)
+
+    def test_autosave_is_private_and_validated(self):
+        """
+        Tests that only the owner can autosave a note, and that invalid drafts are refused.
+        """
+        self.assertEqual(self.autosave(title='').status_code, 400)
+        self.client.force_login(User.objects.create_user('other'))
+        self.assertEqual(self.autosave().status_code, 404)
+        self.assertEqual(self.drafts.stats()['received'], 0)
+
+
+@override_settings(NOTES_AUTOSAVE_INTERVAL=0.05)
+class AutosaveFlushThreadTest(TransactionTestCase):
+    def test_drafts_are_flushed_in_background(self):
+        """
+        Tests that the first draft starts the flushing thread, which writes drafts on its own.
+        """
+        user = User.objects.create_user('tester')
+        note = Note.objects.create(title='Groceries', content='Milk', user=user)
+        drafts = autosave.DraftBuffer()
+        drafts.save(note, 'Groceries', 'Milk and honey')
+
+        deadline = time.monotonic() + 5
+        while Note.objects.get().content != 'Milk and honey' and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(Note.objects.get().content, 'Milk and honey')
+        self.assertTrue(drafts.thread.daemon)
@@ -0,0 +1,149 @@
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from notes import metrics
+from notes.models import Note
+
+
+class MmapStoreTest(SimpleTestCase):
+    def test_files_are_added_up(self):
+        """
+        Tests that the stores of several processes are read back and added up.
+
+        Steps:
+            1. Records into two memory-mapped stores in one directory, enough keys to grow a file.
+            2. Reopens one of the stores.
+
+        Expected Outcome:
+            - collect() adds up the values of both files.
+            - A reopened store continues from the values in its file.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        first = metrics.MmapStore(Path(directory.name) / 'metrics-1.db')
+        second = metrics.MmapStore(Path(directory.name) / 'metrics-2.db')
+        first.add([('a', 1), ('b', 2.5)])
+        first.add([('a', 1)])
+        second.add([('a', 3)])
+        second.add((f'key-{i}', i) for i in range(5000))
+
+        with override_settings(NOTES_METRICS_DIR=directory.name):
+            totals = metrics.collect()
+        self.assertEqual(totals['a'], 5)
+        self.assertEqual(totals['b'], 2.5)
+        self.assertEqual(totals['key-4999'], 4999)
+
+        reopened = metrics.MmapStore(first.path)
+        reopened.add([('a', 1)])
+        self.assertEqual(dict(reopened.items()), {'a': 3, 'b': 2.5})
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(title='Groceries', content='*Milk*', user=self.user)
+
+    def test_requests_are_counted(self):
+        """
+        Tests that requests are counted and timed per view, and queries per database.
+
+        Expected Outcome:
+            - Opening a note adds one 200 request of note_detail and one latency observation.
+            - Its queries are timed on the default database.
+            - Opening the note again is a hit of the HTML cache.
+        """
+        before = {
+            'requests': metrics.value('notes_http_requests_total', view='note_detail', method='GET', status='200'),
+            'latency': metrics.value('notes_http_request_duration_seconds_count', view='note_detail'),
+            'queries': metrics.value('notes_db_query_duration_seconds_count', alias='default'),
+            'hits': metrics.value('notes_cache_requests_total', cache='html', result='hit'),
+        }
+        self.client.get(reverse('note_detail', args=[self.note.pk]))
+        self.client.get(reverse('note_detail', args=[self.note.pk]))
+
+        self.assertEqual(metrics.value('notes_http_requests_total', view='note_detail', method='GET',
+                                       status='200'), before['requests'] + 2)
+        self.assertEqual(metrics.value('notes_http_request_duration_seconds_count', view='note_detail'),
+                         before['latency'] + 2)
+        self.assertGreater(metrics.value('notes_db_query_duration_seconds_count', alias='default'),
+                           before['queries'])
+        self.assertEqual(metrics.value('notes_cache_requests_total', cache='html', result='hit'),
+                         before['hits'] + 2)
+
+    def test_export(self):
+        """
+        Tests the text served at /metrics.
+
+        Expected Outcome:
+            - It has cumulative histogram buckets ending with +Inf, equal to the count.
+            - It has the note table size and the database size gauges.
+        """
+        self.client.get(reverse('note_list'))
+        with override_settings(NOTES_METRICS_ALLOWED_IPS=['127.0.0.1']):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+
+        count = metrics.value('notes_http_request_duration_seconds_count', view='note_list')
+        self.assertIn('# TYPE notes_http_request_duration_seconds histogram', text)
+        self.assertIn(f'notes_http_request_duration_seconds_bucket{{view="note_list",le="+Inf"}} {count!r}', text)
+        self.assertIn('notes_table_rows{alias="default",table="note"}', text)
+        self.assertIn('notes_database_size_bytes{alias="default"}', text)
+        self.assertIn('# TYPE notes_sqlite_wal_size_bytes gauge', text)
+
+    @override_settings(NOTES_METRICS_ALLOWED_IPS=[], NOTES_METRICS_TOKEN='s3cret')
+    def test_access(self):
+        """
+        Tests that /metrics is only served to staff, to the bearer of the token and to allowed addresses.
+
+        Expected Outcome:
+            - Other users get 403, even from localhost, as a reverse proxy would connect from there.
+            - A request with the token gets 200, one with another token 403.
+            - Allowed addresses and staff get 200 without a token.
+        """
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer s3cret'}).status_code, 200)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer guess'}).status_code, 403)
+        with override_settings(NOTES_METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer '}).status_code, 403)
+        with override_settings(NOTES_METRICS_ALLOWED_IPS=['10.0.0.1']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_row_counts_are_cached(self):
+        """
+        Tests that the note tables are counted once per NOTES_METRICS_ROWS_TTL, not on every scrape.
+
+        Expected Outcome:
+            - A second scrape right after the first runs no query on the notes table and reports the same count.
+            - After the cache is cleared, the new note is counted.
+        """
+        cache.clear()
+        first = metrics.table_rows()
+        Note.objects.create(title='Errands', content='Post office', user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(metrics.table_rows(), first)
+        self.assertFalse([query for query in queries if 'notes_note' in query['sql']])
+
+        cache.clear()
+        self.assertNotEqual(metrics.table_rows(), first)
+
+    def test_label_escaping(self):
+        """
+        Tests that label values are escaped in the output.
+        """
+        self.assertEqual(metrics.format_labels([('view', 'a"b\\c\nd')]), '{view="a\\"b\\\\c\\nd"}')
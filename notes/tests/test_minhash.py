@@ -0,0 +1,139 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from notes import minhash
+from notes.management.commands.find_duplicates import duplicate_groups
+from notes.models import MinHashBucket, Note
+
+TEMPLATE = ('Weekly status report. Completed: reviewed pull requests, fixed the login bug, '
+            'updated the deployment guide. Next week: start on the search feature.')
+
+
+class MinHashTest(TestCase):
+    def test_signature_similarity(self):
+        """
+        Tests that signatures of near-identical texts agree far more than those of unrelated texts.
+
+        Expected Outcome:
+            - A copy with a one-word change scores above 0.7; an unrelated text scores below 0.2.
+            - Blank text has no signature and no bands.
+        """
+        original = minhash.signature(TEMPLATE)
+        edited = minhash.signature(TEMPLATE.replace('login', 'logout'))
+        unrelated = minhash.signature('Buy milk, eggs and bread on the way home tonight.')
+
+        self.assertGreater(minhash.similarity(original, edited), 0.7)
+        self.assertLess(minhash.similarity(original, unrelated), 0.2)
+        self.assertIsNone(minhash.signature('   '))
+        self.assertEqual(minhash.bands(None), [])
+
+    def test_signature_round_trip(self):
+        """
+        Tests that signatures survive packing into bytes for storage.
+        """
+        signature = minhash.signature(TEMPLATE)
+        self.assertEqual(minhash.from_bytes(minhash.to_bytes(signature)), signature)
+
+
+class SimilarNotesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.original = Note.objects.create(title='Status week 1', content=TEMPLATE, user=self.user)
+        self.copy = Note.objects.create(title='Status week 2', content=TEMPLATE.replace('login', 'logout'),
+                                        user=self.user)
+        self.other = Note.objects.create(title='Groceries', content='Buy milk, eggs and bread.', user=self.user)
+
+    def test_buckets_are_stored_on_save(self):
+        """
+        Tests that saving a note stores its signature and one bucket per band, and refreshes them on edit.
+        """
+        self.assertEqual(self.original.minhash_buckets.count(), minhash.BANDS)
+        self.other.content = ''
+        self.other.save()
+        self.assertEqual(self.other.minhash_buckets.count(), 0)
+
+    def test_similar_notes(self):
+        """
+        Tests that similar_notes() finds the near-duplicate and ignores the unrelated note.
+        """
+        similar = self.original.similar_notes()
+        self.assertEqual([note.pk for note in similar], [self.copy.pk])
+        self.assertGreater(similar[0].similarity, 0.7)
+        self.assertEqual(self.other.similar_notes(), [])
+
+    def test_similar_notes_only_from_same_owner(self):
+        """
+        Tests that another user's copy of the same content is not offered as a similar note.
+        """
+        stranger = User.objects.create_user('stranger')
+        Note.objects.create(title='Copied status', content=TEMPLATE, user=stranger)
+        self.assertEqual([note.pk for note in self.original.similar_notes()], [self.copy.pk])
+
+    def test_similar_notes_panel(self):
+        """
+        Tests that the note detail page links to similar notes.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('note_detail', args=[self.original.pk]))
+        self.assertContains(response, 'Similar notes')
+        self.assertContains(response, f'<a href="{reverse("note_detail", args=[self.copy.pk])}">Status week 2</a>')
+
+    def test_find_duplicates_command(self):
+        """
+        Tests that the find_duplicates command groups the near-duplicates using a process pool.
+
+        Steps:
+            1. Clears the stored buckets to simulate notes saved before signatures existed.
+            2. Runs the command with two worker processes and --update.
+
+        Expected Outcome:
+            - One group containing the two status notes is reported.
+            - The buckets are stored again, so similar_notes() works afterwards.
+        """
+        MinHashBucket.objects.all().delete()
+        out = StringIO()
+        call_command('find_duplicates', '--workers', '2', '--chunk-size', '1',
+                     '--threshold', '0.7', '--update', stdout=out)
+
+        self.assertIn('Found 1 groups', out.getvalue())
+        self.assertIn(f'#{self.copy.pk} Status week 2', out.getvalue())
+        self.assertNotIn('Groceries', out.getvalue())
+        self.assertEqual([note.pk for note in self.original.similar_notes()], [self.copy.pk])
+
+    def test_duplicate_groups_compare_every_pair(self):
+        """
+        Tests that notes sharing a bucket are grouped even when the first note of the bucket matches neither.
+
+        Steps:
+            1. Builds three signatures agreeing on the first band only; the last two also agree on most other values.
+
+        Expected Outcome:
+            - The last two notes are grouped and the first is left out.
+        """
+        first = list(range(minhash.ROWS)) + [1000 + i for i in range(minhash.NUM_PERM - minhash.ROWS)]
+        second = list(range(minhash.NUM_PERM))
+        third = list(second)
+        for band in range(1, minhash.BANDS):
+            third[band * minhash.ROWS] = 5000 + band
+        self.assertEqual(duplicate_groups({1: first, 2: second, 3: third}, 0.7), [[2, 3]])
+
+    def test_duplicate_groups_linear_in_bucket_size(self):
+        """
+        Tests that a large bucket of near-duplicates is not compared pair by pair.
+
+        Steps:
+            1. Groups 500 identical signatures, which share every bucket.
+
+        Expected Outcome:
+            - All 500 notes form one group.
+            - Fewer than 500 similarity comparisons are made instead of about 125,000 per bucket.
+        """
+        signature = list(range(minhash.NUM_PERM))
+        with mock.patch.object(minhash, 'similarity', wraps=minhash.similarity) as similarity:
+            groups = duplicate_groups({pk: signature for pk in range(500)}, 0.8)
+        self.assertEqual(groups, [list(range(500))])
+        self.assertLess(similarity.call_count, 500)
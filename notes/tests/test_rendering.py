@@ -0,0 +1,98 @@
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from notes import rendering
+from notes.models import Note
+
+CONTENT = 'Some **bold** text.\n\n<script>alert(1)</script>'
+
+
+class RenderTest(SimpleTestCase):
+    @override_settings(NOTES_MARKDOWN=False)
+    def test_plain_text(self):
+        """
+        Tests that with Markdown off, content is escaped and split into paragraphs.
+        """
+        html = rendering.render(CONTENT)
+        self.assertEqual(html, '<p>Some **bold** text.</p>\n\n<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>')
+
+    @skipUnless(rendering.markdown_available(), 'Requires the markdown and nh3 packages.')
+    def test_markdown_is_sanitized(self):
+        """
+        Tests that Markdown is rendered and raw HTML in it cannot inject scripts.
+        """
+        html = rendering.render(CONTENT, 'markdown')
+        self.assertIn('<strong>bold</strong>', html)
+        self.assertNotIn('<script>', html)
+
+    def test_hash_depends_on_renderer(self):
+        """
+        Tests that the cache key changes with the content, the renderer and its version.
+        """
+        digest = rendering.content_hash('text', 'text')
+        self.assertNotEqual(digest, rendering.content_hash('text', 'markdown'))
+        self.assertNotEqual(digest, rendering.content_hash('text ', 'text'))
+        with mock.patch.object(rendering, 'RENDERER_VERSION', rendering.RENDERER_VERSION + 1):
+            self.assertNotEqual(digest, rendering.content_hash('text', 'text'))
+
+
+@override_settings(NOTES_MARKDOWN=False)
+class RenderedContentCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(title='Note', content=CONTENT, user=self.user)
+
+    def test_rendered_on_save(self):
+        """
+        Tests that saving a note caches its HTML, so the detail view does not render it again.
+
+        Expected Outcome:
+            - The cached HTML and hash are stored on save.
+            - The detail view shows the HTML without calling the renderer.
+        """
+        self.assertEqual(self.note.content_html, rendering.render(CONTENT))
+        self.assertEqual(self.note.content_html_hash, rendering.content_hash(CONTENT))
+        with mock.patch.object(rendering, 'render') as render:
+            response = self.client.get(reverse('note_detail', args=[self.note.pk]))
+        render.assert_not_called()
+        self.assertContains(response, '&lt;script&gt;')
+
+    def test_rendered_lazily_when_stale(self):
+        """
+        Tests that a note whose cached HTML is stale is rendered on first view and the cache filled in.
+
+        Expected Outcome:
+            - After the first view the cached HTML is current again, and modified_at is unchanged.
+        """
+        Note.objects.filter(pk=self.note.pk).update(content_html='', content_html_hash='')
+        self.client.get(reverse('note_detail', args=[self.note.pk]))
+        note = Note.objects.get(pk=self.note.pk)
+        self.assertEqual(note.content_html_hash, rendering.content_hash(CONTENT))
+        self.assertEqual(note.modified_at, self.note.modified_at)
+
+    @skipUnless(rendering.markdown_available(), 'Requires the markdown and nh3 packages.')
+    def test_rerender_command(self):
+        """
+        Tests that rerender_notes refreshes HTML rendered by another renderer, and only that.
+
+        Steps:
+            1. Switches Markdown on and runs the command.
+            2. Runs the command again.
+
+        Expected Outcome:
+            - The first run re-renders the note as Markdown, the second run has nothing to do.
+        """
+        with override_settings(NOTES_MARKDOWN=True):
+            out = StringIO()
+            call_command('rerender_notes', '--workers', '1', stdout=out)
+            self.assertIn('Re-rendered 1 notes with the markdown renderer', out.getvalue())
+            self.assertIn('<strong>bold</strong>', Note.objects.get(pk=self.note.pk).content_html)
+
+            out = StringIO()
+            call_command('rerender_notes', '--workers', '1', stdout=out)
+            self.assertIn('Re-rendered 0 notes', out.getvalue())
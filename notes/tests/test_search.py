@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from notes import search
+from notes.models import Note
+
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.shopping = Note.objects.create(title='Shopping list', content='Milk', user=self.user)
+        self.weekly = Note.objects.create(title='Weekly shopping', content='Bread', user=self.user)
+        self.meeting = Note.objects.create(title='Meeting notes', content='Agenda', user=self.user)
+
+    def test_substring_matches_prefix_first(self):
+        """
+        Tests that a trigram query finds titles containing the text anywhere, prefix matches first.
+
+        Expected Outcome:
+            - Both 'shopping' notes are returned, 'Shopping list' (a prefix match) before 'Weekly shopping'.
+            - Matching is case-insensitive and the unrelated note is not returned.
+        """
+        results = search.autocomplete('SHOP')
+        self.assertEqual([pk for pk, _ in results], [self.shopping.pk, self.weekly.pk])
+
+    def test_short_query_uses_prefix(self):
+        """
+        Tests that queries shorter than a trigram fall back to a prefix match.
+        """
+        results = search.autocomplete('me')
+        self.assertEqual(results, [(self.meeting.pk, 'Meeting notes')])
+
+    def test_index_follows_updates_and_deletes(self):
+        """
+        Tests that the trigram index stays in step with the notes table.
+
+        Steps:
+            1. Renames one note with a queryset update and deletes another.
+            2. Searches for the old and new titles.
+
+        Expected Outcome:
+            - The renamed note is found by its new title only, and the deleted note is no longer returned.
+        """
+        Note.objects.filter(pk=self.meeting.pk).update(title='Standup agenda')
+        self.weekly.delete()
+
+        self.assertEqual(search.autocomplete('meeting'), [])
+        self.assertEqual(search.autocomplete('standup'), [(self.meeting.pk, 'Standup agenda')])
+        self.assertEqual(search.autocomplete('shopping'), [(self.shopping.pk, 'Shopping list')])
+
+    def test_scoped_to_user(self):
+        """
+        Tests that a user's autocomplete only returns their own notes, through the per-user trigram index.
+
+        Steps:
+            1. Creates a matching note owned by another user, and a note of the first user holding every trigram
+            of the query but not the query itself.
+            2. Searches as the first user.
+            3. Gives one of the first user's notes to the other user, renames another, and searches again.
+
+        Expected Outcome:
+            - Only the user's own notes containing the query are returned, and the index follows the changes.
+            - The user's search reads the per-user index rather than the table-wide one.
+        """
+        other = User.objects.create_user('other')
+        Note.objects.create(title='Shopping for other', content='', user=other)
+        Note.objects.create(title='hopscotch shoes', content='', user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            results = search.autocomplete('shop', user=self.user)
+        self.assertEqual([pk for pk, _ in results], [self.shopping.pk, self.weekly.pk])
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn(search.USER_TRIGRAM_TABLE, sql)
+        self.assertNotIn(f'{search.TRIGRAM_TABLE} MATCH', sql)
+
+        Note.objects.filter(pk=self.weekly.pk).update(user=other)
+        Note.objects.filter(pk=self.meeting.pk).update(title='Shop opening')
+        results = search.autocomplete('shop', user=self.user)
+        self.assertEqual([pk for pk, _ in results], [self.meeting.pk, self.shopping.pk])
+        self.assertEqual(len(search.autocomplete('shop', user=other)), 2)
+
+    def test_query_with_quotes(self):
+        """
+        Tests that quotes in the typed text cannot break the FTS query syntax.
+        """
+        self.assertEqual(search.autocomplete('"shop'), [])
+
+    def test_autocomplete_view(self):
+        """
+        Tests the 'note_autocomplete' view's JSON response.
+
+        Expected Outcome:
+            - The response lists the matching note's id, title and detail URL.
+            - An empty query returns no results.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('note_autocomplete'), {'q': 'meet'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': [{
+            'id': self.meeting.pk,
+            'title': 'Meeting notes',
+            'url': reverse('note_detail', args=[self.meeting.pk]),
+        }]})
+
+        response = self.client.get(reverse('note_autocomplete'))
+        self.assertEqual(response.json(), {'results': []})
@@ -0,0 +1,272 @@
+import threading
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from notes import search, sharding, sync, warmup
+from notes.models import MinHashBucket, Note, Tag
+
+
+class ShardPlacementTest(SimpleTestCase):
+    def test_jump_hash_moves_few_keys(self):
+        """
+        Tests that adding a shard only moves keys onto the new shard.
+
+        Expected Outcome:
+            - Every key either keeps its shard or moves to the new one.
+            - Roughly a fifth of the keys move when going from four to five shards.
+        """
+        moved = 0
+        for key in range(10000):
+            before, after = sharding.jump_hash(key, 4), sharding.jump_hash(key, 5)
+            self.assertIn(after, (before, 4))
+            moved += before != after
+        self.assertAlmostEqual(moved / 10000, 1 / 5, delta=0.02)
+
+    def test_shard_for_is_stable(self):
+        """
+        Tests that a key always maps to the same shard, and keys spread over all shards.
+        """
+        aliases = ['notes_shard_0', 'notes_shard_1', 'notes_shard_2']
+        self.assertEqual(sharding.shard_for(42, aliases), sharding.shard_for(42, aliases))
+        self.assertEqual({sharding.shard_for(key, aliases) for key in range(100)}, set(aliases))
+
+    def test_ids_are_unique_and_ordered(self):
+        """
+        Tests the id generator under concurrent use.
+
+        Steps:
+            1. Generates 20,000 ids on each of four threads sharing one generator.
+            2. Generates ids on a generator with another node number.
+
+        Expected Outcome:
+            - All ids are distinct, and each thread received them in increasing order.
+            - Ids from the two nodes never collide.
+        """
+        generator = sharding.IdGenerator(node=1)
+        results = []
+
+        def generate():
+            results.append([generator() for _ in range(20000)])
+
+        threads = [threading.Thread(target=generate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = [pk for batch in results for pk in batch]
+        self.assertEqual(len(set(ids)), len(ids))
+        for batch in results:
+            self.assertEqual(batch, sorted(batch))
+
+        other = sharding.IdGenerator(node=2)
+        self.assertFalse(set(ids) & {other() for _ in range(1000)})
+        self.assertLess(max(ids), 2 ** 63)
+
+    @override_settings(NOTES_NODE_ID=None)
+    def test_node_id_required(self):
+        """
+        Tests that ids are not generated without a node number.
+
+        Expected Outcome:
+            - next_id() raises ImproperlyConfigured instead of guessing a node number.
+        """
+        with mock.patch.object(sharding, '_generator', None):
+            with self.assertRaises(ImproperlyConfigured):
+                sharding.next_id()
+
+    def test_merge_sorted(self):
+        """
+        Tests that per-shard results are merged in order and cut to the limit.
+
+        Expected Outcome:
+            - Descending per-shard lists merge into one descending list of the requested length.
+            - Orderings that mix directions are rejected.
+        """
+        shard_a = [SimpleNamespace(created_at=t) for t in (9, 5, 1)]
+        shard_b = [SimpleNamespace(created_at=t) for t in (8, 7, 2)]
+        merged = sharding.merge_sorted([shard_a, shard_b], ['-created_at'], limit=4)
+        self.assertEqual([row.created_at for row in merged], [9, 8, 7, 5])
+        with self.assertRaises(ValueError):
+            sharding.merge_sorted([shard_a], ['-created_at', 'pk'])
+
+
+@skipUnless(sharding.enabled(), 'Run with NOTES_SHARD_COUNT=2 or more, as run_tests.sh does, to test sharded storage.')
+class ShardedNotesTest(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def notes_on(self, alias):
+        return set(Note.objects.using(alias).values_list('title', flat=True))
+
+    @override_settings(NOTES_SHARD_KEY='user')
+    def test_notes_are_stored_on_owner_shard(self):
+        """
+        Tests that, sharded by owner, notes are written to and read from their owner's shard.
+
+        Expected Outcome:
+            - Each note is on its owner's shard only, and nothing is written to the default database.
+            - The note list, detail page and autocomplete work for each owner and show only their notes.
+        """
+        note = Note.objects.create(title='Alice shopping', content='Milk', user=self.alice)
+        Note.objects.create(title='Bob shopping', content='Bread', user=self.bob)
+
+        self.assertEqual(note._state.db, sharding.shard_for(self.alice.pk))
+        self.assertIn('Alice shopping', self.notes_on(sharding.shard_for(self.alice.pk)))
+        self.assertEqual(self.notes_on('default'), set())
+
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('note_list'))
+        self.assertEqual([n.title for n in response.context['notes']], ['Alice shopping'])
+        self.assertContains(self.client.get(reverse('note_detail', args=[note.pk])), 'Milk')
+        self.assertEqual(search.autocomplete('shop', user=self.alice), [(note.pk, 'Alice shopping')])
+
+    @override_settings(NOTES_SHARD_KEY='id')
+    def test_queries_fan_out_by_id(self):
+        """
+        Tests that, sharded by id, one user's notes spread over the shards and queries merge them.
+
+        Steps:
+            1. Creates twenty tagged notes for one user through the create view.
+            2. Lists them, opens one, searches their titles, filters them by tag and streams them all.
+            3. Syncs them a few at a time.
+
+        Expected Outcome:
+            - The notes are spread over more than one shard.
+            - The list and the streamed page are complete and newest first; search and the tag filter find
+            notes on every shard.
+            - The sync pages are merged from every shard in the order the notes changed.
+        """
+        self.client.force_login(self.alice)
+        for i in range(20):
+            self.client.post(reverse('note_create'), {
+                'title': f'Note {i:02}', 'content': f'Body {i}', 'tags': 'sharded',
+            })
+        placements = {alias: self.notes_on(alias) for alias in sharding.shard_aliases()}
+        self.assertGreater(sum(1 for titles in placements.values() if titles), 1)
+
+        response = self.client.get(reverse('note_list'))
+        titles = [n.title for n in response.context['notes']]
+        self.assertEqual(titles, [f'Note {i:02}' for i in reversed(range(20))])
+
+        note = response.context['notes'][0]
+        self.assertContains(self.client.get(reverse('note_detail', args=[note.pk])), 'Body 19')
+        self.assertEqual(len(search.autocomplete('note', limit=50, user=self.alice)), 20)
+
+        response = self.client.get(reverse('note_list_by_tag', args=['sharded']))
+        self.assertEqual(len(response.context['notes']), 20)
+
+        page = b''.join(self.client.get(reverse('note_list_all')).streaming_content).decode()
+        positions = [page.index(f'>Note {i:02}<') for i in reversed(range(20))]
+        self.assertEqual(positions, sorted(positions))
+
+        synced, cursor, more = [], sync.START, True
+        while more:
+            changes = sync.changes(self.alice, cursor, limit=7)
+            synced += [note['title'] for note in changes['notes']]
+            cursor, more = sync.decode(changes['cursor']), changes['more']
+        self.assertEqual(synced, [f'Note {i:02}' for i in range(20)])
+
+    @override_settings(NOTES_SHARD_KEY='user')
+    def test_rebalance_moves_notes_to_their_shard(self):
+        """
+        Tests the rebalance_shards command on notes written before sharding was enabled.
+
+        Steps:
+            1. Creates tagged notes directly in the default database.
+            2. Runs the command twice.
+
+        Expected Outcome:
+            - The notes, their tags, tag counts and attachments end up on their owners' shards and the default
+            database is empty.
+            - Timestamps are kept, and the second run moves nothing.
+        """
+        notes = []
+        for user in (self.alice, self.bob):
+            note = Note.objects.using('default').create(title=f'{user} note', content='Old', user=user)
+            note.tags.set(Tag.for_names(['legacy'], using='default'))
+            note.attachments.create(name='old.log', content_type='text/plain', size=1, sha256='0' * 64)
+            notes.append(note)
+
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('Moved 2 notes', out.getvalue())
+        self.assertEqual(self.notes_on('default'), set())
+        for note in notes:
+            alias = sharding.shard_for(note.user_id)
+            moved = Note.objects.using(alias).get(pk=note.pk)
+            self.assertEqual(moved.created_at, note.created_at)
+            self.assertEqual([tag.slug for tag in moved.tags.all()], ['legacy'])
+            self.assertEqual([attachment.name for attachment in moved.attachments.all()], ['old.log'])
+            self.assertEqual(Tag.objects.using(alias).get(slug='legacy').note_count,
+                             sum(1 for n in notes if sharding.shard_for(n.user_id) == alias))
+
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('Moved 0 notes', out.getvalue())
+
+    def test_deleting_user_deletes_sharded_notes(self):
+        """
+        Tests that deleting a user also deletes their notes on the shards.
+        """
+        Note.objects.create(title='Alice note', content='', user=self.alice)
+        self.alice.delete()
+        for alias in sharding.shard_aliases():
+            self.assertEqual(self.notes_on(alias), set())
+
+    @override_settings(NOTES_SHARD_KEY='user')
+    def test_maintenance_reads_every_shard(self):
+        """
+        Tests that find_duplicates, the warm-up and the notes admin work on the shards rather than the
+        default database.
+
+        Steps:
+            1. Creates two copies of a note for each of two users on different shards.
+            2. Runs find_duplicates --update after dropping the similarity buckets.
+            3. Picks the pages to warm.
+            4. Opens the admin changelist and a note's page, and deletes a note from the changelist.
+
+        Expected Outcome:
+            - The four copies are found as one group across the shards, and every shard gets its buckets back.
+            - The hot pages include every note.
+            - The changelist lists the notes of the picked shard, the note page opens, and the note is deleted.
+        """
+        other = self.bob
+        while sharding.shard_for(other.pk) == sharding.shard_for(self.alice.pk):
+            other = User.objects.create_user(f'user{other.pk}')
+        text = 'the quick brown fox jumps over the lazy dog ' * 5
+        notes = [Note.objects.create(title=f'{user} {i}', content=text, user=user)
+                 for user in (self.alice, other) for i in range(2)]
+        for alias in sharding.shard_aliases():
+            MinHashBucket.objects.using(alias).all().delete()
+
+        out = StringIO()
+        call_command('find_duplicates', '--update', '--workers', '1', stdout=out)
+        self.assertIn('4 near-duplicates', out.getvalue())
+        for note in notes:
+            self.assertTrue(MinHashBucket.objects.using(note._state.db).filter(note_id=note.pk).exists())
+
+        details = [path for path, _ in warmup.hot_paths()]
+        self.assertEqual(len(details), len(notes) + 2)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        url = reverse('admin:notes_note_changelist')
+        alias = notes[0]._state.db
+        response = self.client.get(url, {'shard': alias})
+        self.assertEqual(set(response.context['cl'].result_list), set(notes[:2]))
+        self.assertContains(self.client.get(reverse('admin:notes_note_change', args=[notes[2].pk])),
+                            notes[2].title)
+        self.client.post(f'{url}?shard={alias}', {
+            'action': 'delete_in_batches', ACTION_CHECKBOX_NAME: [notes[0].pk], 'post': 'yes',
+        })
+        self.assertEqual(self.notes_on(alias), {notes[1].title})
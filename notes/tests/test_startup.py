@@ -0,0 +1,48 @@
+from django.test import SimpleTestCase
+from sticky_notes import importtime, settings_serving
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        900 |     django.utils
+import time:       600 |       1500 |   django
+import time:      2000 |       3500 | sticky_notes.wsgi
+"""
+
+
+class ImportTimeParserTest(SimpleTestCase):
+    def test_parse(self):
+        """
+        Tests that the raw `python -X importtime` output is parsed into records.
+
+        Expected Outcome:
+            - The header line is skipped and one record is produced per import line.
+            - Self time, cumulative time and nesting depth are read from each line.
+        """
+        records = importtime.parse(SAMPLE)
+        self.assertEqual([record.module for record in records],
+                         ['_io', 'django.utils', 'django', 'sticky_notes.wsgi'])
+        self.assertEqual(records[1].self_us, 300)
+        self.assertEqual(records[1].cumulative_us, 900)
+        self.assertEqual([record.depth for record in records], [1, 2, 1, 0])
+
+    def test_packages(self):
+        """
+        Tests that self time is summed per top-level package, slowest first.
+        """
+        packages = importtime.packages(importtime.parse(SAMPLE))
+        self.assertEqual(packages[0], ('sticky_notes', 2000))
+        self.assertIn(('django', 900), packages)
+
+
+class ServingSettingsTest(SimpleTestCase):
+    def test_dev_only_apps_are_dropped(self):
+        """
+        Tests that the serving settings profile leaves out the admin and django_extensions.
+
+        Expected Outcome:
+            - Neither app is installed in the serving profile, while the notes app still is.
+        """
+        self.assertNotIn('django.contrib.admin', settings_serving.INSTALLED_APPS)
+        self.assertNotIn('django_extensions', settings_serving.INSTALLED_APPS)
+        self.assertIn('notes', settings_serving.INSTALLED_APPS)
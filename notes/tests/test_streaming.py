@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from notes.models import Category, Note, Tag
+
+
+@override_settings(NOTES_STREAM_CHUNK_SIZE=50)
+class StreamedNoteListTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        category = Category.objects.create(title='Projects', slug='projects')
+        tags = Tag.for_names(['work'])
+        Note.objects.bulk_create(
+            Note(title=f'Note {i:03}', content=f'Body {i}', user=self.user, category=category)
+            for i in range(120)
+        )
+        for note in Note.objects.all()[:10]:
+            note.tags.set(tags)
+
+    def test_streams_whole_page(self):
+        """
+        Tests that the 'note_list_all' view streams the complete page, head first.
+
+        Steps:
+            1. Requests the streamed list and reads the first chunk.
+            2. Reads the rest of the response.
+
+        Expected Outcome:
+            - The response is streamed, and its first chunk is the page up to the list, without any note.
+            - The whole page lists every note newest first with its labels, and ends with the page footer.
+        """
+        response = self.client.get(reverse('note_list_all'))
+        self.assertTrue(response.streaming)
+        chunks = iter(response.streaming_content)
+        head = next(chunks).decode()
+        self.assertIn('<ul>', head)
+        self.assertNotIn('Note 0', head)
+
+        page = head + b''.join(chunks).decode()
+        positions = [page.index(f'>Note {i:03}<') for i in reversed(range(120))]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn('Projects', page)
+        self.assertIn('#work', page)
+        self.assertTrue(page.rstrip().endswith('</html>'))
+
+    def test_rows_are_read_in_chunks(self):
+        """
+        Tests that notes are read a chunk at a time while the response is consumed.
+
+        Expected Outcome:
+            - Consuming the response runs a fixed number of queries per chunk of 50 notes (the notes and
+            their tags) rather than one per note.
+        """
+        response = self.client.get(reverse('note_list_all'))
+        with CaptureQueriesContext(connection) as queries:
+            b''.join(response.streaming_content)
+        self.assertLessEqual(len(queries), 3 * 2)
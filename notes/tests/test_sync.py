@@ -0,0 +1,156 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from notes import archive, sync
+from notes.models import ArchivedNote, Note, NoteTombstone, Tag
+
+
+@override_settings(NOTES_WRITE_RATE=None)
+class SyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(title='Groceries', content='*Milk*', user=self.user)
+        self.note.tags.set(Tag.for_names(['errands']))
+        self.other = Note.objects.create(title='Work', content='Report', user=self.user)
+        Note.objects.create(title='Not mine', content='Secret', user=User.objects.create_user('other'))
+
+    def fetch(self, cursor=''):
+        response = self.client.get(reverse('note_sync'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync(self):
+        """
+        Tests that a first sync sends all of the user's notes, and only theirs.
+
+        Expected Outcome:
+            - Both notes are sent, oldest change first, with their rendered HTML and tags.
+            - The client is told to reset its copy and there is nothing more to fetch.
+        """
+        changes = self.fetch()
+        self.assertEqual(changes['user'], self.user.pk)
+        self.assertEqual([note['id'] for note in changes['notes']], [self.note.pk, self.other.pk])
+        self.assertEqual(changes['notes'][0]['html'], str(self.note.rendered_content()))
+        self.assertEqual(changes['notes'][0]['tags'], [{'name': 'errands', 'url': '/tag/errands/'}])
+        self.assertEqual(changes['deleted'], [])
+        self.assertTrue(changes['reset'])
+        self.assertFalse(changes['more'])
+
+    def test_changes_since_cursor(self):
+        """
+        Tests that a later sync sends only what changed since the cursor.
+
+        Steps:
+            1. Syncs from scratch with no settling delay.
+            2. Edits one note, deletes the other and syncs again.
+            3. Syncs once more.
+
+        Expected Outcome:
+            - The second sync sends the edited note and the id of the deleted one.
+            - The third sync sends nothing.
+        """
+        with override_settings(NOTES_SYNC_SETTLE=0):
+            cursor = self.fetch()['cursor']
+            self.client.post(reverse('note_update', args=[self.note.pk]), {'title': 'Groceries', 'content': 'Eggs'})
+            self.client.get(reverse('note_delete', args=[self.other.pk]))
+
+            changes = self.fetch(cursor)
+            self.assertEqual([(note['id'], note['content']) for note in changes['notes']], [(self.note.pk, 'Eggs')])
+            self.assertEqual(changes['deleted'], [self.other.pk])
+            self.assertFalse(changes['reset'])
+
+            changes = self.fetch(changes['cursor'])
+            self.assertEqual((changes['notes'], changes['deleted']), ([], []))
+
+    def test_recent_changes_are_sent_again(self):
+        """
+        Tests that the cursor is held back by NOTES_SYNC_SETTLE, so changes still committing are not missed.
+
+        Expected Outcome:
+            - Syncing right after the notes were written sends them again on the next sync.
+        """
+        changes = self.fetch()
+        self.assertEqual(len(self.fetch(changes['cursor'])['notes']), 2)
+
+    def test_pages(self):
+        """
+        Tests that changes are sent a page at a time.
+
+        Expected Outcome:
+            - With one note per page, the first page says there are more and the second page has the other note.
+        """
+        first = sync.changes(self.user, limit=1)
+        self.assertTrue(first['more'])
+        second = sync.changes(self.user, sync.decode(first['cursor']), limit=1)
+        self.assertEqual([note['id'] for note in first['notes'] + second['notes']], [self.note.pk, self.other.pk])
+
+    def test_archived_and_restored_notes(self):
+        """
+        Tests that archived notes are sent as deletions, unless they are back in the notes table.
+
+        Steps:
+            1. Archives a note and syncs.
+            2. Restores it and syncs from the same cursor.
+
+        Expected Outcome:
+            - The archived note is deleted on the client.
+            - Once restored, it is no longer sent as deleted.
+        """
+        cursor = sync.decode(sync.changes(self.user)['cursor'])
+        archive.archive([self.other], 'default', timezone.now() + timedelta(seconds=1))
+        self.assertEqual(sync.changes(self.user, cursor)['deleted'], [self.other.pk])
+
+        archive.restore(ArchivedNote.objects.get(pk=self.other.pk))
+        self.assertEqual(sync.changes(self.user, cursor)['deleted'], [])
+
+    def test_old_cursor_resets(self):
+        """
+        Tests that a cursor older than the tombstones kept gets a full resync, and that old tombstones are pruned.
+        """
+        cursor = sync.decode(sync.changes(self.user)['cursor'])
+        later = timezone.now() + timedelta(days=31)
+        self.assertTrue(sync.changes(self.user, cursor, now=later)['reset'])
+
+        self.client.get(reverse('note_delete', args=[self.other.pk]))
+        self.assertEqual(sync.prune(), 0)
+        self.assertEqual(sync.prune(now=later), 1)
+        self.assertFalse(NoteTombstone.objects.exists())
+
+    def test_regular_syncs_never_reset(self):
+        """
+        Tests that a client syncing every day keeps its cursor past the retention period, with no deletions at all.
+
+        Expected Outcome:
+            - Only the first of forty daily syncs resets the client's copy.
+        """
+        cursor, resets = sync.START, []
+        for day in range(40):
+            changes = sync.changes(self.user, cursor, now=timezone.now() + timedelta(days=day))
+            cursor = sync.decode(changes['cursor'])
+            resets.append(changes['reset'])
+        self.assertEqual(resets, [True] + [False] * 39)
+
+    def test_errors(self):
+        """
+        Tests that a malformed or out of range cursor gets 400 and signed out clients get 401 instead of a redirect.
+        """
+        for cursor in ('nope', '99999999999999999999.0.0.0', '0.99999999999999999999.0.0'):
+            self.assertEqual(self.client.get(reverse('note_sync'), {'cursor': cursor}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('note_sync')).status_code, 401)
+
+    def test_service_worker(self):
+        """
+        Tests that the service worker is served from the root of the site, and that pages load the client.
+        """
+        response = self.client.get('/sw.js')
+        self.assertEqual(response['Content-Type'], 'text/javascript')
+        self.assertContains(response, 'notes/notestore.js')
+
+        response = self.client.get(reverse('note_list'))
+        self.assertContains(response, 'id="note-list"')
+        self.assertContains(response, 'data-sync-url="/sync/"')
@@ -0,0 +1,208 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from notes.counters import recount_tags
+from notes.models import Category, Note, Tag, UserTagCount
+
+
+def count_of(tag):
+    return Tag.objects.get(pk=tag.pk).note_count
+
+
+def user_counts(tag):
+    return dict(UserTagCount.objects.filter(tag=tag).values_list('user__username', 'note_count'))
+
+
+class TagCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.work, self.home = Tag.for_names(['Work', 'Home'])
+        self.notes = [
+            Note.objects.create(title=f'Note {i}', content='Tagged.', user=self.user)
+            for i in range(3)
+        ]
+
+    def test_for_names_reuses_tags(self):
+        """
+        Tests that tag names are matched on their slug and missing tags are created.
+
+        Expected Outcome:
+            - 'work' resolves to the existing 'Work' tag, 'New tag' is created, and blanks are ignored.
+        """
+        tags = Tag.for_names(['work', ' New tag ', ''])
+        self.assertEqual(tags[0], self.work)
+        self.assertEqual(tags[1].slug, 'new-tag')
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_counts_follow_assignments(self):
+        """
+        Tests that per-tag note counts follow every way of changing tag assignments.
+
+        Steps:
+            1. Tags all three notes 'work' and one of them 'home'.
+            2. Removes a tag, replaces a note's tags, and clears another note's tags.
+            3. Deletes a note with a queryset delete.
+
+        Expected Outcome:
+            - After each step the stored counts equal the number of notes carrying each tag.
+        """
+        for note in self.notes:
+            note.tags.add(self.work)
+        self.notes[0].tags.add(self.home)
+        self.assertEqual((count_of(self.work), count_of(self.home)), (3, 1))
+
+        self.notes[1].tags.remove(self.work)
+        self.notes[2].tags.set([self.home])
+        self.assertEqual((count_of(self.work), count_of(self.home)), (1, 2))
+
+        self.notes[2].tags.clear()
+        self.assertEqual((count_of(self.work), count_of(self.home)), (1, 1))
+
+        Note.objects.filter(pk=self.notes[0].pk).delete()
+        self.assertEqual((count_of(self.work), count_of(self.home)), (0, 0))
+
+    def test_counts_per_user(self):
+        """
+        Tests that each user's own notes carrying a tag are counted apart, and follow notes changing owner.
+
+        Steps:
+            1. Tags two of the user's notes and another user's note 'work'.
+            2. Gives one of the user's notes to the other user, then deletes it.
+            3. Recomputes every count from scratch.
+
+        Expected Outcome:
+            - After each step the per-user counts equal the number of each user's notes carrying the tag.
+            - The recount leaves them as the triggers did.
+        """
+        other = User.objects.create_user('other')
+        theirs = Note.objects.create(title='Theirs', content='Tagged.', user=other)
+        for note in [*self.notes[:2], theirs]:
+            note.tags.add(self.work)
+        self.assertEqual(count_of(self.work), 3)
+        self.assertEqual(user_counts(self.work), {'tester': 2, 'other': 1})
+
+        Note.objects.filter(pk=self.notes[0].pk).update(user=other)
+        self.assertEqual(user_counts(self.work), {'tester': 1, 'other': 2})
+        Note.objects.filter(pk=self.notes[0].pk).delete()
+        self.assertEqual(user_counts(self.work), {'tester': 1, 'other': 1})
+
+        recount_tags()
+        self.assertEqual(user_counts(self.work), {'tester': 1, 'other': 1})
+
+    def test_counts_roll_back_with_transaction(self):
+        """
+        Tests that count changes are part of the transaction that changed the tags.
+
+        Expected Outcome:
+            - When the transaction adding a tag fails, neither the assignment nor the count change is kept.
+        """
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.notes[0].tags.add(self.work)
+                raise RuntimeError
+        self.assertEqual(count_of(self.work), 0)
+        self.assertFalse(self.notes[0].tags.exists())
+
+
+class TaggedNoteListTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(title='Projects', slug='projects')
+        self.work, self.home = Tag.for_names(['Work', 'Home'])
+        for i in range(5):
+            note = Note.objects.create(title=f'Note {i}', content='Tagged.', user=self.user,
+                                       category=self.category)
+            note.tags.set([self.work] if i % 2 else [self.work, self.home])
+
+    def test_list_query_count_is_constant(self):
+        """
+        Tests that listing notes with their category and tags does not issue a query per note.
+
+        Steps:
+            1. Renders the note list with five notes and counts the queries.
+            2. Adds five more categorised, tagged notes and renders the list again.
+
+        Expected Outcome:
+            - Categories and tag links are shown, and both renders run the same number of queries.
+        """
+        with CaptureQueriesContext(connection) as before:
+            response = self.client.get(reverse('note_list'))
+        self.assertContains(response, 'Projects')
+        self.assertContains(response, self.home.get_absolute_url())
+
+        for i in range(5):
+            note = Note.objects.create(title=f'More {i}', content='Tagged.', user=self.user,
+                                       category=self.category)
+            note.tags.add(self.home)
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(reverse('note_list'))
+        self.assertEqual(len(before), len(after))
+
+    def test_filter_by_tag(self):
+        """
+        Tests the 'note_list_by_tag' view.
+
+        Expected Outcome:
+            - Only the notes tagged 'home' are listed, and another user's tagged note is not.
+            - The join table is read through its (tag, note) index.
+        """
+        other = User.objects.create_user('other')
+        Note.objects.create(title='Not mine', content='', user=other).tags.add(self.home)
+
+        response = self.client.get(reverse('note_list_by_tag', args=['home']))
+        self.assertEqual([note.title for note in response.context['notes']],
+                         ['Note 4', 'Note 2', 'Note 0'])
+
+        sql, params = response.context['notes'].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('SEARCH notes_notetag USING COVERING INDEX', plan)
+
+    def test_other_users_tags_are_not_found(self):
+        """
+        Tests that the 'note_list_by_tag' view does not tell which tags other users have.
+
+        Expected Outcome:
+            - A tag only another user's note carries, and a tag no longer on any of the user's notes, both give 404.
+        """
+        other = User.objects.create_user('other')
+        Note.objects.create(title='Not mine', content='', user=other).tags.set(Tag.for_names(['secret']))
+        response = self.client.get(reverse('note_list_by_tag', args=['secret']))
+        self.assertEqual(response.status_code, 404)
+
+        for note in Note.objects.filter(user=self.user):
+            note.tags.remove(self.home)
+        response = self.client.get(reverse('note_list_by_tag', args=['home']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_form_saves_tags(self):
+        """
+        Tests that creating and editing a note through the form saves its category and tags.
+
+        Steps:
+            1. Creates a note with two comma-separated tags, one of them new.
+            2. Edits the note, leaving only the new tag.
+
+        Expected Outcome:
+            - The tags are saved after each step and the counts follow.
+        """
+        self.client.post(reverse('note_create'), {
+            'title': 'Tagged note', 'content': 'Body', 'category': self.category.pk,
+            'tags': 'home, Errands',
+        })
+        note = Note.objects.get(title='Tagged note')
+        self.assertEqual(note.category, self.category)
+        self.assertEqual(sorted(tag.slug for tag in note.tags.all()), ['errands', 'home'])
+        self.assertEqual(count_of(self.home), 4)
+
+        response = self.client.get(reverse('note_update', args=[note.pk]))
+        self.assertContains(response, 'Errands, Home')
+        self.client.post(reverse('note_update', args=[note.pk]), {
+            'title': 'Tagged note', 'content': 'Body', 'tags': 'errands',
+        })
+        self.assertEqual([tag.slug for tag in note.tags.all()], ['errands'])
+        self.assertEqual(count_of(self.home), 3)
@@ -1,11 +1,15 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 from django.urls import reverse
 from notes.models import Note
 from notes.forms import NoteForm
 
+
 class NoteFormTemplateTest(TestCase):
     def setUp(self):
-        self.note = Note.objects.create(title='Test Note', content='This is a test.')
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(title='Test Note', content='This is a test.', user=self.user)
         self.form = NoteForm(instance=self.note)
 
     def test_note_form_template_edit_mode(self):
@@ -72,10 +76,13 @@ class NoteFormTemplateTest(TestCase):
 
 class NoteDetailTemplateTest(TestCase):
     def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
         # Create a note instance for testing
         self.note = Note.objects.create(
             title='Test Note',
             content='This is a test.',
+            user=self.user,
         )
 
     def test_note_detail_display(self):
@@ -106,11 +113,13 @@ class NoteDetailTemplateTest(TestCase):
 
 class NoteListTemplateTest(TestCase):
     def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
         # Create a list of notes for testing
         self.notes = [
-            Note.objects.create(title='Test Note 1', content='This is a test.'),
-            Note.objects.create(title='Another Test Note', content='More test content here.'),
-            Note.objects.create(title='Yet Another Test Note', content='Even more test content.')
+            Note.objects.create(title='Test Note 1', content='This is a test.', user=self.user),
+            Note.objects.create(title='Another Test Note', content='More test content here.', user=self.user),
+            Note.objects.create(title='Yet Another Test Note', content='Even more test content.', user=self.user)
         ]
 
     def test_note_list_display(self):
@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from notes import throttling
+from notes.models import Note
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_bucket_allows_burst_then_rate(self):
+        """
+        Tests the token bucket arithmetic of both backends.
+
+        Expected Outcome:
+            - A full bucket of three tokens allows three requests at once, then asks the fourth to wait a second.
+            - Half a second later the wait is half a second; after a second one more request goes through.
+            - Buckets of different clients are independent.
+        """
+        for backend in (throttling.MemoryBackend(), throttling.CacheBackend()):
+            cache.clear()
+            with self.subTest(backend=type(backend).__name__):
+                self.assertEqual([backend.take('a', 1, 3, 100) for _ in range(3)], [0, 0, 0])
+                self.assertAlmostEqual(backend.take('a', 1, 3, 100), 1)
+                self.assertAlmostEqual(backend.take('a', 1, 3, 100.5), 0.5)
+                self.assertEqual(backend.take('a', 1, 3, 101), 0)
+                self.assertEqual(backend.take('b', 1, 3, 101), 0)
+
+    def test_memory_backend_forgets_full_buckets(self):
+        """
+        Tests that the memory backend drops buckets that have refilled once it holds too many.
+        """
+        backend = throttling.MemoryBackend()
+        backend.max_buckets = 2
+        backend.take('a', 1, 3, 0)
+        backend.take('b', 1, 3, 0)
+        backend.take('c', 1, 3, 10)
+        self.assertEqual(list(backend.buckets), ['c'])
+
+
+@override_settings(NOTES_WRITE_RATE=0.01, NOTES_WRITE_BURST=2)
+class WriteLimitTest(TestCase):
+    def setUp(self):
+        throttling.backend().clear()
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+
+    def create(self, title='Note'):
+        return self.client.post(reverse('note_create'), {'title': title, 'content': 'Body'})
+
+    def test_rate_limit(self):
+        """
+        Tests that a client making too many changes gets 429 while others are unaffected.
+
+        Steps:
+            1. Creates two notes, then tries a third.
+            2. Opens the create form, autosaves a note, and creates a note as another user.
+
+        Expected Outcome:
+            - The first two notes are created; the third request gets 429 with a Retry-After and creates nothing.
+            - Reading pages is not limited, autosaves have an allowance of their own, and the other user's
+            change goes through.
+        """
+        self.assertEqual(self.create().status_code, 302)
+        self.assertEqual(self.create().status_code, 302)
+        response = self.create()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '100')
+        self.assertEqual(Note.objects.count(), 2)
+
+        self.assertEqual(self.client.get(reverse('note_create')).status_code, 200)
+        note = Note.objects.first()
+        response = self.client.post(reverse('note_autosave', args=[note.pk]), {'title': 'Note', 'content': 'Draft'})
+        self.assertEqual(response.status_code, 202)
+        self.client.force_login(User.objects.create_user('other'))
+        self.assertEqual(self.create().status_code, 302)
+
+    def test_sheds_load_when_writes_queue_up(self):
+        """
+        Tests that writes get 503 while too many are running or while they are slow.
+
+        Expected Outcome:
+            - With the in-flight limit reached, a write gets 503 with a Retry-After.
+            - With the average latency over the threshold, writes are rejected in proportion to the excess,
+            but some always get through.
+            - Writes that get through update the latency average.
+        """
+        self.addCleanup(setattr, throttling, 'shedder', throttling.shedder)
+        shedder = throttling.shedder = throttling.LoadShedder()
+        with override_settings(NOTES_WRITE_RATE=None, NOTES_SHED_MAX_IN_FLIGHT=1):
+            shedder.in_flight = 1
+            response = self.create()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            shedder.in_flight = 0
+
+            shedder.latency = 3.0
+            with mock.patch('random.random', return_value=0.5):
+                response = self.create()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '3')
+            with mock.patch('random.random', return_value=0.95):
+                self.assertEqual(self.create().status_code, 302)
+            self.assertLess(shedder.latency, 3.0)
+            self.assertEqual(shedder.in_flight, 0)
@@ -1,12 +1,19 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 from notes.models import Note
 from notes.forms import NoteForm
 
+
 class NoteListViewTest(TestCase):
     def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
         # Create a Note object for testing
-        Note.objects.create(title='Test Note', content='This is a test note.')
+        Note.objects.create(title='Test Note', content='This is a test note.', user=self.user)
 
     def test_note_list_view(self):
         """
@@ -32,8 +39,10 @@ class NoteListViewTest(TestCase):
 
 class NoteDetailViewTest(TestCase):
     def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
         # Create a Note object for testing
-        Note.objects.create(title='Test Note', content='This is a test note.')
+        Note.objects.create(title='Test Note', content='This is a test note.', user=self.user)
 
     def test_note_detail_view(self):
         """
@@ -67,8 +76,10 @@ class NoteDetailViewTest(TestCase):
 
 class NoteCreateViewTest(TestCase):
     def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
         # Create a Note object for testing
-        Note.objects.create(title='Test Note', content='This is a test note.')
+        Note.objects.create(title='Test Note', content='This is a test note.', user=self.user)
 
     def test_get_note_create_view(self):
         """
@@ -157,7 +168,9 @@ class NoteCreateViewTest(TestCase):
 
 class NoteUpdateViewTest(TestCase):
     def setUp(self):
-        self.note = Note.objects.create(title='Original Title', content='Original Content.')
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(title='Original Title', content='Original Content.', user=self.user)
         self.pk = self.note.pk
 
     def test_note_update_success(self):
@@ -242,8 +255,10 @@ class NoteUpdateViewTest(TestCase):
 
 class NoteDeleteViewTest(TestCase):
     def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
         # Create a Note object for testing
-        self.note = Note.objects.create(title='Test Note', content='This is a test note.')
+        self.note = Note.objects.create(title='Test Note', content='This is a test note.', user=self.user)
         self.pk = self.note.pk
 
     def test_note_delete_success(self):
@@ -293,3 +308,75 @@ class NoteDeleteViewTest(TestCase):
         response = self.client.get(reverse('note_delete', kwargs={'pk': 999}))
 
         self.assertEqual(response.status_code, 404)
+
+
+class NoteOwnershipTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.other = User.objects.create_user('other')
+        self.note = Note.objects.create(title='Private Note', content='Only mine.', user=self.owner)
+        Note.objects.create(title='Someone Else', content='Not yours.', user=self.other)
+        self.client.force_login(self.owner)
+
+    def test_list_shows_only_own_notes(self):
+        """
+        Tests that the 'note_list' view lists only the notes owned by the logged-in user.
+
+        Expected Outcome:
+            - The owner's note is listed and the other user's note is not.
+        """
+        response = self.client.get(reverse('note_list'))
+        self.assertContains(response, 'Private Note')
+        self.assertNotContains(response, 'Someone Else')
+
+    def test_other_users_notes_are_not_found(self):
+        """
+        Tests that another user cannot view, edit or delete a note they do not own.
+
+        Expected Outcome:
+            - The detail, update and delete views all respond with 404 for the other user.
+            - The note still exists afterwards.
+        """
+        self.client.force_login(self.other)
+        for name in ('note_detail', 'note_update', 'note_delete'):
+            response = self.client.get(reverse(name, kwargs={'pk': self.note.pk}))
+            self.assertEqual(response.status_code, 404)
+        self.assertTrue(Note.objects.filter(pk=self.note.pk).exists())
+
+    def test_create_sets_owner(self):
+        """
+        Tests that a note created through the 'note_create' view belongs to the logged-in user.
+        """
+        self.client.post(reverse('note_create'), {'title': 'New', 'content': 'Content'})
+        self.assertEqual(Note.objects.get(title='New').user, self.owner)
+
+    def test_login_required(self):
+        """
+        Tests that anonymous users are redirected to the login page.
+        """
+        self.client.logout()
+        response = self.client.get(reverse('note_list'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('note_list')}")
+
+    def test_assign_ownerless_notes(self):
+        """
+        Tests that the 'assign_notes' command gives notes without an owner, as left by the upgrade, to a user.
+
+        Steps:
+            1. Creates a note with no owner, as existing notes are after migrating.
+            2. Runs the command with --dry-run, then for real.
+
+        Expected Outcome:
+            - The dry run reports the note and leaves it alone.
+            - Afterwards the note belongs to the user and shows in their list; other notes keep their owners.
+        """
+        orphan = Note.objects.create(title='Old Note', content='From before accounts.')
+        out = StringIO()
+        call_command('assign_notes', 'owner', '--dry-run', stdout=out)
+        self.assertIn('Would assign 1 notes', out.getvalue())
+        self.assertIsNone(Note.objects.get(pk=orphan.pk).user)
+
+        call_command('assign_notes', 'owner', stdout=StringIO())
+        self.assertEqual(Note.objects.get(pk=orphan.pk).user, self.owner)
+        self.assertEqual(Note.objects.get(title='Someone Else').user, self.other)
+        self.assertContains(self.client.get(reverse('note_list')), 'Old Note')
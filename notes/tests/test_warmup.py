@@ -0,0 +1,142 @@
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from notes import warmup
+from notes.models import Note
+from sticky_notes import settings_serving
+
+
+class WarmCachesTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.notes = [
+            Note.objects.create(title=f'Note {i}', content='Warm me up.', user=self.user)
+            for i in range(3)
+        ]
+
+    def test_warm_caches_renders_hot_pages(self):
+        """
+        Tests that warm_caches() compiles the templates and pre-renders the list and detail pages.
+
+        Steps:
+            1. Runs warm_caches() for the two most recently modified notes on a two-thread pool.
+            2. Checks that every notes template was compiled.
+            3. Checks that the owner's note list and both detail pages were rendered successfully.
+
+        Expected Outcome:
+            - The note list and the detail pages of the two newest notes rendered for their owner with a 200
+            status code.
+            - Nothing was skipped.
+        """
+        report = warmup.warm_caches(top_n=2, workers=2, budget=30)
+
+        self.assertIn('notes/note_list.html', report['templates'])
+        self.assertIn('default', report['connections'])
+        expected = {
+            (reverse('note_list'), self.user.pk),
+            (reverse('note_detail', args=[self.notes[2].pk]), self.user.pk),
+            (reverse('note_detail', args=[self.notes[1].pk]), self.user.pk),
+        }
+        self.assertEqual(set(report['rendered']), expected)
+        self.assertEqual(set(report['rendered'].values()), {200})
+        self.assertEqual(report['skipped'], [])
+
+    def test_warm_caches_respects_budget(self):
+        """
+        Tests that pages still pending when the time budget runs out are skipped instead of awaited.
+
+        Expected Outcome:
+            - With a zero budget every page is reported as rendered, skipped or unfinished, and the call returns.
+        """
+        report = warmup.warm_caches(top_n=3, workers=1, budget=0)
+        self.assertEqual(len(report['rendered']) + len(report['skipped']) + len(report['unfinished']), 4)
+
+    def test_warm_caches_abandons_slow_pages(self):
+        """
+        Tests that a page still rendering when the budget runs out does not hold up the warm-up.
+
+        Steps:
+            1. Runs warm_caches() with a 0.2 second budget while rendering blocks until released.
+
+        Expected Outcome:
+            - The call returns within about the budget, reporting the blocked pages as unfinished, not skipped.
+            - The rendering threads are daemons, so they cannot keep the process alive.
+        """
+        release = threading.Event()
+        self.addCleanup(release.set)
+        threads = []
+
+        def render(path, user_id):
+            threads.append(threading.current_thread())
+            release.wait()
+            return path, 200
+
+        started = time.monotonic()
+        with mock.patch.object(warmup, 'render_path', render):
+            report = warmup.warm_caches(top_n=3, workers=2, budget=0.2)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(report['unfinished']), 2)
+        self.assertEqual(len(report['skipped']), 2)
+        self.assertEqual(report['rendered'], {})
+        self.assertTrue(all(thread.daemon for thread in threads))
+
+
+class WarmCachesServingTest(TransactionTestCase):
+    @override_settings(INSTALLED_APPS=settings_serving.INSTALLED_APPS)
+    def test_warm_caches_without_admin(self):
+        """
+        Tests that warm-up works under the serving settings, which leave out the admin.
+
+        Expected Outcome:
+            - The notes templates are compiled and the admin templates skipped, without errors.
+        """
+        report = warmup.warm_caches(top_n=0, workers=1, budget=30)
+        self.assertIn('notes/note_list.html', report['templates'])
+        self.assertFalse([name for name in report['templates'] if name.startswith('admin/')])
+
+
+class WarmCachesOverHttpTest(LiveServerTestCase):
+    def test_pages_are_requested_from_running_server(self):
+        """
+        Tests that with base URLs the pages are requested from the running server, signed in as their owners.
+
+        Steps:
+            1. Runs warm_caches() against the live test server.
+
+        Expected Outcome:
+            - The note list and detail page were served with a 200 status code, so the owner was signed in.
+            - Nothing was warmed in the calling process and the sessions opened for the warm-up are gone.
+        """
+        user = User.objects.create_user('tester')
+        note = Note.objects.create(title='Note', content='Warm me up.', user=user)
+
+        report = warmup.warm_caches(top_n=1, workers=1, budget=30, urls=[self.live_server_url + '/'])
+
+        expected = {
+            (self.live_server_url + reverse('note_list'), user.pk): 200,
+            (self.live_server_url + reverse('note_detail', args=[note.pk]), user.pk): 200,
+        }
+        self.assertEqual(report['rendered'], expected)
+        self.assertEqual((report['connections'], report['templates']), ([], []))
+        self.assertFalse(Session.objects.exists())
+
+
+class WarmCachesCommandTest(TestCase):
+    def test_command_output(self):
+        """
+        Tests that the warm_caches management command reports what it warmed.
+
+        Expected Outcome:
+            - The command output ends with a summary of the pages that were warmed.
+        """
+        out = StringIO()
+        call_command('warm_caches', '--top', '0', '--workers', '1', stdout=out)
+        self.assertIn('Compiled', out.getvalue())
+        self.assertIn('Warmed', out.getvalue())
@@ -0,0 +1,234 @@
+"""
+Rate limiting and load shedding of the views that write notes.
+
+All writes go through one SQLite writer, so one client sending writes as
+fast as it can, or a burst of writes that outruns the database, slows down
+every other user. Views decorated with write_limited() are protected in two
+ways:
+
+- Each client - the user, or the address of anonymous clients - has a token
+  bucket holding up to NOTES_WRITE_BURST tokens, refilled at
+  NOTES_WRITE_RATE tokens per second. Every write takes one; without one the
+  client gets 429 with a Retry-After telling it when the next token is due.
+  Buckets are kept by a pluggable backend: MemoryBackend, per process, or
+  CacheBackend, shared by every process using the same cache.
+- The process sheds load when its writes queue up: with
+  NOTES_SHED_MAX_IN_FLIGHT write requests already running, or with the
+  moving average of write latency above NOTES_SHED_LATENCY seconds, new
+  writes get 503 and a Retry-After. Past the latency threshold the share of
+  writes rejected grows with the latency, but never reaches all of them, so
+  the average keeps being measured and shedding stops as soon as the
+  database catches up.
+"""
+
+import functools
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+DEFAULT_BACKEND = "notes.throttling.MemoryBackend"
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 20
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_LATENCY = 1.0
+
+# Weight of the newest sample in the moving average of write latency.
+LATENCY_SMOOTHING = 0.2
+
+# Share of writes that are let through however slow writes are, so the
+# latency average keeps being updated.
+MIN_ADMITTED = 0.1
+
+
+class MemoryBackend:
+    """
+    Token buckets kept in memory; each process limits clients on its own.
+
+    Once more than ``max_buckets`` clients have buckets, the buckets that
+    have filled up again are dropped, as they are the same as no bucket.
+    """
+
+    max_buckets = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """
+        Takes a token from a bucket.
+        :param key: The bucket's key.
+        :param rate: Tokens added per second.
+        :param burst: Capacity of the bucket.
+        :param now: Current time, in seconds.
+        :return: 0 if a token was taken, otherwise the seconds until one is
+            available.
+        """
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens, wait = refill(tokens, updated, rate, burst, now)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_buckets:
+                self.buckets = {
+                    key: (tokens, updated)
+                    for key, (tokens, updated) in self.buckets.items()
+                    if tokens + (now - updated) * rate < burst
+                }
+            return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBackend:
+    """
+    Token buckets kept in the cache, shared by every process using it.
+
+    Reading and writing a bucket are two cache operations, so concurrent
+    requests of one client can occasionally both take the last token; the
+    limit is approximate, which is enough to stop a client hammering the
+    site.
+    """
+
+    prefix = "notes:bucket:"
+
+    def take(self, key, rate, burst, now):
+        key = self.prefix + key
+        tokens, updated = cache.get(key, (burst, now))
+        tokens, wait = refill(tokens, updated, rate, burst, now)
+        # A bucket left alone long enough is full again, like a missing one.
+        cache.set(key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+        return wait
+
+
+def refill(tokens, updated, rate, burst, now):
+    """
+    Refills a bucket for the time passed and takes a token if there is one.
+    :return: (tokens left, seconds to wait; 0 if a token was taken).
+    """
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+@functools.lru_cache(maxsize=None)
+def _backend(path):
+    return import_string(path)()
+
+
+def backend():
+    """
+    Returns the bucket backend named by NOTES_RATE_LIMIT_BACKEND.
+    """
+    return _backend(getattr(settings, "NOTES_RATE_LIMIT_BACKEND", DEFAULT_BACKEND))
+
+
+def client_key(request):
+    """
+    Returns the key of the bucket a request draws from.
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"addr:{request.META.get('REMOTE_ADDR', '')}"
+
+
+class LoadShedder:
+    """
+    Tracks the write requests of this process and decides which to reject.
+
+    Keeps the number of write requests in flight and an exponentially
+    weighted moving average of how long they take.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.latency = 0.0
+
+    def admit(self):
+        """
+        Decides whether to start a write request.
+        :return: 0 if the request may go ahead, otherwise the seconds the
+            client should wait before retrying.
+        """
+        max_in_flight = getattr(settings, "NOTES_SHED_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)
+        threshold = getattr(settings, "NOTES_SHED_LATENCY", DEFAULT_LATENCY)
+        with self.lock:
+            if max_in_flight and self.in_flight >= max_in_flight:
+                return max(1, math.ceil(self.latency))
+            if threshold and self.latency > threshold:
+                rejected = min(1 - MIN_ADMITTED, (self.latency - threshold) / threshold)
+                if random.random() < rejected:
+                    return max(1, math.ceil(self.latency))
+            self.in_flight += 1
+            return 0
+
+    def done(self, seconds):
+        """
+        Records the end of an admitted write request.
+        :param seconds: How long it took.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+
+shedder = LoadShedder()
+
+
+def _refuse(status, retry_after, message):
+    metrics.throttled.inc(status=str(status))
+    response = HttpResponse(message, status=status, content_type="text/plain")
+    response.headers["Retry-After"] = str(math.ceil(retry_after))
+    return response
+
+
+def write_limited(view=None, methods=("POST",), shed=True, scope="write"):
+    """
+    Decorator rate limiting a view that writes notes, and shedding it under
+    load.
+
+    :param methods: The HTTP methods that write; other requests pass freely.
+        None limits every request.
+    :param shed: Whether the view is subject to load shedding. Views that do
+        not write to the database synchronously only need rate limiting.
+    :param scope: Name of the bucket the view draws from; each client has
+        one bucket per scope.
+    """
+    if view is None:
+        return functools.partial(write_limited, methods=methods, shed=shed,
+                                 scope=scope)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if methods is not None and request.method not in methods:
+            return view(request, *args, **kwargs)
+        rate = getattr(settings, "NOTES_WRITE_RATE", DEFAULT_RATE)
+        if rate:
+            burst = getattr(settings, "NOTES_WRITE_BURST", DEFAULT_BURST)
+            wait = backend().take(f"{scope}:{client_key(request)}", rate, burst,
+                                  time.time())
+            if wait:
+                return _refuse(429, wait, "Too many changes; slow down.")
+        if not shed:
+            return view(request, *args, **kwargs)
+        wait = shedder.admit()
+        if wait:
+            return _refuse(503, wait, "Too busy to save changes; try again shortly.")
+        started = time.perf_counter()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            shedder.done(time.perf_counter() - started)
+
+    return wrapper
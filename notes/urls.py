@@ -1,12 +1,29 @@
 from django.urls import path
-from .views import (note_list, note_detail, note_create,
-                    note_update, note_delete, index)
+from .views import (note_list, note_list_all, note_list_by_tag, note_detail,
+                    note_create, note_update, note_autosave, note_delete,
+                    note_autocomplete, autosave_stats,
+                    attachment_upload, attachment_download, attachment_delete,
+                    note_sync, service_worker, metrics_view, index)
 
 urlpatterns = [
     path("", note_list, name="note_list"),
+    path("all/", note_list_all, name="note_list_all"),
+    path("tag/<slug:slug>/", note_list_by_tag, name="note_list_by_tag"),
     path("detail/<int:pk>/", note_detail, name="note_detail"),
     path("create/", note_create, name="note_create"),
     path("update/<int:pk>/", note_update, name="note_update"),
+    path("update/<int:pk>/autosave/", note_autosave, name="note_autosave"),
+    path("autosave/stats/", autosave_stats, name="autosave_stats"),
     path("delete/<int:pk>/", note_delete, name="note_delete"),
+    path("detail/<int:pk>/attachments/", attachment_upload,
+         name="attachment_upload"),
+    path("detail/<int:pk>/attachments/<int:attachment_pk>/<str:name>",
+         attachment_download, name="attachment_download"),
+    path("detail/<int:pk>/attachments/<int:attachment_pk>/delete/",
+         attachment_delete, name="attachment_delete"),
+    path("autocomplete/", note_autocomplete, name="note_autocomplete"),
+    path("sync/", note_sync, name="note_sync"),
+    path("sw.js", service_worker, name="service_worker"),
+    path("metrics", metrics_view, name="metrics"),
     path("index/", index, name="index"),
 ]
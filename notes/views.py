@@ -1,34 +1,157 @@
+import mimetypes
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Note
-from .forms import NoteForm
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
+from .models import ArchivedNote, Attachment, Note, UserTagCount
+from .forms import DraftForm, NoteForm
+from . import archive, attachments, autosave, metrics, search, sharding, streaming, sync
+from .throttling import write_limited
+
+
+def _user_notes(request, pk=None):
+    """
+    Returns the queryset of the user's notes, bound to the shard they are on
+    when notes are sharded and the shard is known.
+    :param request: HTTP request object.
+    :param pk: Primary key of the note to look up, if any.
+    :return: Queryset of notes.
+    """
+    return sharding.route(Note.objects.for_user(request.user), pk=pk)
 
 
+def _archived_notes(request):
+    """
+    Returns the queryset of the user's archived notes.
+    :param request: HTTP request object.
+    :return: Queryset of archived notes.
+    """
+    return ArchivedNote.objects.filter(user=request.user)
+
+
+def _include_archived(request):
+    """
+    Returns True if the request asks for archived notes too (``?archived=1``).
+    """
+    return request.GET.get("archived") == "1"
+
+
+@login_required
 def note_list(request):
     """
-    View to display a list of all notes.
+    View to display a list of the user's notes, newest first.
+
+    Archived notes are only listed with ``?archived=1``; they are merged in
+    by creation date. Without them, the offline client may redraw the list
+    from the notes it keeps in the browser.
     :param request: HTTP request object.
     :return: Rendered template with a list of notes.
     """
-    notes = Note.objects.all()
+    notes = sharding.fetch(
+        _user_notes(request).with_labels().defer("content_html")
+        .order_by("-created_at")
+    )
+    include_archived = _include_archived(request)
+    if include_archived:
+        archived = (_archived_notes(request).prefetch_related("category")
+                    .order_by("-created_at"))
+        notes = sharding.merge_sorted([notes, archived], ["-created_at"])
     # Creating a context dictionary to pass data
     context = {
         "notes": notes,
         "page_title": "List of Notes",
+        "include_archived": include_archived,
+        "offline_list": not include_archived,
+    }
+    return render(request, "notes/note_list.html", context)
+
+
+@login_required
+def note_list_all(request):
+    """
+    View to stream every one of the user's notes, newest first, as one page.
+
+    Meant for export-style pages with thousands of notes: the page is sent
+    as it is rendered, a chunk of notes at a time, instead of being built in
+    memory first.
+    :param request: HTTP request object.
+    :return: Streaming response with the rendered list.
+    """
+    notes = (_user_notes(request).with_labels().defer("content_html")
+             .order_by("-created_at"))
+    context = {"page_title": "All Notes"}
+    return streaming.stream_list(request, "notes/note_list.html", context,
+                                 notes, "notes/_note_item.html")
+
+
+@login_required
+def note_list_by_tag(request, slug):
+    """
+    View to display the user's notes carrying a tag, newest first.
+
+    Tags are shared by everyone who types the same name, so the page is only
+    found if the user has a note carrying the tag, going by the user's own
+    count; otherwise it would tell which tags other users have. The join
+    goes through the unique (tag, note) index, so only the rows of this tag
+    are read from the join table.
+    :param request: HTTP request object.
+    :param slug: Slug of the tag to filter by.
+    :return: Rendered template with the tagged notes.
+    """
+    # Tags and their counts are stored next to the notes, which may be on
+    # several shards.
+    counts = (UserTagCount.objects.select_related("tag")
+              .filter(user=request.user, tag__slug=slug, note_count__gt=0))
+    count = next(iter(sharding.fetch(sharding.route(counts, user=request.user))), None)
+    if count is None:
+        raise Http404("No tag matches the given query.")
+    tag = count.tag
+    notes = sharding.fetch(
+        _user_notes(request)
+        .filter(note_tags__tag__slug=slug)
+        .with_labels()
+        .defer("content_html")
+        .order_by("-created_at")
+    )
+    context = {
+        "notes": notes,
+        "page_title": f"Notes tagged {tag.name}",
+        "tag": tag,
     }
     return render(request, "notes/note_list.html", context)
 
 
+@login_required
 def note_detail(request, pk):
     """
     View to display details of a single note.
+
+    Notes that are no longer in the notes table are looked up in the archive.
     :param request: HTTP request object.
     :param pk: Primary key of the note to display.
-    :return: Rendered template with the note's details.
+    :return: Rendered template with the note's details and a list of
+        near-duplicate notes.
     """
-    note = get_object_or_404(Note, pk=pk)
-    return render(request, "notes/note_detail.html", {"note": note})
+    note = _user_notes(request, pk).with_labels().filter(pk=pk).first()
+    if note is None:
+        archived = get_object_or_404(_archived_notes(request), pk=pk)
+        context = {"note": archived, "archived": True, "similar_notes": []}
+        return render(request, "notes/note_detail.html", context)
+    context = {
+        "note": note,
+        "similar_notes": note.similar_notes(),
+    }
+    return render(request, "notes/note_detail.html", context)
 
 
+@login_required
+@write_limited
 def note_create(request):
     """
     View to create a new note.
@@ -38,7 +161,10 @@ def note_create(request):
     if request.method == "POST":
         form = NoteForm(request.POST)
         if form.is_valid():
-            form.save()
+            note = form.save(commit=False)
+            note.user = request.user
+            note.save()
+            form.save_m2m()
             return redirect("note_list")
     else:
         form = NoteForm()
@@ -46,42 +172,267 @@ def note_create(request):
     return render(request, "notes/note_form.html", {"form": form})
 
 
+@login_required
+@write_limited
 def note_update(request, pk):
     """
     View to update an existing note.
+
+    Archived notes are edited from their archived copy, and moved back into
+    the notes table when the edit is saved; merely opening the form leaves
+    them archived. If the editor autosaved a draft that has not been written
+    to the note yet, the form starts from the draft.
     :param request: HTTP request object.
     :param pk: Primary key of the note to update.
     :return: Rendered template with a form to update the note.
     """
-    note = get_object_or_404(Note, pk=pk)
+    note = _user_notes(request, pk).filter(pk=pk).first()
+    archived = None
+    if note is None:
+        archived = get_object_or_404(_archived_notes(request), pk=pk)
+        # Unsaved stand-in for the form, which restore() replaces.
+        note = Note(pk=archived.pk, user_id=archived.user_id,
+                    title=archived.title, content=archived.content,
+                    category_id=archived.category_id)
 
+    draft = None
     if request.method == "POST":
         form = NoteForm(request.POST, instance=note)
         if form.is_valid():
+            if archived is not None:
+                form = NoteForm(request.POST, instance=archive.restore(archived))
+                form.is_valid()
             note = form.save(commit=False)
             note.save()
+            form.save_m2m()
+            autosave.drafts.discard(note.pk)
             return redirect(
                 "note_list"
             )  # Redirect to the list view after successful update
+    elif archived is not None:
+        form = NoteForm(instance=note, initial={
+            "tags": ", ".join(sorted(archived.tag_list())),
+        })
     else:
+        draft = autosave.drafts.recover(note)
+        initial = {"title": draft.title, "content": draft.content} if draft else None
         form = NoteForm(
-            instance=note
+            instance=note, initial=initial
         )  # Pre-populate the form with the current note's data
 
-    return render(request, "notes/note_form.html", {"form": form})
+    context = {"form": form, "draft": draft, "archived": archived is not None}
+    return render(request, "notes/note_form.html", context)
+
+
+@require_POST
+@login_required
+@write_limited(shed=False, scope="autosave")
+def note_autosave(request, pk):
+    """
+    View receiving the editor's periodic autosaves of a note.
+
+    The draft is only buffered (see notes.autosave); it reaches the note with
+    the next batched flush, or when the form is saved. Autosaves are rate
+    limited apart from other changes, so an open editor does not use up the
+    client's allowance for saving notes.
+    :param request: HTTP request object with ``title`` and ``content``.
+    :param pk: Primary key of the note being edited.
+    :return: JSON response; 202 once the draft is buffered, 400 with the
+        form errors if it is invalid.
+    """
+    note = get_object_or_404(_user_notes(request, pk).only("pk", "user_id"), pk=pk)
+    form = DraftForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    draft = autosave.drafts.save(note, form.cleaned_data["title"],
+                                 form.cleaned_data["content"])
+    return JsonResponse({"saved_at": draft.saved_at.isoformat()}, status=202)
+
+
+@user_passes_test(lambda user: user.is_staff)
+def autosave_stats(request):
+    """
+    View reporting this process's autosave counters, including the writes
+    avoided by coalescing drafts. Staff only.
+    :param request: HTTP request object.
+    :return: JSON response with the counters.
+    """
+    return JsonResponse(autosave.drafts.stats())
 
 
+@login_required
+@write_limited(methods=None)
 def note_delete(request, pk):
     """
-    View to delete a note.
+    View to delete a note, whether it is archived or not.
     :param request: HTTP request object.
     :param pk: Primary key of the note to delete.
     :return: Redirect to the list view after deletion.
     """
-    note = get_object_or_404(Note, pk=pk)
+    note = _user_notes(request, pk).filter(pk=pk).first()
+    if note is None:
+        note = get_object_or_404(_archived_notes(request), pk=pk)
+    autosave.drafts.discard(note.pk)
+    sync.forget([(note.pk, note.user_id)])
     note.delete()
     return redirect("note_list")  # Redirect to the list view after deletion
 
 
+def _user_attachment(request, pk, attachment_pk):
+    """
+    Returns an attachment of one of the user's notes, or raises Http404.
+    :param request: HTTP request object.
+    :param pk: Primary key of the note.
+    :param attachment_pk: Primary key of the attachment.
+    :return: The attachment.
+    """
+    queryset = sharding.route(
+        Attachment.objects.filter(note__user=request.user),
+        user=request.user, pk=pk,
+    )
+    return get_object_or_404(queryset, pk=attachment_pk, note_id=pk)
+
+
+@csrf_exempt
+@login_required
+@write_limited
+def attachment_upload(request, pk):
+    """
+    View to attach uploaded files to a note.
+
+    Files are streamed to disk and hashed as they arrive, so the upload
+    handler has to be installed before the CSRF check reads the body; the
+    check is made by _attachment_upload() instead.
+    :param request: HTTP request object with one or more ``file`` fields.
+    :param pk: Primary key of the note.
+    :return: Redirect to the note's detail page.
+    """
+    request.upload_handlers = [attachments.HashingUploadHandler(request)]
+    return _attachment_upload(request, pk)
+
+
+@csrf_protect
+@require_POST
+def _attachment_upload(request, pk):
+    note = get_object_or_404(_user_notes(request, pk).only("pk"), pk=pk)
+    files = request.FILES.getlist("file")
+    if not files:
+        if request.upload_handlers[0].too_large:
+            return HttpResponse("The file is too large.", status=413)
+        return HttpResponse("No file was uploaded.", status=400)
+    for uploaded in files:
+        attachments.store(uploaded)
+        content_type, _ = mimetypes.guess_type(uploaded.name)
+        note.attachments.create(
+            name=uploaded.name[:255], size=uploaded.size, sha256=uploaded.sha256,
+            content_type=content_type or "application/octet-stream",
+        )
+    return redirect(note)
+
+
+@login_required
+def attachment_download(request, pk, attachment_pk, name):
+    """
+    View to download an attachment, in whole or in part.
+    :param request: HTTP request object; ``Range`` and conditional headers
+        are honoured.
+    :param pk: Primary key of the note.
+    :param attachment_pk: Primary key of the attachment.
+    :param name: File name, only there for the browser's sake.
+    :return: Streaming file response.
+    """
+    return attachments.serve(request, _user_attachment(request, pk, attachment_pk))
+
+
+@require_POST
+@login_required
+@write_limited
+def attachment_delete(request, pk, attachment_pk):
+    """
+    View to remove an attachment from a note.
+
+    The stored file stays until prune_attachments finds it unused.
+    :param request: HTTP request object.
+    :param pk: Primary key of the note.
+    :param attachment_pk: Primary key of the attachment.
+    :return: Redirect to the note's detail page.
+    """
+    _user_attachment(request, pk, attachment_pk).delete()
+    return redirect("note_detail", pk=pk)
+
+
+@login_required
+def note_autocomplete(request):
+    """
+    View to suggest note titles while the user types.
+    :param request: HTTP request object; the text typed so far is read from
+        the ``q`` query parameter, and ``archived=1`` searches archived notes
+        too.
+    :return: JSON response with up to 10 matching notes.
+    """
+    matches = search.autocomplete(request.GET.get("q", ""), user=request.user,
+                                  include_archived=_include_archived(request))
+    results = [
+        {"id": pk, "title": title, "url": reverse("note_detail", args=[pk])}
+        for pk, title in matches
+    ]
+    return JsonResponse({"results": results})
+
+
+def note_sync(request):
+    """
+    View sending the offline client the changes to the user's notes since
+    its cursor.
+
+    Unlike the pages it answers 401 rather than redirecting to the login
+    page, so the client can tell it is signed out.
+    :param request: HTTP request object; the ``cursor`` query parameter is
+        the one returned by the previous sync, empty for a first sync.
+    :return: JSON response with the changes (see notes.sync.changes).
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Not signed in."}, status=401)
+    try:
+        cursor = sync.decode(request.GET.get("cursor", ""))
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+    changes = sync.changes(request.user, cursor)
+    return JsonResponse({"user": request.user.pk, **changes})
+
+
+def service_worker(request):
+    """
+    View serving the service worker of the offline client.
+
+    It is served from the root of the site, as a service worker only
+    controls pages under the path it is served from.
+    :param request: HTTP request object.
+    :return: The script.
+    """
+    response = render(request, "notes/sw.js", content_type="text/javascript")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def metrics_view(request):
+    """
+    View serving the app's metrics in the Prometheus text format.
+
+    Open to staff, to requests carrying NOTES_METRICS_TOKEN as a bearer
+    token, and to the addresses in NOTES_METRICS_ALLOWED_IPS. Behind a
+    reverse proxy every request comes from the proxy's address, so that list
+    is only safe when the scraper connects to the app server directly.
+    :param request: HTTP request object.
+    :return: Plain text response with every metric.
+    """
+    token = getattr(settings, "NOTES_METRICS_TOKEN", None)
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    bearer = bool(token) and scheme.lower() == "bearer" and constant_time_compare(credentials, token)
+    allowed = getattr(settings, "NOTES_METRICS_ALLOWED_IPS", [])
+    if not (bearer or request.user.is_staff or request.META.get("REMOTE_ADDR") in allowed):
+        raise PermissionDenied
+    return HttpResponse(metrics.export(), content_type=metrics.CONTENT_TYPE)
+
+
 def index(request):
     return render(request, "base.html")
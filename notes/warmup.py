@@ -0,0 +1,298 @@
+"""
+Cache warm-up after a deploy or when a worker boots.
+
+What is warmed lives in two places. Open database connections and compiled
+templates belong to the process doing the warm-up. The HTML cached on each
+note, and SQLite's pages in the operating system's page cache, are shared by
+every worker on the machine.
+
+So ``manage.py warm_caches``, which runs in a process of its own, only helps
+the workers through the shared part. To warm the workers themselves, either
+set NOTES_WARM_ON_STARTUP, so each worker warms itself as it boots, or pass
+the command the URLs of the running servers with ``--url``: the pages are
+then requested over HTTP and rendered by whichever worker takes each
+request.
+"""
+
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from importlib import import_module
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import resolve, reverse
+
+from . import sharding
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_N = 20
+DEFAULT_WORKERS = 4
+DEFAULT_BUDGET = 10.0
+
+
+def open_connections():
+    """
+    Opens a connection to every configured database in the calling thread.
+
+    The first query on a fresh SQLite connection pays for opening the file and
+    running the backend's connection setup, so doing it up front keeps that
+    cost off the first real request.
+    :return: List of database aliases that were connected.
+    """
+    opened = []
+    for alias in connections:
+        connections[alias].ensure_connection()
+        opened.append(alias)
+    return opened
+
+
+def template_names():
+    """
+    Lists the templates shipped with the notes app.
+
+    Admin templates are left out when the admin is not installed, as on
+    serving nodes: they load the admin's tag libraries and cannot compile.
+    :return: Template names relative to the app's templates directory.
+    """
+    root = Path(apps.get_app_config("notes").path) / "templates"
+    names = (path.relative_to(root) for path in root.rglob("*.html"))
+    if not apps.is_installed("django.contrib.admin"):
+        names = (name for name in names if name.parts[0] != "admin")
+    return sorted(name.as_posix() for name in names)
+
+
+def precompile_templates():
+    """
+    Loads and compiles every notes template.
+
+    With the cached template loader the compiled templates are kept for the
+    lifetime of the process, so later renders skip parsing entirely.
+    :return: List of template names that were compiled.
+    """
+    compiled = []
+    for name in template_names():
+        get_template(name)
+        compiled.append(name)
+    return compiled
+
+
+def hot_paths(top_n=DEFAULT_TOP_N):
+    """
+    Picks the pages worth pre-rendering.
+
+    There is no access log to rank notes by, so the most recently modified
+    notes stand in for the most recently viewed ones. Pages are per-user, so
+    each one is paired with the owner it is rendered for: every note's detail
+    page, plus the note list of each of their owners.
+    :param top_n: Number of note detail pages to include.
+    :return: List of (path, user id) pairs, note lists first.
+    """
+    from .models import Note
+
+    hot = sharding.fetch(
+        Note.objects.filter(user__isnull=False)
+        .only("user_id", "modified_at")
+        .order_by("-modified_at")[:top_n]
+    )
+    details = [(reverse("note_detail", args=[note.pk]), note.user_id)
+               for note in hot]
+    owners = dict.fromkeys(user_id for _, user_id in details)
+    lists = [(reverse("note_list"), user_id) for user_id in owners]
+    return lists + details
+
+
+def render_path(path, user_id):
+    """
+    Renders a single page in-process, without going through the network.
+    :param path: URL path to render.
+    :param user_id: Primary key of the user to render the page for.
+    :return: Tuple of the path and the response status code.
+    """
+    from django.contrib.auth import get_user_model
+    from django.test import RequestFactory
+
+    try:
+        request = RequestFactory().get(path)
+        request.user = get_user_model().objects.get(pk=user_id)
+        match = resolve(path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        return path, response.status_code
+    finally:
+        connections.close_all()
+
+
+def sign_in(user_ids):
+    """
+    Opens a session for each user, for requests sent to a running server.
+    :param user_ids: Primary keys of the users.
+    :return: Dictionary of session keys by user id.
+    """
+    from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                     SESSION_KEY, get_user_model)
+
+    engine = import_module(settings.SESSION_ENGINE)
+    sessions = {}
+    for user in get_user_model().objects.filter(pk__in=user_ids):
+        session = engine.SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        sessions[user.pk] = session.session_key
+    return sessions
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """
+    Reports redirects, such as to the login page, instead of following them.
+    """
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+OPENER = urllib.request.build_opener(NoRedirect)
+
+
+def request_path(url, session_key):
+    """
+    Requests a single page from a running server.
+    :param url: Full URL of the page.
+    :param session_key: Session to send the request in.
+    :return: Tuple of the URL and the response status code.
+    """
+    request = urllib.request.Request(url, headers={
+        "Cookie": f"{settings.SESSION_COOKIE_NAME}={session_key}",
+    })
+    try:
+        with OPENER.open(request, timeout=30) as response:
+            response.read()
+            return url, response.status
+    except urllib.error.HTTPError as error:
+        return url, error.code
+
+
+def warm_caches(top_n=DEFAULT_TOP_N, workers=DEFAULT_WORKERS,
+                budget=DEFAULT_BUDGET, urls=()):
+    """
+    Warms database connections, compiled templates and the hottest pages.
+
+    Pages are rendered in parallel by daemon threads taking them from a
+    queue. When the time budget runs out, pages not yet started are skipped
+    and the call returns without waiting for the ones still rendering, and
+    as the threads are daemons they do not keep the process alive either,
+    so a slow database can never hold up a deploy.
+    :param top_n: Number of note detail pages to pre-render.
+    :param workers: Number of rendering threads.
+    :param budget: Time budget in seconds for the whole warm-up.
+    :param urls: Base URLs of running servers. When given, the pages are
+        requested from each of them, signed in as their owners, instead of
+        rendered in this process, and nothing is warmed locally.
+    :return: Dictionary summarising what was warmed. Pages are keyed by
+        (path, user id), with the path prefixed by the base URL when pages
+        are requested over HTTP: "rendered" maps them to their status code,
+        "skipped" lists those not started or that failed, and "unfinished"
+        those still rendering when the budget ran out.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    report = {
+        "connections": [] if urls else open_connections(),
+        "templates": [] if urls else precompile_templates(),
+        "rendered": {},
+        "skipped": [],
+        "unfinished": [],
+    }
+    paths = hot_paths(top_n)
+    sessions = {}
+    if urls:
+        sessions = sign_in({user_id for _, user_id in paths})
+        paths = [(url.rstrip("/") + path, user_id)
+                 for url in urls for path, user_id in paths]
+
+    pending = deque(paths)
+    rendered, failed, running = {}, [], set()
+    lock = threading.Lock()
+    closed = False
+
+    def work():
+        while True:
+            with lock:
+                if closed or not pending or time.monotonic() >= deadline:
+                    return
+                page = pending.popleft()
+                running.add(page)
+            try:
+                if urls:
+                    status = request_path(page[0], sessions[page[1]])[1]
+                else:
+                    status = render_path(*page)[1]
+            except Exception:
+                logger.exception("Failed to pre-render %s for user %s", *page)
+                status = None
+            with lock:
+                running.discard(page)
+                if status is None:
+                    failed.append(page)
+                else:
+                    rendered[page] = status
+
+    threads = [threading.Thread(target=work, name="warm-caches", daemon=True)
+               for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+    # Pages still rendering are left to finish, or not, on their own.
+    with lock:
+        closed = True
+        report["rendered"] = dict(rendered)
+        report["skipped"] = failed + list(pending)
+        report["unfinished"] = list(running)
+
+    if sessions:
+        engine = import_module(settings.SESSION_ENGINE)
+        for session_key in sessions.values():
+            engine.SessionStore(session_key).delete()
+    report["elapsed"] = time.monotonic() - started
+    return report
+
+
+def warm_in_background():
+    """
+    Runs warm_caches() on a daemon thread using the NOTES_WARMUP_* settings.
+
+    Django discourages database access while apps are still loading, so the
+    startup hook hands the work off instead of doing it inside ready().
+    :return: The started thread.
+    """
+    def run():
+        try:
+            report = warm_caches(
+                top_n=getattr(settings, "NOTES_WARMUP_TOP_N", DEFAULT_TOP_N),
+                workers=getattr(settings, "NOTES_WARMUP_WORKERS",
+                                DEFAULT_WORKERS),
+                budget=getattr(settings, "NOTES_WARMUP_BUDGET",
+                               DEFAULT_BUDGET),
+            )
+            logger.info("Warmed %d pages in %.2fs (%d skipped, %d unfinished)",
+                        len(report["rendered"]), report["elapsed"],
+                        len(report["skipped"]), len(report["unfinished"]))
+        except Exception:
+            logger.exception("Cache warm-up failed")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name="warm-caches", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,19 @@
+#!/bin/sh
+# Runs the test suite, then the sharded-storage tests with notes spread over
+# two shards, by owner and by note id.
+#
+# The rest of the suite sets up its data in the default database, which is
+# where notes live without sharding, so under NOTES_SHARD_COUNT only the tests
+# in notes/tests/test_sharding.py apply.
+#
+# Usage:
+#     ./run_tests.sh
+#     ./run_tests.sh notes.tests.test_views
+set -e
+cd "$(dirname "$0")"
+python manage.py test "$@"
+for key in user id; do
+    echo "Sharded tests, NOTES_SHARD_KEY=$key"
+    NOTES_SHARD_COUNT=2 NOTES_SHARD_KEY=$key NOTES_NODE_ID=0 \
+        python manage.py test notes.tests.test_sharding
+done
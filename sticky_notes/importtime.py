@@ -0,0 +1,120 @@
+"""
+Startup import profile for the sticky_notes project.
+
+Runs a fresh interpreter with ``python -X importtime``, imports the given
+entry point (the WSGI application by default) and turns the raw timings the
+interpreter writes to stderr into a short report.
+
+Usage::
+
+    python -m sticky_notes.importtime
+    python -m sticky_notes.importtime --target sticky_notes.asgi --top 40
+    python -m sticky_notes.importtime --settings sticky_notes.settings_serving
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+ImportRecord = namedtuple("ImportRecord", "module self_us cumulative_us depth")
+
+_LINE = re.compile(
+    r"^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|"
+    r"(?P<indent>\s+)(?P<module>\S+)\s*$"
+)
+
+
+def parse(output):
+    """
+    Parses the stderr output of ``python -X importtime``.
+    :param output: Text written by the interpreter.
+    :return: List of ImportRecord, in the order the interpreter reported them.
+    """
+    records = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        records.append(ImportRecord(
+            module=match["module"],
+            self_us=int(match["self"]),
+            cumulative_us=int(match["cumulative"]),
+            depth=(len(match["indent"]) - 1) // 2,
+        ))
+    return records
+
+
+def profile(target="sticky_notes.wsgi", settings=None):
+    """
+    Imports ``target`` in a child interpreter with import timing enabled.
+    :param target: Dotted module path to import.
+    :param settings: Optional DJANGO_SETTINGS_MODULE for the child.
+    :return: List of ImportRecord for the child's imports.
+    """
+    env = dict(os.environ)
+    if settings:
+        env["DJANGO_SETTINGS_MODULE"] = settings
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return parse(completed.stderr)
+
+
+def packages(records):
+    """
+    Sums self time per top-level package.
+    :param records: List of ImportRecord.
+    :return: List of (package, microseconds) pairs, slowest first.
+    """
+    totals = {}
+    for record in records:
+        package = record.module.split(".")[0]
+        totals[package] = totals.get(package, 0) + record.self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def report(records, top=25):
+    """
+    Formats a human readable report of the slowest imports.
+    :param records: List of ImportRecord.
+    :param top: Number of rows per section.
+    :return: The report as a string.
+    """
+    total = sum(record.self_us for record in records)
+    lines = [f"{len(records)} modules imported in {total / 1000:.1f} ms", ""]
+
+    lines.append(f"Slowest packages (self time, top {top}):")
+    for package, micros in packages(records)[:top]:
+        lines.append(f"  {micros / 1000:9.1f} ms  {package}")
+
+    lines.append("")
+    lines.append(f"Slowest modules (cumulative time, top {top}):")
+    slowest = sorted(records, key=lambda record: record.cumulative_us,
+                     reverse=True)
+    for record in slowest[:top]:
+        lines.append(f"  {record.cumulative_us / 1000:9.1f} ms  "
+                     f"{record.module}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--target", default="sticky_notes.wsgi",
+                        help="Module to import (default: sticky_notes.wsgi).")
+    parser.add_argument("--settings", default=None,
+                        help="DJANGO_SETTINGS_MODULE for the child process.")
+    parser.add_argument("--top", type=int, default=25,
+                        help="Rows to show per section.")
+    args = parser.parse_args(argv)
+    print(report(profile(args.target, args.settings), top=args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "notes.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -80,6 +82,8 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = []
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -124,3 +128,131 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / "static"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Authentication
+# Notes belong to users, so every notes view requires a login.
+
+LOGIN_URL = "login"
+LOGIN_REDIRECT_URL = "note_list"
+LOGOUT_REDIRECT_URL = "login"
+
+# Cache warming
+# Set NOTES_WARM_ON_STARTUP to pre-render hot pages when a worker boots.
+# `manage.py warm_caches` runs in a process of its own and only warms what the
+# workers share, unless given the servers' URLs with --url.
+
+NOTES_WARM_ON_STARTUP = False
+NOTES_WARMUP_TOP_N = 20
+NOTES_WARMUP_WORKERS = 4
+NOTES_WARMUP_BUDGET = 10.0
+
+# Markdown
+# Note content is rendered as Markdown when NOTES_MARKDOWN is on and the
+# optional `markdown` and `nh3` packages are installed, and as plain text
+# otherwise. Run `manage.py rerender_notes` after changing either.
+
+NOTES_MARKDOWN = True
+
+# Attachments
+# Files attached to notes are stored once per distinct content, named by their
+# SHA-256, under NOTES_ATTACHMENT_ROOT. Uploads larger than
+# NOTES_ATTACHMENT_MAX_SIZE bytes are refused. Files no note refers to any
+# more are removed by `manage.py prune_attachments`.
+
+MEDIA_ROOT = BASE_DIR / "media"
+NOTES_ATTACHMENT_ROOT = MEDIA_ROOT / "attachments"
+NOTES_ATTACHMENT_MAX_SIZE = 50 * 1024 * 1024
+
+# Metrics
+# /metrics serves Prometheus metrics to staff and to scrapers sending
+# "Authorization: Bearer <NOTES_METRICS_TOKEN>". NOTES_METRICS_ALLOWED_IPS
+# also lets addresses in without a token; behind a reverse proxy every request
+# comes from the proxy, so only list addresses that reach the app server
+# directly. Set NOTES_METRICS_DIR to a directory of its own to add up the
+# metrics of every worker process through memory-mapped files there; empty it
+# when the server restarts. Without it, each process reports only its own
+# requests. Table row counts are cached for NOTES_METRICS_ROWS_TTL seconds.
+
+NOTES_METRICS_DIR = os.environ.get("NOTES_METRICS_DIR")
+NOTES_METRICS_TOKEN = os.environ.get("NOTES_METRICS_TOKEN")
+NOTES_METRICS_ALLOWED_IPS = []
+NOTES_METRICS_ROWS_TTL = 60
+
+# Rate limiting
+# Every client may make NOTES_WRITE_BURST changes in a row, then
+# NOTES_WRITE_RATE per second; more get 429. Buckets are kept per process by
+# notes.throttling.MemoryBackend, or across processes by
+# notes.throttling.CacheBackend with a shared cache. Writes also get 503 while
+# a process has NOTES_SHED_MAX_IN_FLIGHT writes running, or while they take
+# over NOTES_SHED_LATENCY seconds on average.
+
+NOTES_RATE_LIMIT_BACKEND = "notes.throttling.MemoryBackend"
+NOTES_WRITE_RATE = 1.0
+NOTES_WRITE_BURST = 20
+NOTES_SHED_MAX_IN_FLIGHT = 8
+NOTES_SHED_LATENCY = 1.0
+
+# Autosave
+# The note editor autosaves drafts; they are buffered per process and written
+# to the notes every NOTES_AUTOSAVE_INTERVAL seconds in one batch, so rapid
+# edits of a note cost one write. Drafts are also kept in the cache for
+# NOTES_AUTOSAVE_DRAFT_TTL seconds, so they can be recovered if not written.
+
+NOTES_AUTOSAVE_INTERVAL = 5.0
+NOTES_AUTOSAVE_DRAFT_TTL = 24 * 60 * 60
+
+# Offline sync
+# The offline client syncs the notes it keeps in the browser through /sync/,
+# NOTES_SYNC_PAGE_SIZE changes at a time. Changes of the last
+# NOTES_SYNC_SETTLE seconds are sent again on the next sync, as they may still
+# be committing; keep it above NOTES_AUTOSAVE_INTERVAL. `manage.py
+# prune_tombstones` forgets deletions older than NOTES_SYNC_RETENTION seconds;
+# clients that have not synced since then download all their notes again.
+
+NOTES_SYNC_PAGE_SIZE = 200
+NOTES_SYNC_SETTLE = 30
+NOTES_SYNC_RETENTION = 30 * 24 * 60 * 60
+
+# Streaming
+# The /all/ page streams the note list, rendering and sending this many notes
+# at a time.
+
+NOTES_STREAM_CHUNK_SIZE = 200
+
+# Archival
+# `manage.py archive_notes` moves notes not modified for
+# NOTES_ARCHIVE_AFTER_DAYS days out of the notes table into ArchivedNote.
+# Set NOTES_ARCHIVE_FILE to keep archived notes in a SQLite file of their own
+# instead of db.sqlite3; run `manage.py migrate --database notes_archive`.
+
+NOTES_ARCHIVE_AFTER_DAYS = 365
+
+if os.environ.get("NOTES_ARCHIVE_FILE"):
+    DATABASES["notes_archive"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / os.environ["NOTES_ARCHIVE_FILE"],
+    }
+    DATABASE_ROUTERS.append("notes.archive.ArchiveRouter")
+
+# Sharding
+# Set NOTES_SHARD_COUNT to spread notes over that many SQLite databases, by
+# owner (NOTES_SHARD_KEY = "user") or by note id ("id"). Users, categories and
+# everything else stay in the default database. After changing the number of
+# shards run `manage.py migrate --database notes_shard_N` for each new shard,
+# then `manage.py rebalance_shards`. Creating notes with sharding on requires
+# NOTES_NODE_ID (0-1023), a different one for every process that creates
+# notes (with several workers per machine, one per worker), so the note ids
+# it generates cannot collide with other processes'.
+
+NOTES_SHARD_COUNT = int(os.environ.get("NOTES_SHARD_COUNT", "0"))
+NOTES_SHARD_KEY = os.environ.get("NOTES_SHARD_KEY", "user")
+NOTES_NODE_ID = int(os.environ["NOTES_NODE_ID"]) if "NOTES_NODE_ID" in os.environ else None
+NOTES_SHARD_WORKERS = None
+
+for _shard in range(NOTES_SHARD_COUNT):
+    DATABASES[f"notes_shard_{_shard}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"notes_shard_{_shard}.sqlite3",
+    }
+if NOTES_SHARD_COUNT:
+    DATABASE_ROUTERS.append("notes.sharding.ShardRouter")
@@ -0,0 +1,28 @@
+"""
+Settings for serving nodes.
+
+Extends the default settings but leaves out apps that only matter on a
+developer machine or an operator's box, so workers boot faster and import
+less. Point DJANGO_SETTINGS_MODULE at ``sticky_notes.settings_serving`` on
+nodes that only serve the notes app.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS
+
+# Apps that are not needed to serve requests. Dropping the admin also skips
+# admin autodiscovery, which imports every app's admin module at startup.
+DEV_ONLY_APPS = [
+    "django.contrib.admin",
+    "django_extensions",
+]
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in DEV_ONLY_APPS]
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get(
+    "DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1"
+).split(",")